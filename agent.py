@@ -1,48 +1,58 @@
 from agno.agent import Agent
 from agno.playground import Playground
-from agno.models.openai import OpenAIChat
-from agno.models.google.gemini import Gemini
 from agno.models.anthropic import Claude
 from agno.models.deepseek import DeepSeek
 from knowledge_base import knowledge_base
+from kb_ingest import ingest
 from dotenv import load_dotenv
 import os
 import sys
-from agno.tools.csv_toolkit import CsvTools
 from pathlib import Path
 import uvicorn
 from agno.playground import Playground 
-from agno.memory.agent import AgentMemory
-from agno.memory.db.postgres import PgMemoryDb
-from agno.storage.postgres import PostgresStorage
 from agno.tools.duckduckgo import DuckDuckGoTools
 from fastapi.middleware.cors import CORSMiddleware
+from screener import ScreenerTools, screener_router
+from prompt_builder import CSV_ANALYST_INSTRUCTIONS
+from response_cache import ResponseCacheMiddleware
+from dataset import DatasetCsvTools, DatasetVersionMiddleware, dataset_router, start_dataset_watcher
+from db import CachedPostgresStorage, PooledPgMemoryDb, db_router, get_engine
+from model_router import models_router, routed_model
+from precompute import precompute_router
+from search_cache import instrument_agents, search_cache_router
+from session_memory import BoundedAgentMemory, memory_router
+from tracing import metrics_router
 
 load_dotenv()
 
 # Get database URL
 db_url = os.getenv("DATABASE_URL")
+# One pooled engine for every agent's memory and session tables
+db_engine = get_engine(db_url)
 
-# ✅ Load the knowledge base with proper error handling
-try:
-    print("🔄 Loading knowledge base...")
-    knowledge_base.load(recreate=False)
-    print("✅ Knowledge base loaded successfully")
-except Exception as e:
-    print(f"❌ Failed to load knowledge base: {e}")
-    print("This might be due to:")
-    print("1. Database connection issues")
-    print("2. Missing pgvector extension")
-    print("3. Insufficient database permissions")
-    print("4. CSV file not found or corrupted")
-    sys.exit(1)
+# Vectors are synced offline by `python kb_ingest.py`; opt in to an incremental sync at startup
+if os.getenv("KB_INGEST_ON_START", "false").lower() == "true":
+    try:
+        print("🔄 Syncing knowledge base...")
+        stats = ingest(knowledge_base)
+        print(f"✅ Knowledge base synced: {stats.added} added, {stats.changed} changed, {stats.removed} removed")
+    except Exception as e:
+        print(f"❌ Failed to sync knowledge base: {e}")
+        print("This might be due to:")
+        print("1. Database connection issues")
+        print("2. Missing pgvector extension")
+        print("3. Insufficient database permissions")
+        print("4. CSV file not found or corrupted")
+        sys.exit(1)
 
 # Configure shared memory and storage settings
+# History is capped at MEMORY_HISTORY_TOKENS with a rolling summary; summaries and
+# user memories are updated by a background thread after the response is sent
 def create_memory(agent_name):
-    return AgentMemory(
-        db=PgMemoryDb(
+    return BoundedAgentMemory(
+        db=PooledPgMemoryDb(
             table_name=f"{agent_name}_memory",
-            db_url=db_url,
+            db_engine=db_engine,
         ),
         create_user_memories=True,
         update_user_memories_after_run=True,
@@ -51,9 +61,9 @@ def create_memory(agent_name):
     )
 
 def create_storage(agent_name):
-    return PostgresStorage(
+    return CachedPostgresStorage(
         table_name=f"{agent_name}_sessions", 
-        db_url=db_url, 
+        db_engine=db_engine, 
         auto_upgrade_schema=True
     )
 
@@ -83,7 +93,8 @@ claude_agent = Agent(
 deepseek_4o_agent = Agent(
     name="DeepSeek OpenAI",
     agent_id="deepseek-kb-agent",
-    model=OpenAIChat(id="gpt-4o"),
+    # Chat with web and knowledge search tools: fail over, but never run the tool loop twice in a hedge
+    model=routed_model("fast", prefer="gpt-4o", hedge=False),
     reasoning_model=DeepSeek(id="deepseek-reasoner"),
     role="Expert financial assistant powered by DeepSeek with access to knowledge base and web search capabilities",
     instructions=[
@@ -100,8 +111,6 @@ deepseek_4o_agent = Agent(
     add_history_to_messages=True,
     num_history_responses=5,
     read_chat_history=True,
-    exponential_backoff=True,
-    delay_between_retries=5,
 )
 
 pure_deepseek_agent = Agent(
@@ -128,48 +137,15 @@ pure_deepseek_agent = Agent(
 new_csvQueryagent = Agent(
     name="CSV Financial Analyst",
     agent_id="csv-financial-agent",
-    model=DeepSeek(id="deepseek-reasoner"),
-    tools=[CsvTools(csvs=["query_results.csv"])],
+    model=routed_model("reasoning"),
+    tools=[DatasetCsvTools(), ScreenerTools()],
     markdown=True,
-    instructions=[
-        # Data accuracy and validation
-        "CRITICAL: Only use data that is actually present in the CSV file",
-        "Never make assumptions or use external knowledge about companies",
-        "If data is not available in the CSV, clearly state 'Data not available'",
-        
-        # Financial analysis workflow
-        "FINANCIAL ANALYSIS WORKFLOW:",
-        "1. First, examine available columns using get_columns()",
-        "2. Query the specific company data from the CSV",
-        "3. Present key financial metrics clearly",
-        "4. Provide analysis based only on available data",
-        
-        # Query best practices
-        "CSV QUERY GUIDELINES:",
-        "- Use exact column names wrapped in double quotes",
-        "- Try exact company name match first",
-        "- If no results, try partial matching with LIKE operator",
-        "- Always verify data exists before analyzing",
-        
-        # Financial analysis focus
-        "FINANCIAL ANALYSIS REQUIREMENTS:",
-        "- Present key financial ratios and metrics",
-        "- Compare performance indicators when multiple periods available",
-        "- Highlight significant financial trends or patterns",
-        "- Provide clear interpretation of financial health",
-        "- Use proper financial terminology",
-        
-        # Data presentation
-        "PRESENTATION STANDARDS:",
-        "- Show actual values from CSV without modification",
-        "- Use clear formatting for financial figures",
-        "- Organize analysis in logical sections (Revenue, Profitability, etc.)",
-        "- Provide context for financial metrics when possible",
-        "- State data source and time period clearly"
-    ],
+    instructions=CSV_ANALYST_INSTRUCTIONS,
     description="Financial analyst specializing in CSV-based financial data analysis"
 )
 
+instrument_agents([claude_agent, deepseek_4o_agent, pure_deepseek_agent, new_csvQueryagent])
+
 # Create playground with all agents
 playground = Playground(
     agents=[claude_agent, deepseek_4o_agent, pure_deepseek_agent, new_csvQueryagent],
@@ -181,6 +157,24 @@ playground = Playground(
 # Get the app with proper configuration
 app = playground.get_app(use_async=True, prefix="/v1")
 
+# Vectorised screens over the whole universe, next to the playground routes
+app.include_router(screener_router, prefix="/v1")
+app.include_router(db_router, prefix="/v1")
+app.include_router(metrics_router, prefix="/v1")
+app.include_router(models_router, prefix="/v1")
+app.include_router(precompute_router, prefix="/v1")
+app.include_router(memory_router, prefix="/v1")
+app.include_router(search_cache_router, prefix="/v1")
+
+# New query_results snapshots are published and swapped in without a restart
+app.include_router(dataset_router, prefix="/v1")
+app.add_event_handler("startup", start_dataset_watcher)
+
+# Repeated first-turn questions are replayed from the response cache
+app.add_middleware(ResponseCacheMiddleware, agents=playground.agents)
+# Each request runs against the dataset version current when it arrived, even across a swap
+app.add_middleware(DatasetVersionMiddleware)
+
 # For production deployment
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 7777))
@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Union
+from agno.run.response import RunResponse
+from agno.utils.log import logger
+from models import StockData, StockRecommendation
+from provider_limits import ProviderLimits
+from workflow import StockAnalysisWorkflow, analysis_agent, csv_data_agent, format_report, meta_prompt_agent
+
+REPORTS_DIR = Path(os.getenv("REPORTS_DIR", "reports"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+
+
+def batch_query(item: Union[str, Dict[str, object]]) -> str:
+    """Ticker or name from a plain string or a screener result row"""
+    if isinstance(item, str):
+        return item
+    return str(item.get("nse_code") or item.get("bse_code") or item.get("name") or "")
+
+
+async def _analyse(query: str, limits: ProviderLimits, slots: asyncio.Semaphore) -> Dict[str, object]:
+    async with slots:
+        # Agents keep per-run state, so every ticker gets its own copies
+        workflow = StockAnalysisWorkflow(
+            csv_agent=csv_data_agent.deep_copy(),
+            meta_prompt_agent=meta_prompt_agent.deep_copy(),
+            analysis_agent=analysis_agent.deep_copy(),
+            provider_limits=limits,
+        )
+        try:
+            report = ""
+            async for response in workflow.arun_workflow(query):
+                report = response.content
+            if "recommendation" not in workflow.session_state:
+                return {"query": query, "error": report}
+            return {
+                "query": query,
+                "stock_data": StockData(**workflow.session_state["stock_data"]),
+                "recommendation": StockRecommendation(**workflow.session_state["recommendation"]),
+            }
+        except Exception as e:
+            logger.error(f"Batch analysis failed for {query}: {e}")
+            return {"query": query, "error": str(e)}
+
+
+async def arun_batch(
+    items: List[Union[str, Dict[str, object]]],
+    concurrency: int = BATCH_CONCURRENCY,
+    limits: Optional[Dict[str, int]] = None,
+    output_dir: Path = REPORTS_DIR,
+) -> AsyncIterator[RunResponse]:
+    """
+    Analyse many companies concurrently, yielding each result as it finishes
+
+    Writes a consolidated markdown report and a JSONL of recommendations
+    to output_dir once every ticker is done.
+    """
+    queries = list(dict.fromkeys(q for q in (batch_query(item) for item in items) if q))
+    provider_limits = ProviderLimits(limits)
+    slots = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.create_task(_analyse(query, provider_limits, slots)) for query in queries]
+
+    results = []
+    for done, task in enumerate(asyncio.as_completed(tasks), start=1):
+        result = await task
+        results.append(result)
+        if "error" in result:
+            content = f"❌ [{done}/{len(queries)}] {result['query']}: {result['error']}"
+        else:
+            content = f"✅ [{done}/{len(queries)}] {result['query']}\n{format_report(result['stock_data'], result['recommendation'])}"
+        yield RunResponse(content=content)
+
+    report_path, jsonl_path = write_batch_outputs(results, output_dir)
+    yield RunResponse(content=f"📁 Wrote {report_path} and {jsonl_path}")
+
+
+def write_batch_outputs(results: List[Dict[str, object]], output_dir: Path = REPORTS_DIR):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    report_path = output_dir / f"batch-{stamp}.md"
+    jsonl_path = output_dir / f"batch-{stamp}.jsonl"
+
+    analysed = [r for r in results if "error" not in r]
+    analysed.sort(key=lambda r: (r["recommendation"].recommendation, -r["recommendation"].confidence_score))
+    failed = [r for r in results if "error" in r]
+
+    lines = [f"# Batch Stock Analysis ({stamp})", "", "| Company | NSE | Industry | Call | Confidence | Target |", "|---|---|---|---|---|---|"]
+    for r in analysed:
+        data, rec = r["stock_data"], r["recommendation"]
+        lines.append(f"| {data.name} | {data.nse_code} | {data.industry} | {rec.recommendation} | {rec.confidence_score} | {rec.target_price or 'N/A'} |")
+    if failed:
+        lines += ["", "## ❌ Failed", *[f"- {r['query']}: {r['error']}" for r in failed]]
+    for r in analysed:
+        lines.append(format_report(r["stock_data"], r["recommendation"]))
+    report_path.write_text("\n".join(lines), encoding="utf-8")
+
+    with open(jsonl_path, "w", encoding="utf-8") as f:
+        for r in analysed:
+            record = {
+                "query": r["query"],
+                "name": r["stock_data"].name,
+                "nse_code": r["stock_data"].nse_code,
+                "industry": r["stock_data"].industry,
+                **r["recommendation"].model_dump(),
+            }
+            f.write(json.dumps(record) + "\n")
+    return report_path, jsonl_path
+
+
+async def _main(args) -> None:
+    items: List[Union[str, Dict[str, object]]] = list(args.tickers)
+    if args.screen:
+        from screener import get_screener
+
+        items += get_screener().screen(args.screen, args.sort_by, limit=args.limit)
+    async for response in arun_batch(items, concurrency=args.concurrency):
+        print(response.content)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyse a watchlist of companies")
+    parser.add_argument("tickers", nargs="*", help="NSE/BSE codes or company names")
+    parser.add_argument("--screen", help="Screener expression selecting the companies to analyse")
+    parser.add_argument("--sort-by", help="Screener sort field")
+    parser.add_argument("--limit", type=int, default=50, help="Maximum screener rows")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    asyncio.run(_main(parser.parse_args()))
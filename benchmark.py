@@ -0,0 +1,252 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from uuid import uuid4
+import numpy as np
+
+BENCH_DIR = Path(os.getenv("BENCH_DIR", "benchmarks"))
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+# Relative slowdown (or throughput drop) reported as a regression
+REGRESSION_TOLERANCE = float(os.getenv("BENCH_REGRESSION_TOLERANCE", 0.1))
+# Lower is better for these; throughput is compared the other way round
+COMPARED = ["p50_ms", "p95_ms", "p99_ms", "tokens_per_request", "memory_peak_kb_per_request"]
+
+
+def corpus(size: int) -> List[str]:
+    """Evenly spaced companies from query_results.csv, by NSE code where there is one"""
+    from columnar_store import get_snapshot
+
+    snapshot = get_snapshot()
+    names, codes = snapshot.column("name"), snapshot.column("nse_code")
+    order = sorted(range(len(names)), key=lambda i: names[i])
+    rows = [order[int(i)] for i in np.linspace(0, len(order) - 1, num=min(size, len(order)))]
+    return [codes[row] or names[row] for row in rows]
+
+
+def _tokens(metrics: Optional[dict]) -> int:
+    metrics = metrics or {}
+    return int(sum(metrics.get("input_tokens") or []) + sum(metrics.get("output_tokens") or []))
+
+
+async def _run_workflow(query: str) -> dict:
+    from workflow import StockAnalysisWorkflow, analysis_agent, csv_data_agent, meta_prompt_agent
+
+    workflow = StockAnalysisWorkflow(
+        csv_agent=csv_data_agent.deep_copy(),
+        meta_prompt_agent=meta_prompt_agent.deep_copy(),
+        analysis_agent=analysis_agent.deep_copy(),
+    )
+    async for _ in workflow.arun_workflow(query):
+        pass
+    if "recommendation" not in workflow.session_state:
+        raise RuntimeError("no recommendation")
+    stages = workflow.token_report.to_dict()
+    return {"tokens": sum(stage["input_tokens"] + stage["output_tokens"] for stage in stages)}
+
+
+async def _run_playground(client, agent_id: str, query: str) -> dict:
+    # A fresh session keeps the response cache out of the measurement
+    response = await client.post(f"/v1/playground/agents/{agent_id}/runs",
+                                 data={"message": query, "stream": "false", "session_id": str(uuid4())})
+    response.raise_for_status()
+    return {"tokens": _tokens(response.json().get("metrics"))}
+
+
+def _rss_kb() -> float:
+    # Peak resident set size so far; Linux reports KB
+    return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+async def run_scenario(target: str, queries: List[str], concurrency: int, app: str, agent_id: str,
+                       trace_memory: bool = False) -> dict:
+    """Run every query with at most `concurrency` in flight; per-request latency, tokens and errors"""
+    client = None
+    if target == "playground":
+        import importlib
+        import httpx
+
+        module, _, attribute = app.partition(":")
+        asgi_app = getattr(importlib.import_module(module), attribute or "app")
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi_app), base_url="http://bench", timeout=600)
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(query: str) -> dict:
+        async with slots:
+            start = time.perf_counter()
+            try:
+                if client is not None:
+                    result = await _run_playground(client, agent_id, query)
+                else:
+                    result = await _run_workflow(query)
+                result["ok"] = True
+            except Exception as e:
+                result = {"ok": False, "error": f"{type(e).__name__}: {e}", "tokens": 0}
+            result["query"] = query
+            result["latency_ms"] = (time.perf_counter() - start) * 1000
+            return result
+
+    # tracemalloc is exact but slows Python down noticeably, so latency runs use peak RSS
+    if trace_memory:
+        tracemalloc.start()
+    rss_before = _rss_kb()
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(query) for query in queries))
+    wall = time.perf_counter() - start
+    if trace_memory:
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak_kb, retained_kb = peak / 1024, current / 1024
+    else:
+        peak_kb, retained_kb = _rss_kb() - rss_before, None
+    if client is not None:
+        await client.aclose()
+    return {"results": results, "wall_s": wall, "memory_peak_kb": peak_kb, "memory_retained_kb": retained_kb,
+            "memory_method": "tracemalloc" if trace_memory else "rss"}
+
+
+def summarize(run: dict, concurrency: int) -> dict:
+    results = run["results"]
+    ok = [result for result in results if result["ok"]]
+    latencies = np.array([result["latency_ms"] for result in ok]) if ok else np.zeros(1)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "concurrency": concurrency,
+        "wall_s": round(run["wall_s"], 3),
+        "throughput_rps": round(len(ok) / run["wall_s"], 3) if run["wall_s"] else 0.0,
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "p99_ms": round(float(p99), 1),
+        "max_ms": round(float(latencies.max()), 1),
+        "tokens_per_request": round(sum(result["tokens"] for result in ok) / max(len(ok), 1), 1),
+        # Peak memory growth shared by the requests that were in flight together
+        "memory_method": run["memory_method"],
+        "memory_peak_kb_per_request": round(run["memory_peak_kb"] / max(min(concurrency, len(results)), 1), 1),
+        "memory_retained_kb_per_request": (round(run["memory_retained_kb"] / max(len(results), 1), 1)
+                                           if run["memory_retained_kb"] is not None else None),
+    }
+
+
+def compare(summary: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> List[str]:
+    """Regressions of `summary` against a stored run of the same scenario"""
+    regressions = []
+    for key in COMPARED:
+        if key.startswith("memory") and baseline.get("memory_method") != summary["memory_method"]:
+            continue
+        if baseline.get(key) and summary[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key}: {baseline[key]} -> {summary[key]}")
+    if baseline.get("throughput_rps") and summary["throughput_rps"] < baseline["throughput_rps"] * (1 - tolerance):
+        regressions.append(f"throughput_rps: {baseline['throughput_rps']} -> {summary['throughput_rps']}")
+    if summary["errors"] > baseline.get("errors", 0):
+        regressions.append(f"errors: {baseline.get('errors', 0)} -> {summary['errors']}")
+    return regressions
+
+
+def _print_table(summary: dict, baseline: Optional[dict]) -> None:
+    for key, value in summary.items():
+        previous = baseline.get(key) if baseline else None
+        change = ""
+        if isinstance(previous, (int, float)) and previous and isinstance(value, (int, float)):
+            change = f"  ({(value - previous) / previous:+.1%} vs {previous})"
+        print(f"  {key:<32} {value}{change}")
+
+
+def _latency_overrides(values: List[str]) -> Dict[str, float]:
+    overrides = {}
+    for value in values:
+        provider, _, ms = value.partition("=")
+        overrides[provider.strip().lower()] = float(ms)
+    return overrides
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay recorded model and tool responses through the app and report latency")
+    parser.add_argument("--target", choices=["workflow", "playground"], default="workflow")
+    parser.add_argument("--app", default="workflow:app", help="module:attribute of the Playground app (playground target)")
+    parser.add_argument("--agent-id", default="stock-analysis-expert", help="Playground agent to drive (playground target)")
+    parser.add_argument("--queries", type=int, default=20, help="Companies taken from query_results.csv")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", action="append", default=[], metavar="PROVIDER=MS",
+                        help="Injected latency, e.g. deepseek=800 or tavily=300 (overrides recorded latency)")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="Relative uniform jitter on injected latency")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--record", action="store_true", help="Call the real providers and store their responses as fixtures")
+    parser.add_argument("--trace-memory", action="store_true", help="Measure memory with tracemalloc (slower, exact)")
+    parser.add_argument("--keep-caches", action="store_true", help="Use the normal .cache instead of a fresh one")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", type=Path, help="Write the summary and per-request results as JSON")
+    args = parser.parse_args()
+
+    if not args.keep_caches:
+        # Before any repo import, so every run starts with cold meta prompt and response caches
+        os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-cache-")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "replay")
+    os.environ.setdefault("TAVILY_API_KEY", "replay")
+    os.environ.setdefault("ANTHROPIC_API_KEY", "replay")
+    os.environ.setdefault("OPENAI_API_KEY", "replay")
+
+    from replay import FixtureStore, LatencyProfile, ProviderStandIn, install_replay
+
+    store = FixtureStore()
+    latency = LatencyProfile(_latency_overrides(args.latency), jitter=args.jitter, scale=args.latency_scale, seed=args.seed)
+    stand_in = ProviderStandIn(store, latency, record=args.record).start()
+
+    if args.target == "playground":
+        import importlib
+
+        module = importlib.import_module(args.app.partition(":")[0])
+        agents = [agent for agent in vars(module).values() if type(agent).__name__ == "Agent"]
+    else:
+        import workflow
+
+        agents = [workflow.csv_data_agent, workflow.meta_prompt_agent, workflow.analysis_agent]
+    install_replay(agents, stand_in)
+
+    queries = corpus(args.queries)
+    scenario = f"{args.target}:{args.agent_id if args.target == 'playground' else 'arun_workflow'}:c{args.concurrency}"
+    print(f"🏁 {scenario}: {len(queries)} queries, latency x{args.latency_scale}, {'recording' if args.record else 'replaying'}")
+    run = asyncio.run(run_scenario(args.target, queries, args.concurrency, args.app, args.agent_id,
+                                   args.trace_memory))
+    stand_in.stop()
+    summary = summarize(run, args.concurrency)
+    summary["fixtures"] = dict(store.hits)
+
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    baseline = baselines.get(scenario)
+    print(f"📊 Results{' vs baseline' if baseline else ''}:")
+    _print_table(summary, baseline)
+    for result in run["results"]:
+        if not result["ok"]:
+            print(f"❌ {result['query']}: {result['error']}")
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({"scenario": scenario, "summary": summary, "results": run["results"]}, indent=2))
+    if args.save_baseline:
+        baselines[scenario] = {**summary, "saved": datetime.now().isoformat(timespec="seconds")}
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(baselines, indent=2))
+        print(f"💾 Saved baseline for {scenario} to {args.baseline}")
+        return 0
+
+    regressions = compare(summary, baseline) if baseline else []
+    for regression in regressions:
+        print(f"⚠️ Regression {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
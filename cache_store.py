@@ -0,0 +1,154 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from weakref import WeakSet
+
+CACHE_DIR = Path(os.getenv("CACHE_DIR", ".cache"))
+CACHE_DB = CACHE_DIR / "cache.sqlite"
+
+_instances: "WeakSet[TTLCache]" = WeakSet()
+
+
+class TTLCache:
+    """
+    Persistent key/value store with TTL expiry and LRU eviction
+
+    Each namespace is its own SQLite table in a shared file, so several
+    processes in one container see the same entries.
+    """
+
+    def __init__(self, namespace: str, ttl: float, max_entries: int = 10000, path: Path = CACHE_DB):
+        if not re.fullmatch(r"[a-z_][a-z0-9_]*", namespace):
+            raise ValueError(f"Invalid cache namespace: {namespace}")
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connect()
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {namespace} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.commit()
+        _instances.add(self)
+
+    def _connect(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+
+    def get(self, key: str, count: bool = True) -> Optional[Any]:
+        """Value if unexpired; count=False leaves the hit/miss stats to the caller's record()"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, created FROM {self.namespace} WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute(f"DELETE FROM {self.namespace} WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += count
+                return None
+            self._conn.execute(f"UPDATE {self.namespace} SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += count
+        return json.loads(row[0])
+
+    def record(self, hit: bool) -> None:
+        """Count one lookup made of several uncounted get() calls"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def peek(self, key: str) -> Optional[Any]:
+        """Unexpired value, without counting a lookup or touching its access time"""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value FROM {self.namespace} WHERE key = ? AND created >= ?", (key, time.time() - self.ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.namespace} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def copy(self, key: str, new_key: str) -> None:
+        """Store key's value under new_key too, keeping its age so it expires at the same time"""
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.namespace} (key, value, created, accessed) "
+                f"SELECT ?, value, created, accessed FROM {self.namespace} WHERE key = ?",
+                (new_key, key),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.namespace} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.namespace}")
+            self._conn.commit()
+
+    def keys(self, prefix: str = "") -> List[str]:
+        """Keys that have not expired yet, optionally only those starting with prefix"""
+        with self._lock:
+            # A range on the primary key rather than LIKE, so SQLite can use the index
+            rows = self._conn.execute(
+                f"SELECT key FROM {self.namespace} WHERE key >= ? AND key < ? AND created >= ?",
+                (prefix, prefix + "\U0010ffff", time.time() - self.ttl),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def items(self) -> Dict[str, Any]:
+        """Every unexpired entry, without counting lookups or touching access times"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM {self.namespace} WHERE created >= ?", (time.time() - self.ttl,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.namespace}").fetchone()[0]
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute(f"DELETE FROM {self.namespace} WHERE created < ?", (now - self.ttl,))
+        self._conn.execute(
+            f"DELETE FROM {self.namespace} WHERE key IN "
+            f"(SELECT key FROM {self.namespace} ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+def _reconnect_after_fork() -> None:
+    # SQLite connections must not be shared across fork()
+    for cache in list(_instances):
+        cache._lock = threading.Lock()
+        cache._connect()
+
+
+os.register_at_fork(after_in_child=_reconnect_after_fork)
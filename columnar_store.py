@@ -0,0 +1,188 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+from models import ALL_COLUMNS, STOCK_DATA_COLUMNS, TEXT_FIELDS, short_header
+
+CSV_PATH = Path("query_results.csv")
+SNAPSHOT_DIR = Path(os.getenv("SNAPSHOT_DIR", "query_results.snapshot"))
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_snapshot(csv_path: Path = CSV_PATH, out_dir: Path = SNAPSHOT_DIR) -> Path:
+    """
+    Convert the CSV into one typed .npy file per column plus a manifest
+
+    Text columns become fixed-width unicode arrays, everything else float64
+    with NaN for blanks. Headers are renamed to the short field names.
+    """
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        headers = next(reader)
+        records = list(reader)
+
+    tmp_dir = staging_dir(out_dir)
+    columns = {}
+    for i, header in enumerate(headers):
+        field = ALL_COLUMNS.get(short_header(header))
+        if field is None:
+            continue
+        raw = [record[i].strip() for record in records]
+        if field in TEXT_FIELDS:
+            values = np.array(raw, dtype=str)
+        else:
+            values = np.array([float(v) if v else np.nan for v in raw], dtype=np.float64)
+        np.save(tmp_dir / f"{field}.npy", values)
+        columns[field] = {"header": header, "dtype": values.dtype.str}
+
+    manifest = {
+        "source": str(csv_path),
+        "source_sha256": file_sha256(csv_path),
+        "rows": len(records),
+        "columns": columns,
+    }
+    (tmp_dir / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2))
+    return swap_in(tmp_dir, out_dir, manifest["source_sha256"][:12])
+
+
+def staging_dir(out_dir: Path) -> Path:
+    """Empty directory to build the next out_dir in, unique so concurrent builders do not share one"""
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(prefix=f"{out_dir.name}.tmp.", dir=out_dir.parent))
+
+
+def swap_in(tmp_dir: Path, out_dir: Path, tag: str, keep: int = 2) -> Path:
+    """
+    Publish a finished staging_dir() as out_dir
+
+    out_dir is a relative symlink to one directory per build, and replacing
+    the link is atomic, so readers never see a partial build or a missing
+    file. The `keep` newest builds stay on disk for readers that resolved
+    the old link.
+    """
+    tmp_dir.chmod(0o755)
+    target = out_dir.with_name(f"{out_dir.name}.{tag}.{tmp_dir.name.rsplit('.', 1)[-1]}")
+    tmp_dir.rename(target)
+    legacy = None
+    if out_dir.is_dir() and not out_dir.is_symlink():
+        # Left by the old layout: a real directory cannot be replaced by a link, so move it aside first
+        legacy = out_dir.with_name(f"{target.name}.legacy")
+        try:
+            out_dir.rename(legacy)
+        except FileNotFoundError:
+            legacy = None
+    link = out_dir.with_name(f"{target.name}.link")
+    os.symlink(target.name, link)
+    os.replace(link, out_dir)
+    if legacy is not None:
+        shutil.rmtree(legacy, ignore_errors=True)
+    prune_builds(out_dir, keep)
+    return out_dir
+
+
+def prune_builds(out_dir: Path, keep: int = 2) -> None:
+    builds = sorted(
+        (path for path in out_dir.parent.glob(f"{out_dir.name}.*")
+         if path.is_dir() and not path.is_symlink() and not path.name.endswith(".legacy") and ".tmp." not in path.name),
+        key=lambda path: path.stat().st_mtime, reverse=True,
+    )
+    current = out_dir.resolve()
+    for path in builds[keep:]:
+        if path != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class ColumnarSnapshot:
+    """Read-only, memory-mapped view of a snapshot built by build_snapshot()"""
+
+    def __init__(self, path: Path = SNAPSHOT_DIR):
+        # Pinned to the build the link points at now, so columns loaded later match the manifest
+        self.path = Path(path).resolve()
+        self.manifest = json.loads((self.path / MANIFEST_FILE).read_text())
+        self._columns: Dict[str, np.ndarray] = {}
+
+    @property
+    def version(self) -> str:
+        return self.manifest["source_sha256"][:12]
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.manifest["columns"])
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    def column(self, field: str) -> np.ndarray:
+        # Pages are shared between processes mapping the same file
+        if field not in self._columns:
+            self._columns[field] = np.load(self.path / f"{field}.npy", mmap_mode="r")
+        return self._columns[field]
+
+    def stock_row(self, row_id: int) -> Dict[str, object]:
+        """One row keyed by StockData field names, NaN mapped to None"""
+        row = {}
+        for field in STOCK_DATA_COLUMNS.values():
+            value = self.column(field)[row_id]
+            if field in TEXT_FIELDS:
+                row[field] = str(value)
+            else:
+                row[field] = None if np.isnan(value) else float(value)
+        return row
+
+    def stock_rows(self) -> List[Dict[str, object]]:
+        # Column-at-a-time conversion is much cheaper than per-cell indexing
+        values = {}
+        for field in STOCK_DATA_COLUMNS.values():
+            column = self.column(field).tolist()
+            if field not in TEXT_FIELDS:
+                column = [None if v != v else v for v in column]
+            values[field] = column
+        return [{field: values[field][i] for field in values} for i in range(len(self))]
+
+
+def is_stale(csv_path: Path = CSV_PATH, out_dir: Path = SNAPSHOT_DIR) -> bool:
+    manifest_path = out_dir / MANIFEST_FILE
+    if not manifest_path.exists():
+        return True
+    manifest = json.loads(manifest_path.read_text())
+    return manifest.get("source_sha256") != file_sha256(csv_path)
+
+
+_version_cache: Dict[tuple, str] = {}
+
+
+def data_version(csv_path: Path = CSV_PATH) -> str:
+    """Short content hash of the CSV, re-hashed only when its mtime or size changes"""
+    stat = csv_path.stat()
+    key = (str(csv_path), stat.st_mtime_ns, stat.st_size)
+    if key not in _version_cache:
+        _version_cache.clear()
+        _version_cache[key] = file_sha256(csv_path)[:12]
+    return _version_cache[key]
+
+
+def get_snapshot() -> ColumnarSnapshot:
+    """Snapshot of the dataset version the current request is pinned to (see dataset.py)"""
+    from dataset import current_version
+
+    return current_version().snapshot
+
+
+if __name__ == "__main__":
+    # Build step, run once per image (see Dockerfile)
+    path = build_snapshot()
+    snapshot = ColumnarSnapshot(path)
+    print(f"✅ Built snapshot {snapshot.version} with {len(snapshot)} rows and {len(snapshot.fields)} columns at {path}")
@@ -0,0 +1,171 @@
+import os
+import re
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set
+from pydantic import BaseModel, Field
+from models import StockData
+from columnar_store import ColumnarSnapshot
+from dataset import current_version, warm_on_swap
+
+# Matches scoring below this are handed back to the LLM extraction agent
+MIN_CONFIDENCE = float(os.getenv("RESOLVER_MIN_CONFIDENCE", "0.75"))
+# A fuzzy match must beat the next company by this much, or it is only a hint
+MIN_MARGIN = float(os.getenv("RESOLVER_MIN_MARGIN", "0.05"))
+
+# Corporate suffixes that users add but the exchange short names usually drop
+_NAME_SUFFIXES = {"ltd", "limited", "inc", "corp", "corporation", "co", "company", "pvt", "private", "the"}
+_NON_ALNUM = re.compile(r"[^a-z0-9 ]+")
+
+
+class CompanyMatch(BaseModel):
+    stock_data: StockData
+    score: float = Field(..., description="Match confidence from 0 to 1")
+    method: str = Field(..., description="Index that produced the match (nse, bse, name, prefix, trigram)")
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, drop punctuation and trailing corporate suffixes"""
+    text = name.lower().replace("&", " and ")
+    text = _NON_ALNUM.sub(" ", text.replace(".", ""))
+    words = text.split()
+    while len(words) > 1 and words[-1] in _NAME_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def _covers(stored: str, word: str) -> bool:
+    """Whether a stored name word stands for a query word: equal, truncated ("industr") or abbreviated ("bk")"""
+    if stored.startswith(word) or (len(stored) >= 2 and word.startswith(stored)):
+        return True
+    if stored[0] != word[0]:
+        return False
+    rest = iter(word)
+    return all(char in rest for char in stored)
+
+
+def covers_query(stored: str, query: str) -> bool:
+    """Every word of the query is accounted for by some word of the stored name"""
+    stored_words = stored.split()
+    return all(any(_covers(s, word) for s in stored_words) for word in query.split())
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CompanyResolver:
+    """In-memory lookup of companies by NSE code, BSE code or (fuzzy) name"""
+
+    def __init__(self, rows: List[Dict[str, object]], min_confidence: float = MIN_CONFIDENCE,
+                 min_margin: float = MIN_MARGIN):
+        self.rows = rows
+        self.min_confidence = min_confidence
+        self.min_margin = min_margin
+
+        # Hash indexes for the exact tiers
+        self.by_nse: Dict[str, int] = {}
+        self.by_bse: Dict[str, int] = {}
+        self.by_name: Dict[str, int] = {}
+        # Trigram -> row ids, plus sorted names for prefix scans
+        self.by_trigram: Dict[str, List[int]] = {}
+        self.normalized_names: List[str] = []
+        self.trigram_counts: List[int] = []
+
+        for row_id, row in enumerate(rows):
+            nse = str(row["nse_code"]).upper()
+            bse = str(row["bse_code"])
+            name = normalize_name(str(row["name"]))
+            if nse:
+                self.by_nse.setdefault(nse, row_id)
+            if bse:
+                self.by_bse.setdefault(bse, row_id)
+            self.by_name.setdefault(name, row_id)
+            self.normalized_names.append(name)
+            grams = trigrams(name)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                self.by_trigram.setdefault(gram, []).append(row_id)
+
+        self._sorted_names = sorted((name, row_id) for row_id, name in enumerate(self.normalized_names))
+
+    @classmethod
+    def from_snapshot(cls, snapshot: ColumnarSnapshot, **kwargs) -> "CompanyResolver":
+        return cls(snapshot.stock_rows(), **kwargs)
+
+    def stock_data(self, row_id: int) -> StockData:
+        return StockData(**self.rows[row_id])
+
+    def match(self, query: str) -> Optional[CompanyMatch]:
+        """Best match for a ticker or company name, regardless of confidence"""
+        query = query.strip()
+        if not query:
+            return None
+
+        code = query.upper()
+        if code in self.by_nse:
+            return self._result(self.by_nse[code], 1.0, "nse")
+        if code in self.by_bse:
+            return self._result(self.by_bse[code], 1.0, "bse")
+
+        name = normalize_name(query)
+        if name in self.by_name:
+            return self._result(self.by_name[name], 1.0, "name")
+
+        candidates: Dict[int, tuple] = {}
+
+        # Exchange short names are truncated ("Reliance Industr"), so a stored
+        # name that is a prefix of the query is a strong signal
+        for end in range(len(name) - 1, 7, -1):
+            row_id = self.by_name.get(name[:end].rstrip())
+            if row_id is not None:
+                candidates[row_id] = (0.95 * end / len(name) + 0.05, "prefix")
+                break
+
+        # Stored names that extend the query ("angel" -> "angel one")
+        start = bisect_left(self._sorted_names, (name, -1))
+        for stored, row_id in self._sorted_names[start:start + 25]:
+            if not stored.startswith(name):
+                break
+            score = 0.9 * len(name) / len(stored)
+            if score > candidates.get(row_id, (0.0,))[0]:
+                candidates[row_id] = (score, "prefix")
+
+        # Trigram overlap scored with the Dice coefficient
+        query_grams = trigrams(name)
+        shared: Dict[int, int] = {}
+        for gram in query_grams:
+            for row_id in self.by_trigram.get(gram, ()):
+                shared[row_id] = shared.get(row_id, 0) + 1
+        for row_id, count in shared.items():
+            score = 2 * count / (len(query_grams) + self.trigram_counts[row_id])
+            if score > candidates.get(row_id, (0.0,))[0]:
+                candidates[row_id] = (score, "trigram")
+
+        if not candidates:
+            return None
+        ranked = sorted(candidates.items(), key=lambda item: item[1][0], reverse=True)
+        row_id, (score, method) = ranked[0]
+        runner_up = ranked[1][1][0] if len(ranked) > 1 else 0.0
+        # "State Bank of India" is one word away from "Bank of India": a fuzzy
+        # match that leaves query words unexplained, or barely beats another
+        # company, is only good enough as a hint
+        if score - runner_up < self.min_margin or not covers_query(self.normalized_names[row_id], name):
+            score = min(score, self.min_confidence - 0.01)
+        return self._result(row_id, round(score, 4), method)
+
+    def resolve(self, query: str) -> Optional[StockData]:
+        """StockData for the query, or None if no match clears the confidence threshold"""
+        result = self.match(query)
+        if result is None or result.score < self.min_confidence:
+            return None
+        return result.stock_data
+
+    def _result(self, row_id: int, score: float, method: str) -> CompanyMatch:
+        return CompanyMatch(stock_data=self.stock_data(row_id), score=score, method=method)
+
+
+@warm_on_swap
+def get_resolver() -> CompanyResolver:
+    """Shared resolver, built once per process and dataset version"""
+    return current_version().derived("resolver", lambda version: CompanyResolver.from_snapshot(version.snapshot))
@@ -0,0 +1,489 @@
+import csv
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from agno.tools.csv_toolkit import CsvTools
+from agno.utils.log import log_debug, logger
+from columnar_store import CSV_PATH, SNAPSHOT_DIR, ColumnarSnapshot, build_snapshot, data_version, file_sha256, is_stale
+from models import ALL_COLUMNS, STOCK_DATA_COLUMNS, TEXT_FIELDS, short_header
+from row_reader import row_key
+
+# Published versions, one directory each, plus the CURRENT pointer shared by every worker
+DATASET_DIR = Path(os.getenv("DATASET_DIR", "datasets"))
+# Drop a new query_results CSV here (ideally by writing elsewhere and renaming) to publish it
+DATASET_INBOX = Path(os.getenv("DATASET_INBOX", DATASET_DIR / "incoming"))
+DATASET_POLL_S = float(os.getenv("DATASET_POLL_S", 10))
+# A dropped file must be this old, so a copy still in progress is not picked up
+DATASET_SETTLE_S = float(os.getenv("DATASET_SETTLE_S", 2))
+# Older versions are kept for requests still pinned to them
+DATASET_KEEP = int(os.getenv("DATASET_KEEP", 3))
+# A snapshot that loses more than this share of companies is assumed to be truncated
+DATASET_MIN_ROWS_RATIO = float(os.getenv("DATASET_MIN_ROWS_RATIO", 0.9))
+DATASET_WATCH = os.getenv("DATASET_WATCH", "true").lower() == "true"
+# Re-embed changed rows into the knowledge base when a version is published
+DATASET_SYNC_KB = os.getenv("DATASET_SYNC_KB", "false").lower() == "true"
+POINTER_FILE = "CURRENT"
+DIFF_FILE = "diff.json"
+
+
+class DatasetError(ValueError):
+    pass
+
+
+class DatasetDiff(BaseModel):
+    version: str
+    previous: Optional[str] = None
+    rows: int
+    added: List[str] = Field(default_factory=list, description="Row keys of new companies")
+    removed: List[str] = Field(default_factory=list, description="Row keys of companies no longer listed")
+    changed: Dict[str, List[str]] = Field(default_factory=dict, description="Row key -> fields whose values changed")
+    unchanged: int = 0
+    industries: List[str] = Field(default_factory=list, description="Industries with at least one added, removed or changed row")
+
+    @property
+    def touched(self) -> List[str]:
+        return self.added + self.removed + list(self.changed)
+
+    def tickers(self, keys: List[str]) -> set:
+        """Upper-cased NSE code, BSE code or name of each row key, as the caches key companies"""
+        return {key.split(":", 1)[1].strip().upper() for key in keys}
+
+
+def read_rows(path: Path) -> Dict[str, Dict[str, str]]:
+    """Rows keyed by row_key(), checked for the columns and values the snapshot and agents rely on"""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        try:
+            headers = next(reader)
+        except StopIteration:
+            raise DatasetError(f"{path} is empty")
+        fields = [ALL_COLUMNS.get(short_header(header)) for header in headers]
+        missing = sorted(set(STOCK_DATA_COLUMNS.values()) - set(fields))
+        if missing:
+            raise DatasetError(f"{path} is missing columns: {', '.join(missing)}")
+
+        rows: Dict[str, Dict[str, str]] = {}
+        for line, record in enumerate(reader, start=2):
+            if not any(record):
+                continue
+            if len(record) != len(headers):
+                raise DatasetError(f"Line {line}: expected {len(headers)} values, got {len(record)}")
+            row = {field: value.strip() for field, value in zip(fields, record) if field}
+            for field, value in row.items():
+                if value and field not in TEXT_FIELDS:
+                    try:
+                        float(value)
+                    except ValueError:
+                        raise DatasetError(f"Line {line}: {field} is not a number: {value!r}")
+            if not (row["name"] or row["nse_code"] or row["bse_code"]):
+                raise DatasetError(f"Line {line}: company without a name or exchange code")
+            key = row_key(row)
+            if key in rows:
+                raise DatasetError(f"Line {line}: duplicate company {key}")
+            rows[key] = row
+    return rows
+
+
+def _same(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    # "12.50" and "12.5" are the same number
+    try:
+        return float(a) == float(b)
+    except ValueError:
+        return False
+
+
+def diff_rows(previous: Dict[str, Dict[str, str]], current: Dict[str, Dict[str, str]],
+              version: str, previous_version: Optional[str] = None) -> DatasetDiff:
+    diff = DatasetDiff(version=version, previous=previous_version, rows=len(current))
+    industries = set()
+    for key, row in current.items():
+        old = previous.get(key)
+        if old is None:
+            diff.added.append(key)
+            industries.add(row["industry"])
+            continue
+        fields = [field for field in row if not _same(row[field], old.get(field, ""))]
+        if fields:
+            diff.changed[key] = fields
+            industries.update({row["industry"], old["industry"]})
+        else:
+            diff.unchanged += 1
+    for key, row in previous.items():
+        if key not in current:
+            diff.removed.append(key)
+            industries.add(row["industry"])
+    diff.industries = sorted(industries)
+    return diff
+
+
+class DatasetVersion:
+    """One published dataset: its CSV, its columnar snapshot and the indexes built from them"""
+
+    def __init__(self, version: str, csv_path: Path, snapshot_path: Path):
+        self.version = version
+        self.csv_path = csv_path
+        self.snapshot_path = snapshot_path
+        self._derived: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def snapshot(self) -> ColumnarSnapshot:
+        return self.derived("snapshot", lambda version: ColumnarSnapshot(version.snapshot_path))
+
+    def derived(self, name: str, build: Callable[["DatasetVersion"], Any]) -> Any:
+        """Built once per version, so a request keeps using the indexes of the version it started on"""
+        value = self._derived.get(name)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(name)
+                if value is None:
+                    value = self._derived[name] = build(self)
+        return value
+
+    def diff(self) -> Optional[DatasetDiff]:
+        path = self.snapshot_path.parent / DIFF_FILE
+        if not path.exists():
+            return None
+        return DatasetDiff.model_validate_json(path.read_text())
+
+
+def base_version() -> DatasetVersion:
+    """The CSV baked into the image, used until a version is published"""
+    if is_stale():
+        build_snapshot()
+    return DatasetVersion(data_version(CSV_PATH), CSV_PATH, SNAPSHOT_DIR)
+
+
+# Dataset version the current request was pinned to when it arrived
+_pinned: ContextVar[Optional[DatasetVersion]] = ContextVar("dataset_version", default=None)
+# Called with the new version pinned before it is swapped in, so the first request does not build indexes
+_warmers: List[Callable[[], Any]] = []
+
+
+def warm_on_swap(fn: Callable[[], Any]) -> Callable[[], Any]:
+    _warmers.append(fn)
+    return fn
+
+
+# Called once, by the publishing process, with the diff of each new version before the pointer moves
+_publish_hooks: List[Callable[[DatasetDiff], Any]] = []
+
+
+def on_publish(fn: Callable[[DatasetDiff], Any]) -> Callable[[DatasetDiff], Any]:
+    _publish_hooks.append(fn)
+    return fn
+
+
+class DatasetManager:
+    """
+    Publishes CSV snapshots dropped into the inbox and swaps workers over to them
+
+    Publishing (validate, diff, build the columnar snapshot, write the CURRENT
+    pointer) is done by whichever process holds the lock; every process then
+    warms the new version's indexes and swaps its reference to it. Requests
+    already running keep the version they were pinned to.
+    """
+
+    def __init__(self, root: Path = DATASET_DIR, inbox: Path = DATASET_INBOX):
+        self.root = root
+        self.inbox = inbox
+        self.current = self._load_current() or base_version()
+        self.counts = {"published": 0, "rejected": 0, "unchanged": 0, "swaps": 0}
+        self.last_error: Optional[str] = None
+        self._swap_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _version(self, version: str) -> DatasetVersion:
+        return DatasetVersion(version, self.root / version / CSV_PATH.name, self.root / version / "snapshot")
+
+    def _read_pointer(self) -> Optional[str]:
+        try:
+            return json.loads((self.root / POINTER_FILE).read_text())["version"]
+        except FileNotFoundError:
+            return None
+
+    def _load_current(self) -> Optional[DatasetVersion]:
+        version = self._read_pointer()
+        if version is None:
+            return None
+        if not (self.root / version / "snapshot").exists():
+            logger.warning(f"Dataset version {version} is missing, serving the bundled CSV")
+            return None
+        return self._version(version)
+
+    def sync(self) -> bool:
+        """Swap to the published version if another process (or this one) has moved the pointer"""
+        version = self._read_pointer()
+        if version is None or version == self.current.version:
+            return False
+        with self._swap_lock:
+            if version == self.current.version:
+                return False
+            new = self._version(version)
+            with pinned(new):
+                for warm in _warmers:
+                    try:
+                        warm()
+                    except Exception as e:
+                        logger.warning(f"Warming {getattr(warm, '__name__', warm)} for dataset {version} failed: {e}")
+            previous, self.current = self.current, new
+            self.counts["swaps"] += 1
+        print(f"🔁 Dataset {previous.version} -> {version} in pid {os.getpid()}")
+        return True
+
+    def pending(self) -> Optional[Path]:
+        """Oldest settled CSV in the inbox"""
+        settled = []
+        for path in self.inbox.glob("*.csv"):
+            try:
+                mtime = path.stat().st_mtime
+            except FileNotFoundError:
+                # Published by another worker in the meantime
+                continue
+            if time.time() - mtime >= DATASET_SETTLE_S:
+                settled.append((mtime, path))
+        return min(settled)[1] if settled else None
+
+    def publish(self, path: Path) -> Optional[DatasetDiff]:
+        """Validate a CSV and publish it as a new version; the file is consumed either way"""
+        version = file_sha256(path)[:12]
+        if version == self.current.version:
+            path.unlink()
+            self.counts["unchanged"] += 1
+            print(f"✅ Dataset {path.name} is identical to {version}, nothing to publish")
+            return None
+        try:
+            rows = read_rows(path)
+            previous = read_rows(self.current.csv_path)
+            if len(rows) < DATASET_MIN_ROWS_RATIO * len(previous):
+                raise DatasetError(f"{len(rows)} companies, down from {len(previous)}; refusing a likely truncated file")
+        except DatasetError as e:
+            path.rename(path.with_name(path.name + ".rejected"))
+            self.counts["rejected"] += 1
+            self.last_error = f"{path.name}: {e}"
+            logger.error(f"Rejected dataset {path.name}: {e}")
+            return None
+
+        diff = diff_rows(previous, rows, version, self.current.version)
+        staging = self.root / f"{version}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        shutil.copyfile(path, staging / CSV_PATH.name)
+        build_snapshot(staging / CSV_PATH.name, staging / "snapshot")
+        (staging / DIFF_FILE).write_text(diff.model_dump_json(indent=2))
+        shutil.rmtree(self.root / version, ignore_errors=True)
+        staging.rename(self.root / version)
+        # Shared caches keep what the diff did not touch, ready before any worker swaps
+        for hook in _publish_hooks:
+            try:
+                hook(diff)
+            except Exception as e:
+                logger.warning(f"Publish hook {getattr(hook, '__name__', hook)} for dataset {version} failed: {e}")
+
+        # Readers see either the old pointer or the new one, never a partial file
+        pointer = self.root / f"{POINTER_FILE}.tmp"
+        pointer.write_text(json.dumps({"version": version, "previous": self.current.version, "published": time.time()}))
+        os.replace(pointer, self.root / POINTER_FILE)
+        path.unlink()
+        self.counts["published"] += 1
+        self.last_error = None
+        print(f"📦 Published dataset {version}: {len(diff.added)} added, {len(diff.changed)} changed, "
+              f"{len(diff.removed)} removed, {diff.unchanged} unchanged")
+        if DATASET_SYNC_KB and diff.touched:
+            self._sync_knowledge_base(self.root / version / CSV_PATH.name)
+        self._prune(keep={version, self.current.version})
+        return diff
+
+    def _sync_knowledge_base(self, csv_path: Path) -> None:
+        from kb_ingest import ingest
+        from knowledge_base import knowledge_base
+
+        try:
+            stats = ingest(knowledge_base, path=csv_path)
+            print(f"✅ Knowledge base synced: {stats.added} added, {stats.changed} changed, {stats.removed} removed")
+        except Exception as e:
+            logger.error(f"Knowledge base sync for {csv_path} failed: {e}")
+
+    def _prune(self, keep: set) -> None:
+        versions = sorted((path for path in self.root.iterdir() if path.is_dir() and path != self.inbox
+                           and not path.name.endswith(".tmp")), key=lambda path: path.stat().st_mtime, reverse=True)
+        for path in versions[DATASET_KEEP:]:
+            if path.name not in keep:
+                shutil.rmtree(path, ignore_errors=True)
+                log_debug(f"Removed dataset version {path.name}")
+
+    def check(self) -> bool:
+        """Publish a pending file if this process gets the lock, then swap to whatever is current"""
+        if self.pending() is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / ".lock", "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    log_debug("Another worker is publishing a dataset")
+                else:
+                    # Re-checked under the lock, the previous holder may have consumed it
+                    path = self.pending()
+                    if path is not None:
+                        self.publish(path)
+        return self.sync()
+
+    def run_forever(self, interval: float = DATASET_POLL_S) -> None:
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Dataset check failed: {e}")
+            time.sleep(interval)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name="dataset-watcher", daemon=True)
+            self._thread.start()
+
+    def status(self) -> dict:
+        diff = self.current.diff()
+        return {
+            "version": self.current.version,
+            "csv": str(self.current.csv_path),
+            "rows": len(self.current.snapshot),
+            "watching": self._thread is not None,
+            "inbox": str(self.inbox),
+            **self.counts,
+            "last_error": self.last_error,
+            "diff": {"previous": diff.previous, "added": len(diff.added), "changed": len(diff.changed),
+                     "removed": len(diff.removed), "industries": len(diff.industries)} if diff else None,
+        }
+
+
+_manager: Optional[DatasetManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_dataset_manager() -> DatasetManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = DatasetManager()
+        return _manager
+
+
+def current_version() -> DatasetVersion:
+    """The version this request is pinned to, or the latest one outside a request"""
+    return _pinned.get() or get_dataset_manager().current
+
+
+@contextmanager
+def pinned(version: Optional[DatasetVersion] = None) -> Iterator[DatasetVersion]:
+    """Keep everything inside (including tasks and threads started from it) on one version"""
+    version = version or current_version()
+    token = _pinned.set(version)
+    try:
+        yield version
+    finally:
+        _pinned.reset(token)
+
+
+class DatasetVersionMiddleware:
+    """Pins each request to the version current when it arrived and reports it in X-Dataset-Version"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        with pinned(get_dataset_manager().current) as version:
+            async def send_with_version(message):
+                if message["type"] == "http.response.start":
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"x-dataset-version", version.version.encode())]}
+                await send(message)
+
+            await self.app(scope, receive, send_with_version)
+
+
+class DatasetCsvTools(CsvTools):
+    """CsvTools over the query_results CSV of the pinned dataset version"""
+
+    def __init__(self, **kwargs):
+        super().__init__(csvs=[CSV_PATH], **kwargs)
+
+    @property
+    def csvs(self) -> List[Path]:
+        return [current_version().csv_path]
+
+    @csvs.setter
+    def csvs(self, value) -> None:
+        # Set by CsvTools.__init__; the path always comes from the dataset version
+        pass
+
+
+async def start_dataset_watcher() -> None:
+    """Startup handler: every worker polls for new versions; publishing is serialised by a file lock"""
+    if DATASET_WATCH:
+        get_dataset_manager().start()
+
+
+dataset_router = APIRouter(tags=["Dataset"])
+
+
+@dataset_router.get("/dataset")
+def get_dataset_status():
+    """Current dataset version of this worker and what changed in it"""
+    return get_dataset_manager().status()
+
+
+@dataset_router.get("/dataset/diff", response_model=DatasetDiff)
+def get_dataset_diff():
+    """Row-level diff of the current version against the one it replaced"""
+    diff = get_dataset_manager().current.diff()
+    if diff is None:
+        raise HTTPException(status_code=404, detail="The bundled dataset has no previous version")
+    return diff
+
+
+@dataset_router.post("/dataset/check")
+def check_dataset():
+    """Publish a pending inbox file now instead of waiting for the next poll"""
+    manager = get_dataset_manager()
+    swapped = manager.check()
+    return {"swapped": swapped, **manager.status()}
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Registers their publish hooks, so a CLI publish carries the shared caches over too. They
+    # register on the imported `dataset` module, not on this __main__ copy, so publish through it.
+    import precompute  # noqa: F401
+    import response_cache  # noqa: F401
+    from dataset import get_dataset_manager
+
+    # Publish a file without a running server, e.g. `python dataset.py new_results.csv`;
+    # running workers pick the new version up on their next poll
+    manager = get_dataset_manager()
+    if len(sys.argv) > 1:
+        manager.root.mkdir(parents=True, exist_ok=True)
+        # Not *.csv, so watching workers leave it alone; publish() consumes it
+        copy = manager.root / f".{Path(sys.argv[1]).name}.publishing"
+        shutil.copyfile(sys.argv[1], copy)
+        with open(manager.root / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            diff = manager.publish(copy)
+        if diff is not None:
+            print(diff.model_dump_json(indent=2))
+        manager.sync()
+    print(json.dumps(manager.status(), indent=2))
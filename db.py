@@ -0,0 +1,255 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from fastapi import APIRouter
+from sqlalchemy import MetaData, bindparam, create_engine, func, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from agno.memory.db.postgres import PgMemoryDb
+from agno.storage.postgres import PostgresStorage
+from agno.storage.session import Session
+from agno.utils.log import log_debug, logger
+from session_memory import SESSION_CACHE_VALIDATE, get_session_cache, session_key, set_current_session
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# RDS drops idle connections, so recycle before that and ping on checkout
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers wait for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "checked_out": self.checkedout(),
+                "idle": self.checkedin(),
+                "overflow": self.overflow(),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(1000 * self.total_wait / self.checkouts, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(1000 * self.max_wait, 3),
+            }
+
+
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(db_url: str) -> Engine:
+    """One pooled engine per database URL, shared by memory, storage and the vector DB"""
+    with _engines_lock:
+        engine = _engines.get(db_url)
+        if engine is None:
+            engine = create_engine(
+                db_url,
+                poolclass=TimedQueuePool,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=DB_POOL_PRE_PING,
+            )
+            _engines[db_url] = engine
+        return engine
+
+
+def _dispose_after_fork() -> None:
+    # Pooled connections belong to the parent; workers open their own
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+def pool_stats() -> List[dict]:
+    with _engines_lock:
+        engines = list(_engines.values())
+    return [{"database": engine.url.render_as_string(hide_password=True), **engine.pool.stats()} for engine in engines]
+
+
+class PooledPgMemoryDb(PgMemoryDb):
+    """
+    PgMemoryDb on a shared pooled engine that does not connect at import time
+
+    User memory updates run on the background updater (BoundedAgentMemory),
+    outside any agent run, so they are written directly.
+    """
+
+    def __init__(self, table_name: str, db_engine: Engine, schema: Optional[str] = "ai"):
+        # PgMemoryDb.__init__ minus inspect(), which would connect at import time
+        self.table_name = table_name
+        self.schema = schema
+        self.db_url = None
+        self.db_engine = db_engine
+        self.metadata = MetaData(schema=schema)
+        self.Session = scoped_session(sessionmaker(bind=db_engine))
+        self.table = self.get_table()
+
+
+class CachedPostgresStorage(PostgresStorage):
+    """
+    PostgresStorage that keeps agent sessions in an in-process LRU
+
+    A hot session costs one updated_at lookup (or nothing, with
+    SESSION_CACHE_VALIDATE=false) per run, and a written session row is
+    cached as written instead of being read back.
+    """
+
+    def __init__(self, table_name: str, db_engine: Engine, schema: Optional[str] = "ai", auto_upgrade_schema: bool = False):
+        # PostgresStorage.__init__ minus inspect(), which would connect at import time
+        self._mode = "agent"
+        self.table_name = table_name
+        self.schema = schema
+        self.db_url = None
+        self.db_engine = db_engine
+        self.metadata = MetaData(schema=schema)
+        self.schema_version = 1
+        self.auto_upgrade_schema = auto_upgrade_schema
+        self._schema_up_to_date = False
+        self.Session = scoped_session(sessionmaker(bind=db_engine))
+        self.table = self.get_table()
+
+    def read(self, session_id: str, user_id: Optional[str] = None) -> Optional[Session]:
+        # Agents read their session at the start of every run
+        if self.mode != "agent":
+            return super().read(session_id, user_id)
+        set_current_session(self, session_id)
+        cache, key = get_session_cache(), session_key(self, session_id)
+        session = cache.get(key)
+        if session is not None and (user_id is None or session.user_id == user_id):
+            if not SESSION_CACHE_VALIDATE or self._is_current(session):
+                cache.hits += 1
+                return session
+            cache.stale += 1
+        cache.misses += 1
+        session = super().read(session_id, user_id)
+        if session is not None:
+            self._patch_summary(session)
+            cache.put(key, session)
+        return session
+
+    def _is_current(self, session: Session) -> bool:
+        """Whether the cached row is still the one in the database (another worker may have written it)"""
+        try:
+            with self.Session() as sess:
+                row = sess.execute(
+                    select(self.table.c.updated_at).where(self.table.c.session_id == session.session_id)
+                ).first()
+        except Exception as e:
+            log_debug(f"Could not check session {session.session_id}: {e}")
+            return False
+        return row is not None and row[0] == session.updated_at
+
+    def _patch_summary(self, session: Session) -> None:
+        # A summary rolled in the background is newer than the one a run loaded before it finished
+        summary = get_session_cache().summary(session_key(self, session.session_id))
+        if summary is not None and session.memory is not None:
+            session.memory["summary"] = summary
+
+    def update_summary(self, session_id: str, summary: dict) -> None:
+        """Write a rolled summary into the session row without touching the rest of it"""
+        now = int(time.time())
+        stmt = (
+            self.table.update()
+            .where(self.table.c.session_id == session_id)
+            .values(
+                memory=func.jsonb_set(func.coalesce(self.table.c.memory, text("'{}'::jsonb")), text("'{summary}'"),
+                                      bindparam("summary", summary, type_=postgresql.JSONB)),
+                updated_at=now,
+            )
+        )
+        with self.Session() as sess, sess.begin():
+            sess.execute(stmt)
+        cached = get_session_cache().get(session_key(self, session_id))
+        if cached is not None:
+            cached.updated_at = now
+
+    def upsert(self, session: Session, create_and_retry: bool = True) -> Optional[Session]:
+        if self.mode != "agent":
+            return super().upsert(session, create_and_retry)
+        self._patch_summary(session)
+
+        if self.auto_upgrade_schema and not self._schema_up_to_date:
+            self.upgrade_schema()
+        now = int(time.time())
+        stmt = postgresql.insert(self.table).values(
+            session_id=session.session_id,
+            agent_id=session.agent_id,  # type: ignore
+            team_session_id=session.team_session_id,  # type: ignore
+            user_id=session.user_id,
+            memory=session.memory,
+            agent_data=session.agent_data,  # type: ignore
+            session_data=session.session_data,
+            extra_data=session.extra_data,
+            updated_at=now,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["session_id"],
+            set_=dict(
+                agent_id=session.agent_id,  # type: ignore
+                team_session_id=session.team_session_id,  # type: ignore
+                user_id=session.user_id,
+                memory=session.memory,
+                agent_data=session.agent_data,  # type: ignore
+                session_data=session.session_data,
+                extra_data=session.extra_data,
+                updated_at=now,
+            ),
+        )
+        try:
+            with self.Session() as sess, sess.begin():
+                sess.execute(stmt)
+        except Exception as e:
+            if not create_and_retry:
+                logger.warning(f"Exception writing session: {e}")
+                return None
+            log_debug(f"Session write failed, creating the table and retrying: {e}")
+            if not self.table_exists():
+                self.create()
+            return self.upsert(session, create_and_retry=False)
+        log_debug(f"Wrote session {session.session_id}")
+        # The row now matches what we wrote, so skip the read-back round trip
+        session.updated_at = now
+        get_session_cache().put(session_key(self, session.session_id), session)
+        return session
+
+
+db_router = APIRouter(tags=["Database"])
+
+
+@db_router.get("/db/pool")
+def get_pool_stats():
+    """Connection pool usage for each database the process talks to"""
+    return pool_stats()
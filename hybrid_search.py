@@ -0,0 +1,176 @@
+import math
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from pydantic import PrivateAttr
+from sqlalchemy import select
+from agno.document import Document
+from agno.knowledge.csv import CSVKnowledgeBase
+from agno.utils.log import log_debug, logger
+from columnar_store import CSV_PATH
+from dataset import current_version
+from row_reader import RowCSVReader
+from tracing import span
+
+# Share of the merged score that comes from vector similarity
+VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", 0.5))
+# Lexical candidates passed on to vector scoring, plus any rows tied with the last one;
+# an industry filter passes its whole (small) set instead
+CANDIDATE_LIMIT = 50
+# Results scoring below this fraction of the best one are not worth the prompt tokens
+RELATIVE_CUTOFF = 0.6
+
+_TOKEN = re.compile(r"[A-Za-z0-9&]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [token.lower() for token in _TOKEN.findall(text)]
+
+
+class LexicalIndex:
+    """BM25 over each row's identity fields plus exact ticker and industry lookups"""
+
+    def __init__(self, documents: List[Document], k1: float = 1.2, b: float = 0.75):
+        self.documents = documents
+        self.by_ticker: Dict[str, int] = {}
+        self.industries: Dict[str, List[int]] = {}
+        self.postings: Dict[str, List[tuple]] = {}
+
+        lengths = []
+        for row, doc in enumerate(documents):
+            meta = doc.meta_data
+            for code in (meta.get("nse_code"), meta.get("bse_code")):
+                if code:
+                    self.by_ticker.setdefault(code.upper(), row)
+            if meta.get("industry"):
+                self.industries.setdefault(meta["industry"].lower(), []).append(row)
+            tokens = tokenize(" ".join([meta.get("name", ""), meta.get("nse_code", ""), meta.get("industry", "")]))
+            lengths.append(len(tokens))
+            for token, tf in Counter(tokens).items():
+                self.postings.setdefault(token, []).append((row, tf))
+
+        self.k1, self.b = k1, b
+        self.lengths = np.array(lengths, dtype=np.float64)
+        self.avg_length = float(self.lengths.mean()) if len(lengths) else 0.0
+
+    def bm25(self, tokens: List[str]) -> np.ndarray:
+        scores = np.zeros(len(self.documents))
+        for token in set(tokens):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            rows = np.fromiter((row for row, _ in postings), dtype=np.int64, count=len(postings))
+            tf = np.fromiter((tf for _, tf in postings), dtype=np.float64, count=len(postings))
+            idf = math.log(1 + (len(self.documents) - len(postings) + 0.5) / (len(postings) + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[rows] / self.avg_length)
+            scores[rows] += idf * tf * (self.k1 + 1) / norm
+        return scores
+
+    def tickers(self, query: str) -> List[int]:
+        # Only tokens written like tickers, so "one" never matches an NSE code
+        return [self.by_ticker[token] for token in _TOKEN.findall(query)
+                if (token.isupper() or (token.isdigit() and len(token) == 6)) and token in self.by_ticker]
+
+    def industry_rows(self, query: str) -> Optional[List[int]]:
+        # Whole words only, so "coil" is not the oil industry
+        lowered = query.lower()
+        matched = [rows for industry, rows in self.industries.items()
+                   if re.search(rf"\b{re.escape(industry)}\b", lowered)]
+        return sorted({row for rows in matched for row in rows}) if matched else None
+
+
+def score_ids(vector_db, query: str, ids: List[str]) -> Dict[str, float]:
+    """Cosine similarity for just the candidate ids, on either vector backend"""
+    if hasattr(vector_db, "score_ids"):
+        return vector_db.score_ids(query, ids)
+    embedding = vector_db.embedder.get_embedding(query)
+    distance = vector_db.table.c.embedding.cosine_distance(embedding)
+    with vector_db.Session() as sess:
+        rows = sess.execute(select(vector_db.table.c.id, distance).where(vector_db.table.c.id.in_(ids)))
+        return {row[0]: 1 - float(row[1]) for row in rows}
+
+
+class HybridKnowledgeBase(CSVKnowledgeBase):
+    """
+    CSV knowledge base that resolves tickers, names and industries lexically first
+
+    Vector similarity is computed only over the lexical candidates and
+    merged with the BM25 score; queries with no lexical hits fall back to
+    plain vector search.
+    """
+
+    num_documents: int = 3
+    _index: Optional[LexicalIndex] = PrivateAttr(default=None)
+
+    @property
+    def index(self) -> LexicalIndex:
+        if Path(self.path) == CSV_PATH:
+            # Rows of the dataset version the request is pinned to
+            return current_version().derived("lexical_index", lambda version: LexicalIndex(RowCSVReader().read(version.csv_path)))
+        if self._index is None:
+            self._index = LexicalIndex(RowCSVReader().read(Path(self.path)))
+        return self._index
+
+    def search(
+        self, query: str, num_documents: Optional[int] = None, filters: Optional[Dict[str, object]] = None
+    ) -> List[Document]:
+        limit = num_documents or self.num_documents
+        with span("tool.knowledge.search", kind="tool") as s:
+            try:
+                results = self.hybrid_search(query, limit)
+            except Exception as e:
+                logger.error(f"Hybrid search failed, using vector search: {e}")
+                results = None
+            s.set(path="hybrid" if results is not None else "vector")
+            if results is None:
+                results = super().search(query, num_documents=limit, filters=filters)
+            s.set(results=len(results))
+            return results
+
+    async def async_search(
+        self, query: str, num_documents: Optional[int] = None, filters: Optional[Dict[str, object]] = None
+    ) -> List[Document]:
+        return self.search(query, num_documents=num_documents, filters=filters)
+
+    def hybrid_search(self, query: str, limit: int) -> Optional[List[Document]]:
+        index = self.index
+        lexical = index.bm25(tokenize(query))
+        allowed = index.industry_rows(query)
+        if allowed is not None:
+            mask = np.zeros(len(lexical), dtype=bool)
+            mask[allowed] = True
+            lexical = np.where(mask, lexical + 1.0, 0.0)
+
+        exact = index.tickers(query)
+        lexical[exact] += lexical.max() + 1.0
+        if not lexical.any():
+            return None
+
+        candidates = np.flatnonzero(lexical > 0)
+        if allowed is None and len(candidates) > CANDIDATE_LIMIT:
+            # Rows tied on the lexical score are all kept, so the vector score decides between them
+            cutoff = np.partition(lexical[candidates], -CANDIDATE_LIMIT)[-CANDIDATE_LIMIT]
+            candidates = candidates[lexical[candidates] >= cutoff]
+        candidates = candidates[np.argsort(-lexical[candidates], kind="stable")]
+        lexical_scores = lexical[candidates] / lexical[candidates[0]]
+
+        ids = [index.documents[row].id for row in candidates]
+        similarities = score_ids(self.vector_db, query, ids) if self.vector_db is not None else {}
+        merged = [
+            ((1 - VECTOR_WEIGHT) * lexical_score + VECTOR_WEIGHT * similarities.get(doc_id, 0.0), row)
+            for row, doc_id, lexical_score in zip(candidates, ids, lexical_scores)
+        ]
+        merged.sort(reverse=True)
+        best = merged[0][0]
+        selected = [(score, row) for score, row in merged[:limit] if score >= RELATIVE_CUTOFF * best]
+        log_debug(f"Hybrid search scored {len(candidates)} candidates, returning {len(selected)}")
+
+        results = []
+        for score, row in selected:
+            doc = index.documents[row]
+            results.append(Document(id=doc.id, name=doc.name, content=doc.content,
+                                    meta_data={**doc.meta_data, "score": round(float(score), 4)}))
+        return results
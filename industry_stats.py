@@ -0,0 +1,198 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from pydantic import BaseModel
+from cache_store import CACHE_DIR
+from columnar_store import ColumnarSnapshot, get_snapshot
+from dataset import DatasetDiff, current_version, warm_on_swap
+from models import STOCK_DATA_COLUMNS, TEXT_FIELDS, StockData
+
+INDUSTRY_STATS_PATH = Path(os.getenv("INDUSTRY_STATS_PATH", CACHE_DIR / "industry_stats.npz"))
+METRICS = [field for field in STOCK_DATA_COLUMNS.values() if field not in TEXT_FIELDS]
+# Columns of the per (industry, metric) stats table
+STATS = ["count", "mean", "std", "min", "q1", "median", "q3", "max"]
+
+
+class PeerMetric(BaseModel):
+    value: float
+    industry_median: float
+    q1: float
+    q3: float
+    percentile: float
+    zscore: Optional[float] = None
+
+
+class PeerComparison(BaseModel):
+    industry: str
+    peers: int
+    metrics: Dict[str, PeerMetric]
+
+
+def _group_stats(matrix: np.ndarray) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """Stats row and sorted non-NaN values for each metric column of one industry"""
+    stats = np.full((matrix.shape[1], len(STATS)), np.nan, dtype=np.float32)
+    sorted_values = []
+    for m in range(matrix.shape[1]):
+        values = np.sort(matrix[:, m][~np.isnan(matrix[:, m])])
+        sorted_values.append(values.astype(np.float32))
+        if len(values):
+            q1, median, q3 = np.percentile(values, [25, 50, 75])
+            stats[m] = [len(values), values.mean(), values.std(), values[0], q1, median, q3, values[-1]]
+        else:
+            stats[m, 0] = 0
+    return stats, sorted_values
+
+
+def _group_hash(keys: np.ndarray, matrix: np.ndarray) -> str:
+    order = np.argsort(keys, kind="stable")
+    digest = hashlib.sha1("\x00".join(keys[order].tolist()).encode())
+    digest.update(np.ascontiguousarray(matrix[order]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class IndustryStats:
+    """
+    Per-industry distribution of every numeric StockData metric
+
+    Holds a (industry, metric, stat) table plus each group's sorted values,
+    so percentiles and z-scores for any company are a binary search away.
+    """
+
+    def __init__(self, version: str, industries: List[str], stats: np.ndarray,
+                 values: np.ndarray, offsets: np.ndarray, hashes: List[str]):
+        self.version = version
+        self.industries = industries
+        self.stats = stats
+        self.values = values
+        self.offsets = offsets
+        self.hashes = hashes
+        self.by_industry = {industry.lower(): i for i, industry in enumerate(industries)}
+        # Industries carried over unchanged by the last build
+        self.reused = len(industries)
+
+    @classmethod
+    def build(cls, snapshot: ColumnarSnapshot, previous: Optional["IndustryStats"] = None,
+              changed: Optional[set] = None) -> "IndustryStats":
+        """
+        Recompute only industries whose rows changed since `previous`
+
+        `changed` names the industries a dataset diff touched; the others are
+        reused without hashing their rows.
+        """
+        industry_column = np.asarray(snapshot.column("industry"))
+        keys = np.char.add(np.char.add(np.asarray(snapshot.column("nse_code")), "|"), np.asarray(snapshot.column("name")))
+        matrix = np.column_stack([np.asarray(snapshot.column(metric), dtype=np.float64) for metric in METRICS])
+
+        industries = sorted({industry for industry in industry_column.tolist() if industry})
+        codes = {industry: i for i, industry in enumerate(industries)}
+        group_of = np.array([codes.get(industry, -1) for industry in industry_column.tolist()])
+        old = {industry: i for i, industry in enumerate(previous.industries)} if previous is not None else {}
+
+        stats = np.empty((len(industries), len(METRICS), len(STATS)), dtype=np.float32)
+        chunks, hashes, reused = [], [], 0
+        for g, industry in enumerate(industries):
+            rows = np.flatnonzero(group_of == g)
+            p = old.get(industry)
+            if p is not None and changed is not None and industry not in changed:
+                group_hash = previous.hashes[p]
+            else:
+                group_hash = _group_hash(keys[rows], matrix[rows])
+            hashes.append(group_hash)
+            if p is not None and previous.hashes[p] == group_hash:
+                stats[g] = previous.stats[p]
+                chunks.extend(previous.sorted_values(p, m) for m in range(len(METRICS)))
+                reused += 1
+                continue
+            stats[g], group_values = _group_stats(matrix[rows])
+            chunks.extend(group_values)
+
+        offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(chunk) for chunk in chunks])
+        values = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+        result = cls(snapshot.version, industries, stats, values, offsets, hashes)
+        result.reused = reused
+        return result
+
+    def sorted_values(self, group: int, metric: int) -> np.ndarray:
+        slot = group * len(METRICS) + metric
+        return self.values[self.offsets[slot]:self.offsets[slot + 1]]
+
+    def save(self, path: Path = INDUSTRY_STATS_PATH) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(tmp, version=self.version, industries=np.array(self.industries, dtype=str), stats=self.stats,
+                 values=self.values, offsets=self.offsets, hashes=np.array(self.hashes, dtype=str),
+                 metrics=np.array(METRICS, dtype=str))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path = INDUSTRY_STATS_PATH) -> Optional["IndustryStats"]:
+        if not path.exists():
+            return None
+        data = np.load(path)
+        if data["metrics"].tolist() != METRICS:
+            return None
+        return cls(str(data["version"]), data["industries"].tolist(), data["stats"], data["values"],
+                   data["offsets"], data["hashes"].tolist())
+
+    def summary(self, industry: str) -> Optional[Dict[str, Dict[str, float]]]:
+        g = self.by_industry.get(industry.strip().lower())
+        if g is None:
+            return None
+        return {
+            metric: {stat: round(float(value), 4) for stat, value in zip(STATS, self.stats[g, m])}
+            for m, metric in enumerate(METRICS)
+        }
+
+    def compare(self, stock_data: StockData) -> Optional[PeerComparison]:
+        """Where each of the company's metrics sits among its industry peers"""
+        g = self.by_industry.get((stock_data.industry or "").strip().lower())
+        if g is None:
+            return None
+        metrics = {}
+        for m, metric in enumerate(METRICS):
+            value = getattr(stock_data, metric)
+            peers = self.sorted_values(g, m)
+            if value is None or len(peers) < 2:
+                continue
+            # Peers are stored as float32, so compare at that precision for ties with itself
+            below = np.searchsorted(peers, np.float32(value), side="left")
+            through = np.searchsorted(peers, np.float32(value), side="right")
+            _, mean, std, _, q1, median, q3, _ = self.stats[g, m]
+            metrics[metric] = PeerMetric(
+                value=value,
+                industry_median=round(float(median), 4),
+                q1=round(float(q1), 4),
+                q3=round(float(q3), 4),
+                percentile=round(100 * (below + 0.5 * (through - below)) / len(peers), 1),
+                zscore=round(float((value - mean) / std), 2) if std > 0 else None,
+            )
+        return PeerComparison(industry=self.industries[g], peers=int(self.stats[g, :, 0].max()), metrics=metrics)
+
+
+def refresh(snapshot: Optional[ColumnarSnapshot] = None, path: Path = INDUSTRY_STATS_PATH,
+            diff: Optional[DatasetDiff] = None) -> IndustryStats:
+    """Bring the stored table up to date with the snapshot, reusing unchanged industries"""
+    snapshot = snapshot or get_snapshot()
+    previous = IndustryStats.load(path)
+    if previous is not None and previous.version == snapshot.version:
+        return previous
+    # The diff only says what changed if the stored table is the version it was taken against
+    changed = set(diff.industries) if diff is not None and previous is not None and previous.version == diff.previous else None
+    stats = IndustryStats.build(snapshot, previous, changed)
+    stats.save(path)
+    return stats
+
+
+@warm_on_swap
+def get_industry_stats() -> IndustryStats:
+    """Shared table for this process and dataset version; a new version only recomputes the industries it changed"""
+    return current_version().derived("industry_stats", lambda version: refresh(version.snapshot, diff=version.diff()))
+
+
+if __name__ == "__main__":
+    stats = refresh()
+    print(f"✅ Industry stats {stats.version}: {len(stats.industries)} industries x {len(METRICS)} metrics "
+          f"({stats.reused} unchanged)")
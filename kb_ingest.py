@@ -0,0 +1,132 @@
+import os
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from pydantic import BaseModel
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql
+from agno.document import Document
+from agno.embedder.base import Embedder
+from agno.embedder.openai import OpenAIEmbedder
+from agno.knowledge.agent import AgentKnowledge
+from agno.utils.log import logger
+from row_reader import RowCSVReader, content_hash
+
+EMBED_BATCH_SIZE = int(os.getenv("KB_EMBED_BATCH_SIZE", 100))
+
+
+class IngestStats(BaseModel):
+    added: int = 0
+    changed: int = 0
+    removed: int = 0
+    unchanged: int = 0
+
+
+def embed_batch(embedder: Embedder, texts: List[str]) -> List[List[float]]:
+    """One embeddings request per batch where the provider supports list input"""
+    if isinstance(embedder, OpenAIEmbedder):
+        response = embedder.response(text=texts)  # type: ignore[arg-type]
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    return [embedder.get_embedding(text) for text in texts]
+
+
+def stored_hashes(vector_db) -> Dict[str, str]:
+    """Document id -> content hash for everything already in the vector store"""
+    if hasattr(vector_db, "content_hashes"):
+        return vector_db.content_hashes()
+    with vector_db.Session() as sess:
+        rows = sess.execute(select(vector_db.table.c.id, vector_db.table.c.content_hash))
+        return {row.id: row.content_hash for row in rows}
+
+
+def write_embedded(vector_db, documents: List[Document]) -> None:
+    """Upsert documents whose embeddings are already set, keyed by document id"""
+    if hasattr(vector_db, "write_embedded"):
+        vector_db.write_embedded(documents)
+        return
+    records = [
+        {
+            "id": doc.id,
+            "name": doc.name,
+            "meta_data": doc.meta_data,
+            "filters": None,
+            "content": doc.content,
+            "embedding": doc.embedding,
+            "usage": doc.usage,
+            "content_hash": content_hash(doc),
+        }
+        for doc in documents
+    ]
+    stmt = postgresql.insert(vector_db.table).values(records)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["id"],
+        set_={column: stmt.excluded[column] for column in ("name", "meta_data", "content", "embedding", "usage", "content_hash")},
+    )
+    with vector_db.Session() as sess:
+        sess.execute(stmt)
+        sess.commit()
+
+
+def delete_ids(vector_db, ids: Iterable[str]) -> None:
+    ids = list(ids)
+    if not ids:
+        return
+    if hasattr(vector_db, "delete_ids"):
+        vector_db.delete_ids(ids)
+        return
+    with vector_db.Session() as sess:
+        sess.execute(delete(vector_db.table).where(vector_db.table.c.id.in_(ids)))
+        sess.commit()
+
+
+def ingest(knowledge_base: AgentKnowledge, batch_size: int = EMBED_BATCH_SIZE, path: Optional[Path] = None) -> IngestStats:
+    """
+    Bring the vector store in line with the CSV, embedding only new or changed rows
+
+    Each row is stored under a stable id (its ticker) with its content hash,
+    so unchanged rows are skipped and edited rows replace their old vector.
+    `path` overrides the knowledge base's CSV, e.g. with a newly published dataset version.
+    """
+    vector_db = knowledge_base.vector_db
+    if not vector_db.exists():
+        vector_db.create()
+
+    documents = RowCSVReader().read(path or Path(knowledge_base.path))
+    stored = stored_hashes(vector_db)
+
+    stats = IngestStats()
+    pending = []
+    for doc in documents:
+        previous = stored.get(doc.id)
+        if previous == content_hash(doc):
+            stats.unchanged += 1
+            continue
+        pending.append(doc)
+        if previous is None:
+            stats.added += 1
+        else:
+            stats.changed += 1
+
+    # The local store saves and re-indexes once for the whole sync rather than per batch
+    with vector_db.batch() if hasattr(vector_db, "batch") else nullcontext():
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            for doc, embedding in zip(batch, embed_batch(vector_db.embedder, [doc.content for doc in batch])):
+                doc.embedding = embedding
+            write_embedded(vector_db, batch)
+            logger.info(f"Upserted {start + len(batch)}/{len(pending)} changed rows")
+
+        current_ids = {doc.id for doc in documents}
+        removed = [doc_id for doc_id in stored if doc_id not in current_ids]
+        delete_ids(vector_db, removed)
+    stats.removed = len(removed)
+    return stats
+
+
+if __name__ == "__main__":
+    # Offline job, so serving processes never need to touch the embedder
+    from knowledge_base import knowledge_base
+
+    print("🔄 Syncing knowledge base with the CSV...")
+    stats = ingest(knowledge_base)
+    print(f"✅ Knowledge base synced: {stats.added} added, {stats.changed} changed, {stats.removed} removed, {stats.unchanged} unchanged")
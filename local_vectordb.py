@@ -0,0 +1,365 @@
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import numpy as np
+from agno.document import Document
+from agno.embedder.base import Embedder
+from agno.utils.log import log_debug, log_info
+from agno.vectordb.base import VectorDb
+from columnar_store import prune_builds, staging_dir, swap_in
+from row_reader import content_hash
+
+LOCAL_VECTOR_DIR = Path(os.getenv("LOCAL_VECTOR_DIR", ".vectors"))
+
+# Below this many rows a brute-force scan is as fast as probing clusters
+IVF_MIN_ROWS = 2048
+IVF_ITERATIONS = 10
+# New rows are assigned to the existing clusters until the row count drifts this far from the last k-means
+IVF_REBUILD_DRIFT = float(os.getenv("IVF_REBUILD_DRIFT", 0.2))
+QUERY_CACHE_SIZE = 256
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def build_ivf(embeddings: np.ndarray, nlist: int, seed: int = 0):
+    """Spherical k-means; returns centroids plus rows grouped by cluster with offsets"""
+    rng = np.random.default_rng(seed)
+    centroids = embeddings[rng.choice(len(embeddings), size=nlist, replace=False)].copy()
+    for _ in range(IVF_ITERATIONS):
+        assignments = np.argmax(embeddings @ centroids.T, axis=1)
+        for cluster in range(nlist):
+            members = embeddings[assignments == cluster]
+            if len(members):
+                centroids[cluster] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    centroids = centroids.astype(np.float32)
+    return (centroids, *assign_ivf(embeddings, centroids))
+
+
+def assign_ivf(embeddings: np.ndarray, centroids: np.ndarray):
+    """Rows grouped by their nearest existing centroid, with offsets"""
+    assignments = np.argmax(embeddings @ centroids.T, axis=1)
+    order = np.argsort(assignments, kind="stable").astype(np.int32)
+    offsets = np.searchsorted(assignments[order], np.arange(len(centroids) + 1)).astype(np.int32)
+    return order, offsets
+
+
+class VectorState:
+    """
+    Documents, embeddings and IVF index of one save
+
+    Never changed after it is built. A reload replaces the whole object in one
+    assignment, so a reader that took it once sees rows, vectors and clusters
+    from the same save.
+    """
+
+    def __init__(
+        self,
+        documents: List[Dict[str, Any]],
+        embeddings: np.ndarray,
+        centroids: Optional[np.ndarray] = None,
+        ivf_order: Optional[np.ndarray] = None,
+        ivf_offsets: Optional[np.ndarray] = None,
+        ivf_rows: int = 0,
+    ):
+        self.documents = documents
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.ivf_order = ivf_order
+        self.ivf_offsets = ivf_offsets
+        # Row count when the centroids were last fitted
+        self.ivf_rows = ivf_rows
+        self.row_by_id: Dict[str, int] = {doc["id"]: row for row, doc in enumerate(documents)}
+
+    @classmethod
+    def read(cls, path: Path) -> "VectorState":
+        documents = json.loads((path / "documents.json").read_text(encoding="utf-8"))
+        embeddings = np.load(path / "embeddings.npy", mmap_mode="r")
+        if not (path / "ivf.npz").exists():
+            return cls(documents, embeddings)
+        ivf = np.load(path / "ivf.npz")
+        rows = int(ivf["rows"]) if "rows" in ivf else len(documents)
+        return cls(documents, embeddings, ivf["centroids"], ivf["order"], ivf["offsets"], rows)
+
+
+class LocalVectorDb(VectorDb):
+    """
+    In-process cosine-similarity index persisted under LOCAL_VECTOR_DIR
+
+    Embeddings live in a memory-mapped float32 matrix with an IVF (k-means)
+    index on top. The search interface matches PgVector. Writes made inside
+    batch() are saved once when it exits.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        path: Path = LOCAL_VECTOR_DIR,
+        embedder: Optional[Embedder] = None,
+        nprobe: int = 8,
+    ):
+        if embedder is None:
+            from agno.embedder.openai import OpenAIEmbedder
+
+            embedder = OpenAIEmbedder()
+            log_info("Embedder not provided, using OpenAIEmbedder as default.")
+        self.table_name = table_name
+        self.path = Path(path) / table_name
+        self.embedder: Embedder = embedder
+        self.dimensions: Optional[int] = embedder.dimensions
+        self.nprobe = nprobe
+
+        self._lock = threading.Lock()
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # Upserts and deletes waiting for the end of a batch()
+        self._batch_depth = 0
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_vectors: List[np.ndarray] = []
+        self._pending_deletes: set = set()
+        self._load()
+
+    # --- Storage ---
+    def _load(self) -> None:
+        if not self.exists():
+            self.state = VectorState([], np.zeros((0, self.dimensions or 0), dtype=np.float32))
+            return
+        # Resolve the link once, so every file comes from the same save
+        self.state = VectorState.read(self.path.resolve())
+        log_debug(f"Loaded {len(self.state.documents)} vectors from {self.path}")
+
+    @property
+    def documents(self) -> List[Dict[str, Any]]:
+        return self.state.documents
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        return self.state.embeddings
+
+    def _save(self, documents: List[Dict[str, Any]], embeddings: np.ndarray, rebuild: bool = False) -> None:
+        tmp = staging_dir(self.path)
+        (tmp / "documents.json").write_text(json.dumps(documents), encoding="utf-8")
+        np.save(tmp / "embeddings.npy", embeddings.astype(np.float32))
+        if len(embeddings) >= IVF_MIN_ROWS:
+            np.savez(tmp / "ivf.npz", **self._index(embeddings, rebuild))
+        # The directory is swapped in behind a symlink; readers that mapped the
+        # old files keep them until they reload
+        swap_in(tmp, self.path, "v")
+        self._load()
+
+    def _index(self, embeddings: np.ndarray, rebuild: bool) -> Dict[str, np.ndarray]:
+        state = self.state
+        drifted = abs(len(embeddings) - state.ivf_rows) > IVF_REBUILD_DRIFT * state.ivf_rows
+        if rebuild or drifted or state.centroids is None or state.centroids.shape[1] != embeddings.shape[1]:
+            centroids, order, offsets = build_ivf(embeddings, nlist=int(np.sqrt(len(embeddings))))
+            rows = len(embeddings)
+        else:
+            centroids, rows = state.centroids, state.ivf_rows
+            order, offsets = assign_ivf(embeddings, centroids)
+        return {"centroids": centroids, "order": order, "offsets": offsets, "rows": np.int64(rows)}
+
+    @contextmanager
+    def batch(self):
+        """Hold writes in memory and save them, and refit the index if needed, once at the end"""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending and not self._pending_deletes:
+            return
+        state = self.state
+        stored = list(state.documents)
+        matrix = np.array(state.embeddings, dtype=np.float32)
+        rows = {doc["id"]: row for row, doc in enumerate(stored)}
+        new_vectors = []
+        for record, vector in zip(self._pending, self._pending_vectors):
+            if record["id"] in rows:
+                stored[rows[record["id"]]] = record
+                matrix[rows[record["id"]]] = vector
+            else:
+                rows[record["id"]] = len(stored)
+                stored.append(record)
+                new_vectors.append(vector)
+        if new_vectors:
+            matrix = np.vstack([matrix.reshape(-1, len(new_vectors[0])), np.stack(new_vectors)])
+        if self._pending_deletes:
+            keep = [row for row, doc in enumerate(stored) if doc["id"] not in self._pending_deletes]
+            stored, matrix = [stored[row] for row in keep], matrix[keep]
+        self._pending, self._pending_vectors, self._pending_deletes = [], [], set()
+        self._save(stored, matrix)
+
+    def _write(self, documents: List[Document]) -> None:
+        # Embedding is the slow part, so it happens outside the lock
+        records, vectors = [], []
+        for doc in documents:
+            if doc.embedding is None:
+                doc.embed(embedder=self.embedder)
+            records.append({
+                "id": doc.id or content_hash(doc),
+                "name": doc.name,
+                "content": doc.content,
+                "meta_data": doc.meta_data or {},
+                "content_hash": content_hash(doc),
+            })
+            vectors.append(_normalize(np.asarray(doc.embedding, dtype=np.float32)))
+        with self._lock:
+            self._pending.extend(records)
+            self._pending_vectors.extend(vectors)
+            if self._batch_depth == 0:
+                self._flush()
+
+    # --- Hooks used by kb_ingest ---
+    def content_hashes(self) -> Dict[str, str]:
+        return {doc["id"]: doc["content_hash"] for doc in self.documents}
+
+    def write_embedded(self, documents: List[Document]) -> None:
+        self._write(documents)
+
+    def delete_ids(self, ids: List[str]) -> None:
+        with self._lock:
+            self._pending_deletes.update(ids)
+            if self._batch_depth == 0:
+                self._flush()
+
+    # --- VectorDb interface ---
+    def create(self) -> None:
+        if not self.exists():
+            with self._lock:
+                self._save([], np.zeros((0, self.dimensions or 0), dtype=np.float32))
+
+    async def async_create(self) -> None:
+        self.create()
+
+    def exists(self) -> bool:
+        return (self.path / "documents.json").exists()
+
+    async def async_exists(self) -> bool:
+        return self.exists()
+
+    def doc_exists(self, document: Document) -> bool:
+        return content_hash(document) in {doc["content_hash"] for doc in self.documents}
+
+    async def async_doc_exists(self, document: Document) -> bool:
+        return self.doc_exists(document)
+
+    def name_exists(self, name: str) -> bool:
+        return any(doc["name"] == name for doc in self.documents)
+
+    async def async_name_exists(self, name: str) -> bool:
+        return self.name_exists(name)
+
+    def id_exists(self, id: str) -> bool:
+        return id in self.state.row_by_id
+
+    def insert(self, documents: List[Document], filters: Optional[Dict[str, Any]] = None) -> None:
+        self._write(documents)
+
+    async def async_insert(self, documents: List[Document], filters: Optional[Dict[str, Any]] = None) -> None:
+        self.insert(documents, filters)
+
+    def upsert_available(self) -> bool:
+        return True
+
+    def upsert(self, documents: List[Document], filters: Optional[Dict[str, Any]] = None) -> None:
+        self._write(documents)
+
+    async def async_upsert(self, documents: List[Document], filters: Optional[Dict[str, Any]] = None) -> None:
+        self.upsert(documents, filters)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        # Repeated queries skip the embedder round trip; tool threads share the cache
+        with self._lock:
+            vector = self._query_cache.get(query)
+            if vector is not None:
+                self._query_cache.move_to_end(query)
+                return vector
+        vector = _normalize(np.asarray(self.embedder.get_embedding(query), dtype=np.float32))
+        with self._lock:
+            self._query_cache[query] = vector
+            if len(self._query_cache) > QUERY_CACHE_SIZE:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def _candidate_rows(self, state: VectorState, vector: np.ndarray) -> Optional[np.ndarray]:
+        if state.centroids is None:
+            return None
+        clusters = np.argsort(-(state.centroids @ vector))[: self.nprobe]
+        return np.concatenate([state.ivf_order[state.ivf_offsets[c]:state.ivf_offsets[c + 1]] for c in clusters])
+
+    def search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        # One state for the whole search, however many saves land meanwhile
+        state = self.state
+        if not state.documents:
+            return []
+        vector = self.embed_query(query)
+        if filters:
+            # Filtered sets are small, score them exactly instead of probing clusters
+            rows = np.array([row for row, doc in enumerate(state.documents)
+                             if all(doc["meta_data"].get(k) == v for k, v in filters.items())], dtype=np.int64)
+        else:
+            rows = self._candidate_rows(state, vector)
+        if rows is None:
+            scores = state.embeddings @ vector
+            rows = np.arange(len(scores))
+        else:
+            scores = state.embeddings[rows] @ vector
+        top = np.argsort(-scores)[:limit]
+        return [self._document(state.documents[int(rows[i])], float(scores[i])) for i in top]
+
+    def score_ids(self, query: str, ids: List[str]) -> Dict[str, float]:
+        """Cosine similarity for a given candidate set, used by hybrid search"""
+        state = self.state
+        present = [doc_id for doc_id in ids if doc_id in state.row_by_id]
+        if not present:
+            return {}
+        rows = [state.row_by_id[doc_id] for doc_id in present]
+        scores = state.embeddings[rows] @ self.embed_query(query)
+        return {doc_id: float(score) for doc_id, score in zip(present, scores)}
+
+    async def async_search(self, query: str, limit: int = 5, filters: Optional[Dict[str, Any]] = None) -> List[Document]:
+        return self.search(query, limit, filters)
+
+    def _document(self, doc: Dict[str, Any], score: float) -> Document:
+        return Document(
+            id=doc["id"],
+            name=doc["name"],
+            content=doc["content"],
+            meta_data={**doc["meta_data"], "similarity": round(score, 4)},
+            embedder=self.embedder,
+        )
+
+    def drop(self) -> None:
+        with self._lock:
+            if self.path.is_symlink():
+                self.path.unlink()
+            else:
+                shutil.rmtree(self.path, ignore_errors=True)
+            prune_builds(self.path, keep=0)
+            self._load()
+
+    async def async_drop(self) -> None:
+        self.drop()
+
+    def optimize(self) -> None:
+        # Refits the IVF clusters to the current vectors
+        with self._lock:
+            state = self.state
+            self._save(list(state.documents), np.asarray(state.embeddings), rebuild=True)
+
+    def delete(self) -> bool:
+        self.drop()
+        return True
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+from weakref import WeakKeyDictionary
+from cache_store import TTLCache
+from models import MetaPrompt
+
+# Industry research goes stale slowly, one expensive call per industry per day is plenty
+META_PROMPT_TTL = float(os.getenv("META_PROMPT_TTL", 24 * 3600))
+# Remembers when an industry's framework was replaced, at least as long as anything made with the old one is kept
+META_PROMPT_REPLACED_TTL = float(os.getenv("META_PROMPT_REPLACED_TTL", 30 * 24 * 3600))
+
+
+def industry_key(industry: str) -> str:
+    return " ".join(industry.lower().split())
+
+
+class MetaPromptCache:
+    """Industry-keyed MetaPrompt cache that also collapses concurrent misses into one call"""
+
+    def __init__(self, ttl: float = META_PROMPT_TTL):
+        self.store = TTLCache("meta_prompts", ttl=ttl, max_entries=500)
+        # industry -> when a live MetaPrompt was last replaced by a different one
+        self.replaced = TTLCache("meta_prompt_replaced", ttl=META_PROMPT_REPLACED_TTL, max_entries=500)
+        self._locks: Dict[str, threading.Lock] = {}
+        # asyncio locks belong to one event loop, so each loop gets its own per industry
+        self._async_locks: "WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Lock]]" = WeakKeyDictionary()
+        self._guard = threading.Lock()
+
+    def get(self, industry: str) -> Optional[MetaPrompt]:
+        value = self.store.get(industry_key(industry))
+        return MetaPrompt(**value) if value else None
+
+    def set(self, industry: str, meta: MetaPrompt) -> None:
+        key, value = industry_key(industry), meta.model_dump()
+        previous = self.store.peek(key)
+        # Regenerating an expired framework is not a replacement
+        if previous is not None and previous != value:
+            self.replaced.set(key, time.time())
+        self.store.set(key, value)
+
+    def replaced_at(self, industry: str) -> float:
+        """When the industry's framework last changed under live entries, 0 if it never has"""
+        return self.replaced.peek(industry_key(industry)) or 0.0
+
+    def get_or_create(self, industry: str, create: Callable[[str], Optional[MetaPrompt]]) -> Optional[MetaPrompt]:
+        with self._guard:
+            lock = self._locks.setdefault(industry_key(industry), threading.Lock())
+        with lock:
+            meta = self.get(industry)
+            if meta is None:
+                meta = create(industry)
+                if meta is not None:
+                    self.set(industry, meta)
+            return meta
+
+    async def aget_or_create(
+        self, industry: str, create: Callable[[str], Awaitable[Optional[MetaPrompt]]]
+    ) -> Optional[MetaPrompt]:
+        with self._guard:
+            locks = self._async_locks.setdefault(asyncio.get_running_loop(), {})
+            lock = locks.setdefault(industry_key(industry), asyncio.Lock())
+        async with lock:
+            meta = self.get(industry)
+            if meta is None:
+                meta = await create(industry)
+                if meta is not None:
+                    self.set(industry, meta)
+            return meta
+
+
+_cache: Optional[MetaPromptCache] = None
+
+
+def get_meta_prompt_cache() -> MetaPromptCache:
+    """Shared cache, so concurrent workflows wait on the same industry lock"""
+    global _cache
+    if _cache is None:
+        _cache = MetaPromptCache()
+    return _cache
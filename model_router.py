@@ -0,0 +1,418 @@
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from fastapi import APIRouter
+from agno.exceptions import ModelProviderError
+from agno.models.anthropic import Claude
+from agno.models.base import Model
+from agno.models.deepseek import DeepSeek
+from agno.models.openai import OpenAIChat
+from agno.utils.log import log_debug, logger
+from tracing import current_span
+
+# Candidates per kind of work, best first when there are no stats yet; "provider:model id"
+MODEL_TIERS = {
+    # Extraction and formatting: short structured answers
+    "fast": os.getenv("ROUTER_FAST_MODELS", "deepseek:deepseek-chat,openai:gpt-4o"),
+    # Industry research and recommendations
+    "reasoning": os.getenv("ROUTER_REASONING_MODELS", "deepseek:deepseek-reasoner,anthropic:claude-3-5-sonnet-latest"),
+}
+# Tiers whose calls are latency critical enough to pay for a duplicate request
+HEDGE_TIERS = set(filter(None, os.getenv("ROUTER_HEDGE_TIERS", "fast").split(",")))
+PROVIDER_KEYS = {"deepseek": "DEEPSEEK_API_KEY", "openai": "OPENAI_API_KEY", "anthropic": "ANTHROPIC_API_KEY"}
+
+# Outcomes kept per model for latency percentiles and error rate
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", 200))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", 5))
+# Share of requests sent to a model other than the current best, so stale stats recover
+ROUTER_EXPLORE = float(os.getenv("ROUTER_EXPLORE", 0.05))
+# Expected latency is scaled by (1 + penalty * error rate)
+ROUTER_ERROR_PENALTY = float(os.getenv("ROUTER_ERROR_PENALTY", 4.0))
+# A model that failed this many times in a row sits out for the cooldown
+ROUTER_TRIP_AFTER = int(os.getenv("ROUTER_TRIP_AFTER", 3))
+ROUTER_COOLDOWN_S = float(os.getenv("ROUTER_COOLDOWN_S", 30))
+# Hedge after the primary's p90, but never sooner than this or, before there are stats, after the default
+HEDGE_MIN_DELAY_S = float(os.getenv("ROUTER_HEDGE_MIN_DELAY_S", 1.0))
+HEDGE_DEFAULT_DELAY_S = float(os.getenv("ROUTER_HEDGE_DEFAULT_DELAY_S", 8.0))
+
+_MODEL_CLASSES = {"deepseek": DeepSeek, "openai": OpenAIChat, "anthropic": Claude}
+
+
+def model_key(model: Model) -> str:
+    return f"{(model.provider or type(model).__name__).lower()}:{model.id}"
+
+
+class ModelStats:
+    """Rolling latency and outcome window for one model"""
+
+    def __init__(self, window: int = ROUTER_WINDOW):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.first_chunk: Deque[float] = deque(maxlen=window)
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.consecutive_errors = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.hedges_won = 0
+
+    def percentile(self, q: float, streaming: bool = False) -> Optional[float]:
+        values = self.first_chunk if streaming else self.latencies
+        if len(values) < ROUTER_MIN_SAMPLES:
+            return None
+        return float(np.percentile(np.fromiter(values, dtype=np.float64), q))
+
+    @property
+    def error_rate(self) -> float:
+        return 1 - sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class RouterStats:
+    """Process-wide stats shared by every routed model, keyed by provider and model id"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.models: Dict[str, ModelStats] = defaultdict(ModelStats)
+
+    def record(self, key: str, seconds: float, ok: bool, streaming: bool = False) -> None:
+        with self._lock:
+            stats = self.models[key]
+            stats.calls += 1
+            stats.outcomes.append(ok)
+            if ok:
+                (stats.first_chunk if streaming else stats.latencies).append(seconds)
+                stats.consecutive_errors = 0
+                return
+            stats.consecutive_errors += 1
+            if stats.consecutive_errors >= ROUTER_TRIP_AFTER:
+                stats.cooldown_until = time.monotonic() + ROUTER_COOLDOWN_S
+                logger.warning(f"Router: {key} failed {stats.consecutive_errors} times, cooling down {ROUTER_COOLDOWN_S}s")
+
+    def hedge_won(self, key: str) -> None:
+        with self._lock:
+            self.models[key].hedges_won += 1
+
+    def score(self, key: str, streaming: bool = False) -> Optional[float]:
+        """Expected seconds, penalised by error rate; None until there are enough samples"""
+        with self._lock:
+            stats = self.models[key]
+            if stats.cooldown_until > time.monotonic():
+                return float("inf")
+            p50 = stats.percentile(50, streaming)
+            return None if p50 is None else p50 * (1 + ROUTER_ERROR_PENALTY * stats.error_rate)
+
+    def hedge_delay(self, key: str, streaming: bool = False) -> float:
+        with self._lock:
+            p90 = self.models[key].percentile(90, streaming)
+        return HEDGE_DEFAULT_DELAY_S if p90 is None else max(p90, HEDGE_MIN_DELAY_S)
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                key: {
+                    "calls": stats.calls,
+                    "error_rate": round(stats.error_rate, 3),
+                    "p50_s": _round(stats.percentile(50)),
+                    "p90_s": _round(stats.percentile(90)),
+                    "first_chunk_p50_s": _round(stats.percentile(50, streaming=True)),
+                    "hedges_won": stats.hedges_won,
+                    "cooling_down": stats.cooldown_until > time.monotonic(),
+                }
+                for key, stats in self.models.items()
+            }
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 3)
+
+
+_stats = RouterStats()
+# Sync hedges run the primary and the duplicate side by side
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("ROUTER_HEDGE_THREADS", 16)), thread_name_prefix="hedge")
+
+
+def get_router_stats() -> RouterStats:
+    return _stats
+
+
+@dataclass
+class RoutedModel(Model):
+    """
+    Model that sends each request to the candidate with the best live latency
+    and error rate, failing over to the next one on provider errors
+
+    With hedge=True a duplicate request goes to the runner-up once the chosen
+    model has taken longer than its own p90, and the first answer wins. Only
+    tool-free calls are hedged: with tools a response is the whole tool loop,
+    and a losing sync attempt could not be stopped from running it.
+    The whole tool loop of a run stays on one model, since providers format
+    tool results differently.
+    """
+
+    id: str = "router"
+    name: str = "RoutedModel"
+    provider: str = "Router"
+    candidates: List[Model] = field(default_factory=list)
+    hedge: bool = False
+
+    def __post_init__(self):
+        super().__post_init__()
+        # Agents pick the structured output mode once, so only claim what every candidate supports
+        self.supports_native_structured_outputs = all(c.supports_native_structured_outputs for c in self.candidates)
+        self.supports_json_schema_outputs = all(c.supports_json_schema_outputs for c in self.candidates)
+
+    def get_system_message_for_model(self, tools: Optional[List[Any]] = None) -> Optional[str]:
+        return self.candidates[0].get_system_message_for_model(tools)
+
+    def get_instructions_for_model(self, tools: Optional[List[Any]] = None) -> Optional[List[str]]:
+        return self.candidates[0].get_instructions_for_model(tools)
+
+    # Model declares the provider-level hooks below abstract. Routing happens a level up, in
+    # response()/aresponse() and their stream variants, which hand each request to a
+    # candidate's own implementation, so these are never reached.
+    def invoke(self, *args, **kwargs) -> Any:
+        raise NotImplementedError("RoutedModel delegates whole responses to its candidates")
+
+    async def ainvoke(self, *args, **kwargs) -> Any:
+        raise NotImplementedError("RoutedModel delegates whole responses to its candidates")
+
+    def invoke_stream(self, *args, **kwargs) -> Iterator[Any]:
+        raise NotImplementedError("RoutedModel delegates whole responses to its candidates")
+
+    async def ainvoke_stream(self, *args, **kwargs) -> AsyncIterator[Any]:
+        raise NotImplementedError("RoutedModel delegates whole responses to its candidates")
+
+    def parse_provider_response(self, response: Any, **kwargs):
+        raise NotImplementedError("RoutedModel delegates whole responses to its candidates")
+
+    def parse_provider_response_delta(self, response: Any):
+        raise NotImplementedError("RoutedModel delegates whole responses to its candidates")
+
+    def ranked(self, streaming: bool = False) -> List[Model]:
+        """Candidates by expected latency; unmeasured ones follow in configured order, cooling down ones last"""
+        scores = [_stats.score(model_key(model), streaming) for model in self.candidates]
+        order = sorted(range(len(self.candidates)), key=lambda i: (
+            scores[i] == float("inf"), scores[i] is None, scores[i] or 0.0, i))
+        ranked = [self.candidates[i] for i in order]
+        if len(ranked) > 1 and random.random() < ROUTER_EXPLORE:
+            ranked.insert(0, ranked.pop(random.randrange(1, len(ranked))))
+        return ranked
+
+    def _note(self, model: Model, hedged: bool = False, retry: bool = False) -> None:
+        log_debug(f"Router {self.id}: {model_key(model)}{' (hedge)' if hedged else ''}")
+        span = current_span()
+        if span is not None:
+            span.set(routed_model=model_key(model), hedged=hedged or None)
+            if retry:
+                # Failover after a provider error
+                span.add("retries")
+
+    def _attempt(self, model: Model, messages: list, kwargs: dict) -> Tuple[Any, list]:
+        attempt_messages = list(messages)
+        start = time.perf_counter()
+        try:
+            response = model.response(messages=attempt_messages, **kwargs)
+        except ModelProviderError:
+            _stats.record(model_key(model), time.perf_counter() - start, ok=False)
+            raise
+        _stats.record(model_key(model), time.perf_counter() - start, ok=True)
+        return response, attempt_messages
+
+    async def _aattempt(self, model: Model, messages: list, kwargs: dict) -> Tuple[Any, list]:
+        attempt_messages = list(messages)
+        start = time.perf_counter()
+        try:
+            response = await model.aresponse(messages=attempt_messages, **kwargs)
+        except ModelProviderError:
+            _stats.record(model_key(model), time.perf_counter() - start, ok=False)
+            raise
+        _stats.record(model_key(model), time.perf_counter() - start, ok=True)
+        return response, attempt_messages
+
+    def _hedges(self, ranked: List[Model], kwargs: dict) -> bool:
+        return self.hedge and len(ranked) > 1 and not kwargs.get("tools") and not kwargs.get("functions")
+
+    def response(self, messages, **kwargs):
+        ranked = self.ranked()
+        if self._hedges(ranked, kwargs):
+            result = self._hedged(ranked, messages, kwargs)
+        else:
+            result = self._failover(ranked, messages, kwargs)
+        response, attempt_messages = result
+        # The chosen attempt's assistant and tool messages become the run's history
+        messages[:] = attempt_messages
+        return response
+
+    def _failover(self, ranked: List[Model], messages: list, kwargs: dict,
+                  error: Optional[BaseException] = None) -> Tuple[Any, list]:
+        for model in ranked:
+            self._note(model, retry=error is not None)
+            try:
+                return self._attempt(model, messages, kwargs)
+            except ModelProviderError as e:
+                logger.warning(f"Router: {model_key(model)} failed, trying next candidate: {e}")
+                error = e
+        raise error
+
+    def _submit(self, model: Model, messages: list, kwargs: dict):
+        # Keep the caller's span as parent of the model and tool spans in the worker thread
+        return _executor.submit(contextvars.copy_context().run, self._attempt, model, messages, kwargs)
+
+    def _hedged(self, ranked: List[Model], messages: list, kwargs: dict) -> Tuple[Any, list]:
+        primary, backup = ranked[0], ranked[1]
+        self._note(primary)
+        futures = {self._submit(primary, messages, kwargs): primary}
+        done, _ = wait(futures, timeout=_stats.hedge_delay(model_key(primary)))
+        if not done:
+            self._note(backup, hedged=True)
+            futures[self._submit(backup, messages, kwargs)] = backup
+        pending = set(futures)
+        error: Optional[Exception] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self._note(futures[future], hedged=len(futures) > 1)
+                    if futures[future] is backup:
+                        _stats.hedge_won(model_key(backup))
+                    # The slower attempt finishes in the background and only feeds the stats
+                    return future.result()
+                error = future.exception()
+        if len(futures) == 1:
+            # The primary failed before the hedge delay: fall over to the rest in order
+            return self._failover(ranked[1:], messages, kwargs, error)
+        raise error
+
+    async def aresponse(self, messages, **kwargs):
+        ranked = self.ranked()
+        if self._hedges(ranked, kwargs):
+            response, attempt_messages = await self._ahedged(ranked, messages, kwargs)
+        else:
+            response, attempt_messages = await self._afailover(ranked, messages, kwargs)
+        messages[:] = attempt_messages
+        return response
+
+    async def _afailover(self, ranked: List[Model], messages: list, kwargs: dict,
+                         error: Optional[BaseException] = None) -> Tuple[Any, list]:
+        for model in ranked:
+            self._note(model, retry=error is not None)
+            try:
+                return await self._aattempt(model, messages, kwargs)
+            except ModelProviderError as e:
+                logger.warning(f"Router: {model_key(model)} failed, trying next candidate: {e}")
+                error = e
+        raise error
+
+    async def _ahedged(self, ranked: List[Model], messages: list, kwargs: dict) -> Tuple[Any, list]:
+        primary, backup = ranked[0], ranked[1]
+        self._note(primary)
+        tasks = {asyncio.create_task(self._aattempt(primary, messages, kwargs)): primary}
+        done, _ = await asyncio.wait(tasks, timeout=_stats.hedge_delay(model_key(primary)))
+        if not done:
+            self._note(backup, hedged=True)
+            tasks[asyncio.create_task(self._aattempt(backup, messages, kwargs))] = backup
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._note(tasks[task], hedged=len(tasks) > 1)
+                        if tasks[task] is backup:
+                            _stats.hedge_won(model_key(backup))
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        if len(tasks) == 1:
+            return await self._afailover(ranked[1:], messages, kwargs, error)
+        raise error
+
+    def response_stream(self, messages, **kwargs):
+        # Streams fail over only before their first chunk; after that the client already has output
+        error: Optional[Exception] = None
+        for model in self.ranked(streaming=True):
+            self._note(model, retry=error is not None)
+            start = time.perf_counter()
+            stream = model.response_stream(messages=messages, **kwargs)
+            try:
+                first = next(stream)
+            except StopIteration:
+                _stats.record(model_key(model), time.perf_counter() - start, ok=True, streaming=True)
+                return
+            except ModelProviderError as e:
+                _stats.record(model_key(model), time.perf_counter() - start, ok=False, streaming=True)
+                logger.warning(f"Router: {model_key(model)} failed, trying next candidate: {e}")
+                error = e
+                continue
+            _stats.record(model_key(model), time.perf_counter() - start, ok=True, streaming=True)
+            yield first
+            yield from stream
+            return
+        raise error
+
+    async def aresponse_stream(self, messages, **kwargs):
+        error: Optional[Exception] = None
+        for model in self.ranked(streaming=True):
+            self._note(model, retry=error is not None)
+            start = time.perf_counter()
+            stream = model.aresponse_stream(messages=messages, **kwargs)
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                _stats.record(model_key(model), time.perf_counter() - start, ok=True, streaming=True)
+                return
+            except ModelProviderError as e:
+                _stats.record(model_key(model), time.perf_counter() - start, ok=False, streaming=True)
+                logger.warning(f"Router: {model_key(model)} failed, trying next candidate: {e}")
+                error = e
+                continue
+            _stats.record(model_key(model), time.perf_counter() - start, ok=True, streaming=True)
+            yield first
+            async for chunk in stream:
+                yield chunk
+            return
+        raise error
+
+
+def tier_candidates(tier: str) -> List[Tuple[str, str]]:
+    """(provider, model id) pairs of a tier, dropping providers without an API key unless none have one"""
+    pairs = [tuple(entry.strip().split(":", 1)) for entry in MODEL_TIERS[tier].split(",") if entry.strip()]
+    configured = [(provider, model_id) for provider, model_id in pairs if os.getenv(PROVIDER_KEYS.get(provider, ""))]
+    return configured or pairs
+
+
+def routed_model(tier: str, prefer: Optional[str] = None, hedge: Optional[bool] = None) -> RoutedModel:
+    """
+    RoutedModel over a tier's candidates
+
+    Args:
+        tier: "fast" for extraction/formatting, "reasoning" for deep analysis
+        prefer: Model id tried first until there are stats
+        hedge: Send hedged duplicates (defaults to ROUTER_HEDGE_TIERS)
+    """
+    pairs = tier_candidates(tier)
+    if prefer is not None:
+        pairs.sort(key=lambda pair: pair[1] != prefer)
+    return RoutedModel(
+        id=f"router:{tier}",
+        candidates=[_MODEL_CLASSES[provider](id=model_id) for provider, model_id in pairs],
+        hedge=tier in HEDGE_TIERS if hedge is None else hedge,
+    )
+
+
+models_router = APIRouter(tags=["Models"])
+
+
+@models_router.get("/models/stats")
+def get_model_stats():
+    """Live latency, error rate and hedge wins per routed model in this process"""
+    return get_router_stats().summary()
@@ -0,0 +1,124 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+# Short header (text before the parenthesised description) -> StockData field
+STOCK_DATA_COLUMNS = {
+    "Name": "name",
+    "BSE Code": "bse_code",
+    "NSE Code": "nse_code",
+    "Industry": "industry",
+    "Current Price": "current_price",
+    "Price to Earning": "price_to_earning",
+    "Market Capitalization": "market_capitalization",
+    "Earnings yield": "earnings_yield",
+    "Div plus Earning Yield": "div_plus_earning_yield",
+    "CROIC": "croic",
+    "Return on assets": "return_on_assets",
+    "PEG Ratio": "peg_ratio",
+    "NPM last year": "npm_last_year",
+    "Change in promoter holding 3Years": "change_in_promoter_holding_3years",
+    "Sales growth 3Years": "sales_growth_3years",
+    "EPS growth 3Years": "eps_growth_3years",
+    "Debt to equity": "debt_to_equity",
+    "Dividend yield": "dividend_yield",
+    "Dividend Payout Ratio": "dividend_payout_ratio",
+    "Price to book value": "price_to_book_value",
+    "Pledged percentage": "pledged_percentage",
+    "EPS growth 10Years": "eps_growth_10years",
+    "Return over 1year": "return_over_1year",
+    "Return over 10years": "return_over_10years",
+}
+
+# Remaining CSV columns, kept in the columnar snapshot for screening and peer stats
+EXTRA_COLUMNS = {
+    "Return on capital employed": "return_on_capital_employed",
+    "Price to Free Cash Flow": "price_to_free_cash_flow",
+    "Price to Sales": "price_to_sales",
+    "FCF to EBIT": "fcf_to_ebit",
+    "FCF to NW": "fcf_to_nw",
+    "FCF by OpCF": "fcf_by_opcf",
+    "Sales": "sales",
+    "OPM": "opm",
+    "Profit after tax": "profit_after_tax",
+    "Sales latest quarter": "sales_latest_quarter",
+    "Profit after tax latest quarter": "profit_after_tax_latest_quarter",
+    "YOY Quarterly sales growth": "yoy_quarterly_sales_growth",
+    "YOY Quarterly profit growth": "yoy_quarterly_profit_growth",
+    "Return on equity": "return_on_equity",
+    "EPS": "eps",
+    "Debt": "debt",
+    "Promoter holding": "promoter_holding",
+    "Change in promoter holding": "change_in_promoter_holding",
+    "Industry PE": "industry_pe",
+    "Sales growth": "sales_growth",
+    "Profit growth": "profit_growth",
+    "EVEBITDA": "ev_ebitda",
+    "Enterprise Value": "enterprise_value",
+    "Current ratio": "current_ratio",
+    "Interest Coverage Ratio": "interest_coverage_ratio",
+    "Return over 3months": "return_over_3months",
+    "Return over 6months": "return_over_6months",
+    "Sales growth 5Years": "sales_growth_5years",
+    "Profit growth 3Years": "profit_growth_3years",
+    "Profit growth 5Years": "profit_growth_5years",
+    "Average return on equity 5Years": "average_return_on_equity_5years",
+    "Average return on equity 3Years": "average_return_on_equity_3years",
+    "Return over 3years": "return_over_3years",
+    "Return over 5years": "return_over_5years",
+    "Sales last year": "sales_last_year",
+}
+
+ALL_COLUMNS = {**STOCK_DATA_COLUMNS, **EXTRA_COLUMNS}
+
+# Fields that are stored as text rather than numbers
+TEXT_FIELDS = ("name", "bse_code", "nse_code", "industry")
+
+
+def short_header(header: str) -> str:
+    """Strip the parenthesised description from a verbose CSV header"""
+    return header.split(" (", 1)[0].strip()
+
+
+class StockData(BaseModel):
+    name: str = Field(..., description="Company Name as registered on stock exchanges")
+    bse_code: str = Field(..., description="Ticker symbol on Bombay Stock Exchange")
+    nse_code: str = Field(..., description="Ticker symbol on National Stock Exchange of India")
+    industry: str = Field(..., description="Sector or industry classification of the company")
+    current_price: Optional[float] = Field(..., description="Latest market price per share in INR")
+    price_to_earning: Optional[float] = Field(..., description="Price-to-Earnings ratio")
+    market_capitalization: Optional[float] = Field(..., description="Total market value of outstanding shares in INR")
+    earnings_yield: Optional[float] = Field(..., description="Annual earnings per share divided by current share price")
+    div_plus_earning_yield: Optional[float] = Field(..., description="Sum of dividend yield and earnings yield")
+    croic: Optional[float] = Field(..., description="Cash Return on Invested Capital")
+    return_on_assets: Optional[float] = Field(..., description="Net income divided by average total assets")
+    peg_ratio: Optional[float] = Field(..., description="Price/Earnings to Growth ratio")
+    npm_last_year: Optional[float] = Field(..., description="Net Profit Margin for the most recent fiscal year")
+    change_in_promoter_holding_3years: Optional[float] = Field(..., description="Three-year change in percentage points of promoter shareholding")
+    sales_growth_3years: Optional[float] = Field(..., description="Three-year compound annual growth rate of sales revenue")
+    eps_growth_3years: Optional[float] = Field(..., description="Three-year compound annual growth rate of earnings per share")
+    debt_to_equity: Optional[float] = Field(..., description="Total debt divided by shareholders equity")
+    dividend_yield: Optional[float] = Field(..., description="Annual dividend per share divided by current price")
+    dividend_payout_ratio: Optional[float] = Field(..., description="Percentage of net income distributed as dividends")
+    price_to_book_value: Optional[float] = Field(..., description="Market price divided by book value per share")
+    pledged_percentage: Optional[float] = Field(..., description="Percentage of promoter shares pledged as loan collateral")
+    eps_growth_10years: Optional[float] = Field(..., description="Ten-year compound annual growth rate of earnings per share")
+    return_over_1year: Optional[float] = Field(..., description="Total shareholder return including dividends over past 1 year")
+    return_over_10years: Optional[float] = Field(..., description="Total shareholder return including dividends over past 10 years")
+
+class MetaPrompt(BaseModel):
+    industry_context: str = Field(..., description="Industry-specific context and trends")
+    company_context: str = Field(..., description="Company-specific context and background")
+    analysis_framework: str = Field(..., description="Tailored analysis framework for this industry/company")
+    key_metrics_focus: str = Field(..., description="Most important metrics to focus on for this industry")
+    risk_factors: str = Field(..., description="Industry and company-specific risk factors to consider")
+    meta_prompt: str = Field(..., description="Complete meta prompt for stock analysis")
+
+class StockRecommendation(BaseModel):
+    recommendation: str = Field(..., description="BUY, HOLD, or SELL recommendation")
+    confidence_score: float = Field(..., description="Confidence score from 0-100")
+    target_price: Optional[float] = Field(..., description="Target price if applicable")
+    time_horizon: str = Field(..., description="Recommended investment time horizon")
+    key_strengths: list[str] = Field(..., description="Key strengths supporting the recommendation")
+    key_risks: list[str] = Field(..., description="Key risks and concerns")
+    rationale: str = Field(..., description="Detailed rationale for the recommendation")
+    alternative_scenarios: str = Field(..., description="Alternative scenarios and their implications")
@@ -0,0 +1,130 @@
+import json
+from typing import Any, List, Optional, Tuple
+
+_WHITESPACE = " \t\r\n"
+
+
+def _decode_partial_string(raw: str) -> str:
+    """Text of an unterminated JSON string body, ignoring a trailing half escape"""
+    cut, i = len(raw), 0
+    while i < len(raw):
+        if raw[i] != "\\":
+            i += 1
+            continue
+        width = 6 if raw[i + 1:i + 2] == "u" else 2
+        if i + width > len(raw):
+            cut = i
+            break
+        i += width
+    try:
+        return json.loads(f'"{raw[:cut]}"')
+    except json.JSONDecodeError:
+        return raw[:cut]
+
+
+class PartialObjectParser:
+    """
+    Incremental parser for a JSON object streamed in arbitrary chunks
+
+    feed() returns (field, value, complete) updates: complete values as soon
+    as their closing delimiter arrives, and the text so far of a top-level
+    string value that is still streaming. Leading prose or a ```json fence
+    before the opening brace is skipped. A bare value with commas in it
+    (2,500 or 1,23,456) is reported again with all its pieces once the text
+    up to the next key has arrived.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: dict = {}
+        self.done = False
+        self._pos = 0
+        self._state = "start"
+        self._key: Optional[str] = None
+        self._start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._partial = ""
+        # Start of the last bare (unquoted) value, reopened if more of it follows its comma
+        self._bare: Optional[int] = None
+
+    @property
+    def started(self) -> bool:
+        """Whether the opening brace has arrived"""
+        return self._state != "start"
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any, bool]]:
+        self.buffer += chunk
+        updates: List[Tuple[str, Any, bool]] = []
+        text = self.buffer
+        while self._pos < len(text) and not self.done:
+            char = text[self._pos]
+            if self._state == "start":
+                if char == "{":
+                    self._state = "key"
+            elif self._state == "key":
+                if char == '"':
+                    self._state, self._start = "key_string", self._pos
+                    self._bare = None
+                elif char == "}":
+                    self.done = True
+                elif char not in _WHITESPACE and char != "," and self._bare is not None:
+                    # Text where a key should be: the comma was part of the previous value
+                    self._state, self._start, self._depth = "value", self._bare, 0
+                    self._in_string, self._escaped = False, False
+                    continue
+            elif self._state == "key_string":
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._key = json.loads(text[self._start:self._pos + 1])
+                    self._state = "colon"
+            elif self._state == "colon":
+                if char == ":":
+                    self._state = "value_start"
+            elif self._state == "value_start":
+                if char not in _WHITESPACE:
+                    self._state, self._start, self._depth = "value", self._pos, 0
+                    self._in_string, self._escaped = False, False
+                    continue
+            elif self._state == "value":
+                if self._in_string:
+                    if self._escaped:
+                        self._escaped = False
+                    elif char == "\\":
+                        self._escaped = True
+                    elif char == '"':
+                        self._in_string = False
+                elif char == '"':
+                    self._in_string = True
+                elif char in "[{":
+                    self._depth += 1
+                elif char in "]}" and self._depth > 0:
+                    self._depth -= 1
+                elif self._depth == 0 and char in ",}":
+                    updates.append(self._complete(text[self._start:self._pos]))
+                    self._state = "key"
+                    if char == "}":
+                        self.done = True
+            self._pos += 1
+
+        # A top-level string still streaming: report what has arrived so far
+        if self._state == "value" and self._in_string and self._depth == 0 and text[self._start] == '"':
+            partial = _decode_partial_string(text[self._start + 1:self._pos])
+            if partial != self._partial:
+                self._partial = partial
+                updates.append((self._key, partial, False))
+        return updates
+
+    def _complete(self, raw: str) -> Tuple[str, Any, bool]:
+        self._bare = None if raw.lstrip()[:1] in ('"', "[", "{") else self._start
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError:
+            value = raw.strip()
+        self.fields[self._key] = value
+        self._partial = ""
+        return self._key, value, True
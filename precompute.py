@@ -0,0 +1,366 @@
+import argparse
+import asyncio
+import fcntl
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from agno.tools import Toolkit
+from agno.utils.log import logger
+from cache_store import CACHE_DIR, TTLCache
+from company_resolver import get_resolver
+from dataset import DatasetDiff, on_publish, pinned
+from meta_prompt_cache import get_meta_prompt_cache, industry_key
+from models import MetaPrompt, StockData, StockRecommendation
+from provider_limits import ProviderLimits
+
+# A stored recommendation is re-run after this long even if nothing it used has changed
+PRECOMPUTE_TTL = float(os.getenv("PRECOMPUTE_TTL", 7 * 24 * 3600))
+# Room for every company plus a few older versions of each
+PRECOMPUTE_MAX_ENTRIES = int(os.getenv("PRECOMPUTE_MAX_ENTRIES", 20000))
+# Request counts decay by expiring this long after a company was last asked for
+PRECOMPUTE_REQUEST_WINDOW = float(os.getenv("PRECOMPUTE_REQUEST_WINDOW", 30 * 24 * 3600))
+PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", 2))
+# Workflow runs started per minute, well below the interactive traffic's share of the provider limits
+PRECOMPUTE_RATE_PER_MIN = float(os.getenv("PRECOMPUTE_RATE_PER_MIN", 6))
+# Input plus output tokens one pass may spend
+PRECOMPUTE_TOKEN_BUDGET = int(os.getenv("PRECOMPUTE_TOKEN_BUDGET", 500_000))
+PRECOMPUTE_INTERVAL_S = float(os.getenv("PRECOMPUTE_INTERVAL_S", 3600))
+# Run passes in the background of the serving app (one process per container holds the lock)
+PRECOMPUTE_ON_STARTUP = os.getenv("PRECOMPUTE_ON_STARTUP", "false").lower() == "true"
+PRECOMPUTE_LOCK = CACHE_DIR / "precompute.lock"
+
+# Priority = log10(market cap) + weight * log(1 + requests), plus a boost for entries that went stale
+REQUEST_WEIGHT = float(os.getenv("PRECOMPUTE_REQUEST_WEIGHT", 2.0))
+STALE_BOOST = float(os.getenv("PRECOMPUTE_STALE_BOOST", 3.0))
+
+
+def ticker(stock_data: StockData) -> str:
+    return (stock_data.nse_code or stock_data.bse_code or stock_data.name).strip().upper()
+
+
+def content_hash(model: BaseModel) -> str:
+    return hashlib.sha256(json.dumps(model.model_dump(), sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class PrecomputeJob(BaseModel):
+    ticker: str
+    row_id: int
+    priority: float
+    reason: str = Field(..., description="missing, row_changed, context_stale")
+
+
+class RecommendationStore:
+    """
+    Versioned recommendations keyed by ticker and a hash of the data row they were made from
+
+    A changed row hashes differently and simply misses; evict() drops the
+    entries a new dataset version made unreachable. The industry MetaPrompt
+    used is stored with each entry, which goes stale when that framework is
+    replaced; one that merely expired and was regenerated leaves it fresh.
+    """
+
+    def __init__(self, ttl: float = PRECOMPUTE_TTL):
+        self.store = TTLCache("recommendations", ttl=ttl, max_entries=PRECOMPUTE_MAX_ENTRIES)
+        # ticker -> data hash, creation time and version of the newest entry
+        self.latest = TTLCache("recommendation_latest", ttl=ttl, max_entries=PRECOMPUTE_MAX_ENTRIES)
+        self.requests = TTLCache("recommendation_requests", ttl=PRECOMPUTE_REQUEST_WINDOW, max_entries=PRECOMPUTE_MAX_ENTRIES)
+        self.meta_prompt_cache = get_meta_prompt_cache()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(symbol: str, data_hash: str) -> str:
+        return f"{symbol}|{data_hash}"
+
+    def get(self, stock_data: StockData) -> Optional[dict]:
+        """Entry for exactly this row made since its industry framework was last replaced"""
+        entry = self.store.get(self.key(ticker(stock_data), content_hash(stock_data)))
+        if entry is None or entry["created"] < self.meta_prompt_cache.replaced_at(stock_data.industry):
+            return None
+        return entry
+
+    def put(self, stock_data: StockData, meta_prompt: MetaPrompt, recommendation: StockRecommendation,
+            tokens: int = 0) -> dict:
+        symbol, data_hash = ticker(stock_data), content_hash(stock_data)
+        with self._lock:
+            previous = self.latest.get(symbol)
+            entry = {
+                "ticker": symbol,
+                "version": (previous["version"] if previous else 0) + 1,
+                "data_hash": data_hash,
+                "created": time.time(),
+                "tokens": tokens,
+                "stock_data": stock_data.model_dump(),
+                "meta_prompt": meta_prompt.model_dump(),
+                "recommendation": recommendation.model_dump(),
+            }
+            self.store.set(self.key(symbol, data_hash), entry)
+            self.latest.set(symbol, {k: entry[k] for k in ("version", "data_hash", "created")})
+        return entry
+
+    def evict(self, diff: DatasetDiff) -> int:
+        """Drop entries of companies the diff changed or removed; the rest stay valid as they are"""
+        removed = diff.tickers(diff.removed)
+        evicted = 0
+        with self._lock:
+            for symbol in removed | diff.tickers(list(diff.changed)):
+                for key in self.store.keys(self.key(symbol, "")):
+                    self.store.delete(key)
+                    evicted += 1
+                # A changed company keeps its latest entry, so plan() queues it as row_changed
+                if symbol in removed:
+                    self.latest.delete(symbol)
+        return evicted
+
+    def record_request(self, stock_data: StockData) -> None:
+        symbol = ticker(stock_data)
+        with self._lock:
+            self.requests.set(symbol, (self.requests.get(symbol) or 0) + 1)
+
+    def plan(self) -> List[PrecomputeJob]:
+        """Every company without a fresh entry, highest priority first"""
+        resolver = get_resolver()
+        latest, requests = self.latest.items(), self.requests.items()
+        replaced: Dict[str, float] = {}
+        jobs = []
+        for row_id, row in enumerate(resolver.rows):
+            stock_data = resolver.stock_data(row_id)
+            symbol = ticker(stock_data)
+            industry = industry_key(stock_data.industry)
+            if industry not in replaced:
+                replaced[industry] = self.meta_prompt_cache.replaced_at(stock_data.industry)
+            entry = latest.get(symbol)
+            if entry is None:
+                reason = "missing"
+            elif entry["data_hash"] != content_hash(stock_data):
+                reason = "row_changed"
+            elif entry["created"] < replaced[industry]:
+                reason = "context_stale"
+            else:
+                continue
+            priority = (math.log10(1 + max(stock_data.market_capitalization or 0.0, 0.0))
+                        + REQUEST_WEIGHT * math.log1p(requests.get(symbol, 0))
+                        + (STALE_BOOST if reason != "missing" else 0.0))
+            jobs.append(PrecomputeJob(ticker=symbol, row_id=row_id, priority=round(priority, 3), reason=reason))
+        jobs.sort(key=lambda job: -job.priority)
+        return jobs
+
+    def summary(self) -> dict:
+        return {
+            "entries": len(self.latest),
+            "versions": len(self.store),
+            "hit_rate": round(self.store.hit_rate, 3),
+        }
+
+
+_store: Optional[RecommendationStore] = None
+
+
+def get_recommendation_store() -> RecommendationStore:
+    global _store
+    if _store is None:
+        _store = RecommendationStore()
+    return _store
+
+
+@on_publish
+def evict_recommendations(diff: DatasetDiff) -> None:
+    get_recommendation_store().evict(diff)
+
+
+class Precomputer:
+    """Walks the universe in priority order and runs the workflow for stale companies within rate and token budgets"""
+
+    def __init__(
+        self,
+        store: Optional[RecommendationStore] = None,
+        concurrency: int = PRECOMPUTE_CONCURRENCY,
+        rate_per_min: float = PRECOMPUTE_RATE_PER_MIN,
+        token_budget: int = PRECOMPUTE_TOKEN_BUDGET,
+        limits: Optional[Dict[str, int]] = None,
+    ):
+        self.store = store or get_recommendation_store()
+        self.concurrency = concurrency
+        self.rate_per_min = rate_per_min
+        self.token_budget = token_budget
+        self.limits = limits
+        self.status = {"running": False, "passes": 0, "planned": 0, "done": 0, "failed": 0, "tokens": 0,
+                       "in_flight": [], "last_pass": None}
+
+    async def _run_job(self, job: PrecomputeJob, provider_limits: ProviderLimits) -> Tuple[bool, int]:
+        from workflow import StockAnalysisWorkflow, analysis_agent, csv_data_agent, meta_prompt_agent
+
+        # The workflow stores its own result, so this only has to run it
+        workflow = StockAnalysisWorkflow(
+            csv_agent=csv_data_agent.deep_copy(),
+            meta_prompt_agent=meta_prompt_agent.deep_copy(),
+            analysis_agent=analysis_agent.deep_copy(),
+            provider_limits=provider_limits,
+            count_request=False,
+        )
+        self.status["in_flight"].append(job.ticker)
+        try:
+            async for _ in workflow.arun_workflow(job.ticker):
+                pass
+            ok = "recommendation" in workflow.session_state
+        except Exception as e:
+            logger.error(f"Precompute failed for {job.ticker}: {e}")
+            ok = False
+        finally:
+            self.status["in_flight"].remove(job.ticker)
+        tokens = sum(stage["input_tokens"] + stage["output_tokens"] for stage in workflow.token_report.to_dict())
+        return ok, tokens
+
+    async def run_pass(self, limit: Optional[int] = None) -> dict:
+        """One walk over the stale companies; stops starting new runs once the token budget is spent"""
+        # One dataset version for the whole pass, so runs see the rows the plan was made from
+        with pinned():
+            return await self._run_pass(limit)
+
+    async def _run_pass(self, limit: Optional[int]) -> dict:
+        jobs = self.store.plan()[:limit]
+        provider_limits = ProviderLimits(self.limits)
+        slots = asyncio.Semaphore(self.concurrency)
+        interval = 60 / self.rate_per_min if self.rate_per_min > 0 else 0.0
+        spent = {"tokens": 0, "done": 0, "failed": 0}
+        self.status.update(running=True, planned=len(jobs), done=0, failed=0, tokens=0)
+        print(f"🗓️ Precompute pass: {len(jobs)} companies need a fresh recommendation")
+
+        async def run(job: PrecomputeJob) -> None:
+            try:
+                ok, tokens = await self._run_job(job, provider_limits)
+            finally:
+                slots.release()
+            spent["tokens"] += tokens
+            spent["done" if ok else "failed"] += 1
+            self.status.update(tokens=spent["tokens"], done=spent["done"], failed=spent["failed"])
+
+        tasks = []
+        next_start = time.monotonic()
+        for job in jobs:
+            # Runs already in flight may overshoot the budget by up to `concurrency` workflows
+            if spent["tokens"] >= self.token_budget:
+                print(f"💸 Precompute token budget of {self.token_budget} spent, {len(jobs) - len(tasks)} companies left for the next pass")
+                break
+            await asyncio.sleep(max(0.0, next_start - time.monotonic()))
+            await slots.acquire()
+            next_start = time.monotonic() + interval
+            tasks.append(asyncio.create_task(run(job)))
+        await asyncio.gather(*tasks)
+
+        self.status.update(running=False, passes=self.status["passes"] + 1, last_pass=time.time())
+        print(f"✅ Precompute pass: {spent['done']} stored, {spent['failed']} failed, {spent['tokens']} tokens")
+        return {"planned": len(jobs), **spent}
+
+    async def run_forever(self, interval: float = PRECOMPUTE_INTERVAL_S) -> None:
+        while True:
+            try:
+                await self.run_pass()
+            except Exception as e:
+                logger.error(f"Precompute pass failed: {e}")
+            await asyncio.sleep(interval)
+
+
+_precomputer: Optional[Precomputer] = None
+
+
+def get_precomputer() -> Precomputer:
+    global _precomputer
+    if _precomputer is None:
+        _precomputer = Precomputer()
+    return _precomputer
+
+
+_lock_file = None
+
+
+async def start_background_precompute() -> None:
+    """Startup handler: the first process to take the lock runs passes for the whole container"""
+    global _lock_file
+    if not PRECOMPUTE_ON_STARTUP or _lock_file is not None:
+        return
+    PRECOMPUTE_LOCK.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(PRECOMPUTE_LOCK, "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return
+    _lock_file = lock_file
+    print(f"🗓️ Background precompute every {PRECOMPUTE_INTERVAL_S}s in pid {os.getpid()}")
+    asyncio.get_running_loop().create_task(get_precomputer().run_forever())
+
+
+def precomputed_report(query: str) -> Optional[dict]:
+    """Fresh stored recommendation for a ticker or company name, if there is one"""
+    stock_data = get_resolver().resolve(query)
+    if stock_data is None:
+        return None
+    return get_recommendation_store().get(stock_data)
+
+
+class RecommendationTools(Toolkit):
+    def __init__(self, **kwargs):
+        super().__init__(
+            name="recommendation_tools",
+            tools=[self.get_precomputed_recommendation],
+            instructions="Check get_precomputed_recommendation before running a full analysis of a single company; "
+                         "if it returns a recommendation, base the answer on it and mention when it was generated.",
+            add_instructions=True,
+            **kwargs,
+        )
+
+    def get_precomputed_recommendation(self, company: str) -> str:
+        """Returns the stored up-to-date recommendation for a company, if one has been precomputed
+
+        Args:
+            company (str): NSE/BSE code or company name
+
+        Returns:
+            str: JSON with the stock data and recommendation, or a message that none is available
+        """
+        entry = precomputed_report(company)
+        if entry is None:
+            return f"No up-to-date precomputed recommendation for {company}"
+        return json.dumps({k: entry[k] for k in ("ticker", "version", "created", "stock_data", "recommendation")})
+
+
+precompute_router = APIRouter(tags=["Precompute"])
+
+
+@precompute_router.get("/recommendations/{query}")
+def get_precomputed(query: str):
+    """Stored recommendation for a ticker or company name, if its data and industry context are unchanged"""
+    entry = precomputed_report(query)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"No up-to-date precomputed recommendation for {query}")
+    return entry
+
+
+@precompute_router.get("/precompute/status")
+def get_precompute_status():
+    return {**get_recommendation_store().summary(), **get_precomputer().status}
+
+
+async def _main(args) -> None:
+    precomputer = Precomputer(concurrency=args.concurrency, rate_per_min=args.rate, token_budget=args.token_budget)
+    if args.plan:
+        for job in precomputer.store.plan()[:args.limit]:
+            print(f"{job.priority:8.3f}  {job.ticker:<16} {job.reason}")
+        return
+    await precomputer.run_pass(args.limit)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute recommendations for the companies whose stored ones are stale")
+    parser.add_argument("--limit", type=int, help="Maximum companies this pass")
+    parser.add_argument("--concurrency", type=int, default=PRECOMPUTE_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=PRECOMPUTE_RATE_PER_MIN, help="Workflow runs started per minute")
+    parser.add_argument("--token-budget", type=int, default=PRECOMPUTE_TOKEN_BUDGET)
+    parser.add_argument("--plan", action="store_true", help="Print the priority order without running anything")
+    asyncio.run(_main(parser.parse_args()))
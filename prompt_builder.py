@@ -0,0 +1,208 @@
+import math
+import os
+import re
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+from agno.utils.log import log_debug
+from industry_stats import PeerComparison
+from models import MetaPrompt, StockData
+
+# Input tokens allowed for the per-company part of the analysis prompt
+ANALYSIS_TOKEN_BUDGET = int(os.getenv("ANALYSIS_TOKEN_BUDGET", 900))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# Short labels used in the compact encoding; the legend below travels in the static system prompt
+METRIC_LABELS = {
+    "current_price": "price",
+    "market_capitalization": "mcap_cr",
+    "price_to_earning": "pe",
+    "price_to_book_value": "pb",
+    "peg_ratio": "peg",
+    "earnings_yield": "ey%",
+    "div_plus_earning_yield": "div_ey%",
+    "dividend_yield": "dy%",
+    "dividend_payout_ratio": "payout%",
+    "return_on_assets": "roa%",
+    "croic": "croic%",
+    "npm_last_year": "npm%",
+    "debt_to_equity": "de",
+    "sales_growth_3years": "sales_g3y%",
+    "eps_growth_3years": "eps_g3y%",
+    "eps_growth_10years": "eps_g10y%",
+    "change_in_promoter_holding_3years": "promoter_chg3y",
+    "pledged_percentage": "pledged%",
+    "return_over_1year": "ret1y%",
+    "return_over_10years": "ret10y%",
+}
+
+ANALYSIS_INPUT_LEGEND = (
+    "Input format: '## Metrics' is label=value pairs (price INR, mcap_cr INR crore, pe P/E, pb P/B, "
+    "ey earnings yield, div_ey dividend+earnings yield, dy dividend yield, roa return on assets, "
+    "npm net profit margin last year, de debt/equity, *_g3y/*_g10y growth CAGR, promoter_chg3y promoter "
+    "holding change, ret1y/ret10y total return; % marks percentages). '## Peers' rows are "
+    "label: company value | industry median [q1, q3] | percentile within industry | z-score."
+)
+
+# Words in the meta prompt's key_metrics_focus that make a metric worth its tokens
+_METRIC_KEYWORDS = {
+    "price_to_earning": ("p/e", "pe ", "price to earning", "earnings multiple", "valuation"),
+    "price_to_book_value": ("p/b", "book value", "price to book", "valuation"),
+    "peg_ratio": ("peg", "valuation"),
+    "earnings_yield": ("earnings yield",),
+    "div_plus_earning_yield": ("yield",),
+    "dividend_yield": ("dividend",),
+    "dividend_payout_ratio": ("payout", "dividend"),
+    "return_on_assets": ("roa", "return on assets", "asset quality", "profitab"),
+    "croic": ("croic", "cash return", "cash flow", "capital efficiency"),
+    "npm_last_year": ("margin", "npm", "profitab"),
+    "debt_to_equity": ("debt", "leverage", "d/e", "balance sheet"),
+    "sales_growth_3years": ("sales", "revenue", "growth"),
+    "eps_growth_3years": ("eps", "earnings growth", "growth"),
+    "eps_growth_10years": ("eps", "long-term", "growth"),
+    "change_in_promoter_holding_3years": ("promoter", "governance", "ownership"),
+    "pledged_percentage": ("pledge", "governance", "promoter"),
+    "return_over_1year": ("momentum", "return", "performance"),
+    "return_over_10years": ("return", "long-term", "performance"),
+}
+# Always kept, whatever the industry framework focuses on
+CORE_METRICS = ("current_price", "market_capitalization", "price_to_earning", "debt_to_equity", "return_on_assets")
+
+# Shared by every CSV analyst agent (agent.py, betterAgent.py); one string per topic keeps the system prompt short
+CSV_ANALYST_INSTRUCTIONS = [
+    "CRITICAL: Only use data actually present in the CSV file; never assume or use external knowledge about companies. "
+    "If data is not available in the CSV, clearly state 'Data not available'",
+    "Workflow: examine columns with get_columns(), query the company (exact name first, then partial LIKE matching; "
+    "exact column names in double quotes), verify the data exists, then analyse only what was returned",
+    "Analysis: key financial ratios and metrics, comparisons across periods when available, significant trends, "
+    "a clear interpretation of financial health, proper financial terminology",
+    "Presentation: show CSV values unmodified with clear formatting, organise by section (Revenue, Profitability, etc.), "
+    "give context for metrics, and state the data source and time period",
+]
+
+_encoder = None
+_encoder_loaded = False
+
+
+def count_tokens(text: str) -> int:
+    """tiktoken count when its encoding is available, otherwise a ~4 chars/token estimate"""
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+
+            _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            log_debug(f"tiktoken unavailable, estimating token counts: {e}")
+    if _encoder is not None:
+        return len(_encoder.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def _number(value: float) -> str:
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def metric_relevance(meta: Optional[MetaPrompt]) -> List[str]:
+    """Numeric StockData fields, most relevant to the industry framework first"""
+    focus = f" {meta.key_metrics_focus.lower()} " if meta is not None else ""
+    order = list(METRIC_LABELS)
+
+    def score(field: str) -> tuple:
+        hits = sum(keyword in focus for keyword in _METRIC_KEYWORDS.get(field, ()))
+        return (field not in CORE_METRICS, -hits, order.index(field))
+
+    return sorted(order, key=score)
+
+
+class AnalysisPrompt(BaseModel):
+    text: str
+    tokens: int
+    section_tokens: Dict[str, int]
+    dropped: List[str] = []
+
+
+def build_analysis_prompt(
+    stock_data: StockData,
+    meta: Optional[MetaPrompt],
+    peers: Optional[PeerComparison] = None,
+    budget: int = ANALYSIS_TOKEN_BUDGET,
+) -> AnalysisPrompt:
+    """
+    Encode the analysis input compactly, industry framework first
+
+    The framework is identical for every company in an industry, so it forms
+    a stable prefix for provider prompt caching; company figures follow.
+    Without a framework (its generation failed) the prompt starts at the company.
+    Least relevant peer rows and then metrics are dropped to fit `budget`.
+    """
+    framework = "## Framework\n" + re.sub(r"[ \t]+", " ", meta.meta_prompt).strip() if meta is not None else ""
+    company = f"## Company\n{stock_data.name} | NSE {stock_data.nse_code or '-'} | BSE {stock_data.bse_code or '-'} | {stock_data.industry}"
+
+    fields = [field for field in metric_relevance(meta) if getattr(stock_data, field) is not None]
+    peer_fields = [field for field in fields if peers is not None and field in peers.metrics]
+    dropped: List[str] = []
+
+    def metrics_section() -> str:
+        pairs = [f"{METRIC_LABELS[field]}={_number(getattr(stock_data, field))}" for field in fields]
+        return "## Metrics\n" + "; ".join(pairs)
+
+    def peers_section() -> str:
+        if not peer_fields:
+            return ""
+        lines = [f"## Peers ({peers.industry}, n={peers.peers})"]
+        for field in peer_fields:
+            m = peers.metrics[field]
+            z = f" | z{m.zscore:+.2f}" if m.zscore is not None else ""
+            lines.append(f"{METRIC_LABELS[field]}: {_number(m.value)} | {_number(m.industry_median)} "
+                         f"[{_number(m.q1)}, {_number(m.q3)}] | p{m.percentile:.0f}{z}")
+        return "\n".join(lines)
+
+    def company_tokens() -> int:
+        return count_tokens("\n\n".join(part for part in (company, metrics_section(), peers_section()) if part))
+
+    # The framework is not trimmed: it is cached per industry and drives the analysis
+    while company_tokens() > budget:
+        if peer_fields:
+            dropped.append(f"peer:{peer_fields.pop()}")
+        elif len(fields) > len(CORE_METRICS):
+            dropped.append(fields.pop())
+        else:
+            break
+
+    sections = {"framework": framework, "company": company, "metrics": metrics_section(), "peers": peers_section()}
+    text = "\n\n".join(section for section in sections.values() if section)
+    return AnalysisPrompt(
+        text=text,
+        tokens=count_tokens(text),
+        section_tokens={name: count_tokens(section) for name, section in sections.items() if section},
+        dropped=dropped,
+    )
+
+
+class StageTokens(BaseModel):
+    stage: str
+    prompt_tokens: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+
+
+class TokenReport:
+    """Prompt size we sent and provider-reported usage for each workflow stage"""
+
+    def __init__(self):
+        self.stages: List[StageTokens] = []
+
+    def record(self, stage: str, prompt: Optional[str] = None, response=None) -> StageTokens:
+        entry = StageTokens(stage=stage, prompt_tokens=count_tokens(prompt) if prompt else 0)
+        metrics = getattr(response, "metrics", None) or {}
+        for key in ("input_tokens", "output_tokens", "cached_tokens"):
+            setattr(entry, key, int(sum(metrics.get(key) or [])))
+        self.stages.append(entry)
+        log_debug(f"Tokens [{stage}]: prompt~{entry.prompt_tokens} in={entry.input_tokens} "
+                  f"out={entry.output_tokens} cached={entry.cached_tokens}")
+        return entry
+
+    def to_dict(self) -> List[dict]:
+        return [entry.model_dump() for entry in self.stages]
@@ -0,0 +1,33 @@
+import asyncio
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Dict, Optional
+
+# Providers each workflow stage talks to
+STAGE_PROVIDERS = {
+    "extract": ("deepseek",),
+    "meta_prompt": ("deepseek", "tavily"),
+    "analysis": ("deepseek", "tavily"),
+}
+
+DEFAULT_LIMITS = {
+    "deepseek": int(os.getenv("DEEPSEEK_CONCURRENCY", 8)),
+    "tavily": int(os.getenv("TAVILY_CONCURRENCY", 4)),
+}
+
+
+class ProviderLimits:
+    """Per-provider semaphores shared by every task in a batch"""
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.semaphores = {provider: asyncio.Semaphore(n) for provider, n in self.limits.items()}
+
+    @asynccontextmanager
+    async def stage(self, stage: str):
+        async with AsyncExitStack() as stack:
+            # Always acquire in the same order so two stages can't deadlock
+            for provider in sorted(STAGE_PROVIDERS.get(stage, ())):
+                if provider in self.semaphores:
+                    await stack.enter_async_context(self.semaphores[provider])
+            yield
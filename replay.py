@@ -0,0 +1,468 @@
+import asyncio
+import functools
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from agno.models.anthropic import Claude
+from agno.models.deepseek import DeepSeek
+from agno.models.openai import OpenAIChat
+from agno.utils.log import log_debug, logger
+from model_router import RoutedModel
+from prompt_builder import count_tokens
+from search_cache import instrument_agents
+
+BENCH_DIR = Path(os.getenv("BENCH_DIR", "benchmarks"))
+FIXTURES_PATH = BENCH_DIR / "fixtures.jsonl"
+# Injected latency per provider when a fixture has no recorded latency (or --latency overrides it)
+DEFAULT_LATENCY_MS = {"deepseek": 1500, "openai": 800, "anthropic": 1200, "tavily": 400, "duckduckgo": 600}
+# Delay between streamed chunks after the first one
+STREAM_CHUNK_MS = float(os.getenv("BENCH_STREAM_CHUNK_MS", 15))
+# Length of synthesised free-text answers, used when no recording matches
+SYNTHETIC_WORDS = int(os.getenv("BENCH_SYNTHETIC_WORDS", 200))
+
+# Where record mode forwards model calls; the stand-ins serve the same paths
+UPSTREAMS = {
+    "deepseek": "https://api.deepseek.com/chat/completions",
+    "openai": "https://api.openai.com/v1/chat/completions",
+    "anthropic": "https://api.anthropic.com/v1/messages",
+}
+# Toolkits that call external services; local ones (CSV, screener) run for real
+REPLAYED_TOOLKITS = {"tavily_tools": "tavily", "duckduckgo": "duckduckgo"}
+
+
+def _hash(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def _block_text(content: Any) -> str:
+    """Plain text of an OpenAI or Anthropic message content field"""
+    if content is None or isinstance(content, str):
+        return content or ""
+    parts = []
+    for block in content:
+        if not isinstance(block, dict):
+            parts.append(str(block))
+        elif block.get("type") == "text":
+            parts.append(block.get("text", ""))
+        elif block.get("type") == "tool_use":
+            parts.append(json.dumps({"tool": block.get("name"), "input": block.get("input")}, sort_keys=True))
+        elif block.get("type") == "tool_result":
+            parts.append(_block_text(block.get("content")))
+    return "\n".join(parts)
+
+
+def normalize_request(provider: str, body: dict) -> Tuple[str, List[Tuple[str, str]], List[str]]:
+    """System prompt, (role, text) turns and tool names of a chat request in either wire format"""
+    messages = body.get("messages") or []
+    system = _block_text(body.get("system")) if provider == "anthropic" else ""
+    turns = []
+    for message in messages:
+        role = message.get("role", "")
+        text = _block_text(message.get("content"))
+        if message.get("tool_calls"):
+            text += json.dumps([call.get("function") for call in message["tool_calls"]], sort_keys=True)
+        if role in ("system", "developer"):
+            system += text
+        else:
+            turns.append((role, text))
+    tools = [tool.get("function", tool).get("name") for tool in body.get("tools") or []]
+    return system, turns, tools
+
+
+class FixtureStore:
+    """
+    Recorded model and tool responses, one JSON object per line
+
+    Model fixtures are matched on the exact conversation first, then on
+    the same system prompt at the same turn, so small prompt edits still
+    replay; tool fixtures on the exact arguments, then on the tool.
+    """
+
+    def __init__(self, path: Path = FIXTURES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.exact: Dict[str, dict] = {}
+        self.by_turn: Dict[str, dict] = {}
+        self.by_tool: Dict[str, dict] = {}
+        self.hits = {"exact": 0, "turn": 0, "tool": 0, "synthetic": 0}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, fixture: dict) -> None:
+        self.exact[fixture["key"]] = fixture
+        if fixture["kind"] == "model":
+            self.by_turn.setdefault(fixture["turn_key"], fixture)
+        else:
+            self.by_tool.setdefault(fixture["tool"], fixture)
+
+    @staticmethod
+    def model_keys(provider: str, model: str, body: dict) -> Tuple[str, str]:
+        system, turns, _ = normalize_request(provider, body)
+        assistant_turns = sum(role == "assistant" for role, _ in turns)
+        return _hash([provider, model, system, turns]), _hash([provider, model, system, assistant_turns])
+
+    def lookup_model(self, provider: str, model: str, body: dict) -> Optional[dict]:
+        key, turn_key = self.model_keys(provider, model, body)
+        with self._lock:
+            if key in self.exact:
+                self.hits["exact"] += 1
+                return self.exact[key]
+            if turn_key in self.by_turn:
+                self.hits["turn"] += 1
+                return self.by_turn[turn_key]
+            self.hits["synthetic"] += 1
+        return None
+
+    def lookup_tool(self, tool: str, arguments: dict) -> Optional[dict]:
+        with self._lock:
+            fixture = self.exact.get(_hash([tool, arguments])) or self.by_tool.get(tool)
+            self.hits["tool" if fixture is not None else "synthetic"] += 1
+            return fixture
+
+    def record(self, fixture: dict) -> None:
+        line = json.dumps(fixture, default=str)
+        with self._lock:
+            self._index(fixture)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class LatencyProfile:
+    """Injected delay per provider: recorded latency or the configured one, with seeded jitter"""
+
+    def __init__(self, latency_ms: Optional[Dict[str, float]] = None, jitter: float = 0.2,
+                 scale: float = 1.0, use_recorded: bool = True, seed: int = 7):
+        self.latency_ms = {**DEFAULT_LATENCY_MS, **(latency_ms or {})}
+        self.overridden = set(latency_ms or {})
+        self.jitter = jitter
+        self.scale = scale
+        self.use_recorded = use_recorded
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def seconds(self, provider: str, recorded_ms: Optional[float] = None) -> float:
+        if recorded_ms is not None and self.use_recorded and provider not in self.overridden:
+            base = recorded_ms
+        else:
+            base = self.latency_ms.get(provider, 0.0)
+        with self._lock:
+            factor = self._random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(base * self.scale * factor, 0.0) / 1000
+
+
+def _example(schema: dict, defs: dict, name: str = "") -> Any:
+    """Smallest plausible value for a JSON schema node"""
+    if "$ref" in schema:
+        return _example(defs[schema["$ref"].split("/")[-1]], defs, name)
+    for option in schema.get("anyOf") or schema.get("allOf") or []:
+        if option.get("type") != "null":
+            return _example(option, defs, name)
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: _example(value, defs, key) for key, value in (schema.get("properties") or {}).items()}
+    if kind == "array":
+        return [_example(schema.get("items") or {"type": "string"}, defs, name)]
+    if kind in ("number", "integer"):
+        return schema.get("minimum", 50 if "score" in name else 1)
+    if kind == "boolean":
+        return True
+    if "recommendation" in name:
+        return "HOLD"
+    return f"Stand-in {name.replace('_', ' ')}".strip()
+
+
+def _structured_example(system: str, user: str) -> Optional[dict]:
+    """JSON answer for an agent with a response_model, chosen by the fields its system prompt asks for"""
+    if "<json_fields>" not in system:
+        return None
+    from models import MetaPrompt, StockData, StockRecommendation
+
+    fields = system.split("<json_fields>", 1)[1].split("</json_fields>", 1)[0]
+    for model in (StockData, MetaPrompt, StockRecommendation):
+        if all(f'"{field}"' in fields for field in model.model_fields):
+            if model is StockData:
+                # Extraction answers come from the CSV itself so later stages get real figures
+                from company_resolver import get_resolver
+
+                match = get_resolver().match(user.rsplit(":", 1)[-1].strip())
+                if match is not None:
+                    return match.stock_data.model_dump()
+            schema = model.model_json_schema()
+            return _example(schema, schema.get("$defs", {}))
+    return None
+
+
+def synthesize(system: str, turns: List[Tuple[str, str]], tools: List[str]) -> dict:
+    """Deterministic stand-in reply: one search call on the first turn, then an answer"""
+    user = next((text for role, text in reversed(turns) if role == "user"), "")
+    replayed = [tool for tool in tools if tool.startswith(("web_search_using_tavily", "duckduckgo"))]
+    if replayed and not any(role == "tool" for role, _ in turns) and not any(role == "assistant" for role, _ in turns):
+        return {"content": None, "tool_calls": [{"name": replayed[0], "arguments": json.dumps({"query": user[:200]})}]}
+    structured = _structured_example(system, user)
+    if structured is not None:
+        return {"content": json.dumps(structured), "tool_calls": []}
+    words = (f"Stand-in analysis for {user[:80]}. " * SYNTHETIC_WORDS).split()[:SYNTHETIC_WORDS]
+    return {"content": " ".join(words), "tool_calls": []}
+
+
+def _parse_upstream(provider: str, data: dict) -> dict:
+    if provider == "anthropic":
+        text = "".join(block.get("text", "") for block in data.get("content", []) if block.get("type") == "text")
+        calls = [{"name": block["name"], "arguments": json.dumps(block.get("input") or {})}
+                 for block in data.get("content", []) if block.get("type") == "tool_use"]
+        usage = data.get("usage") or {}
+        return {"content": text or None, "tool_calls": calls,
+                "usage": {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)}}
+    message = data["choices"][0]["message"]
+    calls = [{"name": call["function"]["name"], "arguments": call["function"]["arguments"]}
+             for call in message.get("tool_calls") or []]
+    usage = data.get("usage") or {}
+    return {"content": message.get("content"), "tool_calls": calls,
+            "usage": {"input_tokens": usage.get("prompt_tokens", 0), "output_tokens": usage.get("completion_tokens", 0)}}
+
+
+def _chunks(text: str, size: int = 24) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+def render_openai(reply: dict, model: str) -> dict:
+    message: Dict[str, Any] = {"role": "assistant", "content": reply["content"]}
+    if reply["tool_calls"]:
+        message["tool_calls"] = [{"id": f"call_{uuid4().hex[:12]}", "type": "function",
+                                  "function": {"name": call["name"], "arguments": call["arguments"]}}
+                                 for call in reply["tool_calls"]]
+    usage = reply["usage"]
+    return {
+        "id": f"chatcmpl-{uuid4().hex}", "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if reply["tool_calls"] else "stop"}],
+        "usage": {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage["output_tokens"],
+                  "total_tokens": usage["input_tokens"] + usage["output_tokens"]},
+    }
+
+
+def stream_openai(reply: dict, model: str) -> List[str]:
+    base = {"id": f"chatcmpl-{uuid4().hex}", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+    events = [_sse({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}]})
+              for piece in (_chunks(reply["content"]) if reply["content"] else [])]
+    for i, call in enumerate(reply["tool_calls"]):
+        delta = {"tool_calls": [{"index": i, "id": f"call_{uuid4().hex[:12]}", "type": "function",
+                                 "function": {"name": call["name"], "arguments": call["arguments"]}}]}
+        events.append(_sse({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}))
+    finish = "tool_calls" if reply["tool_calls"] else "stop"
+    events.append(_sse({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": finish}]}))
+    usage = render_openai(reply, model)["usage"]
+    events.append(_sse({**base, "choices": [], "usage": usage}))
+    events.append("data: [DONE]\n\n")
+    return events
+
+
+def render_anthropic(reply: dict, model: str) -> dict:
+    content: List[dict] = [{"type": "text", "text": reply["content"]}] if reply["content"] else []
+    content += [{"type": "tool_use", "id": f"toolu_{uuid4().hex[:12]}", "name": call["name"],
+                 "input": json.loads(call["arguments"] or "{}")} for call in reply["tool_calls"]]
+    return {
+        "id": f"msg_{uuid4().hex}", "type": "message", "role": "assistant", "model": model, "content": content,
+        "stop_reason": "tool_use" if reply["tool_calls"] else "end_turn", "stop_sequence": None,
+        "usage": dict(reply["usage"]),
+    }
+
+
+def stream_anthropic(reply: dict, model: str) -> List[str]:
+    message = render_anthropic(reply, model)
+    start = {**message, "content": [], "stop_reason": None,
+             "usage": {"input_tokens": reply["usage"]["input_tokens"], "output_tokens": 0}}
+    events = [_sse({"type": "message_start", "message": start}, "message_start")]
+    for index, block in enumerate(message["content"]):
+        if block["type"] == "text":
+            events.append(_sse({"type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}},
+                               "content_block_start"))
+            events += [_sse({"type": "content_block_delta", "index": index, "delta": {"type": "text_delta", "text": piece}},
+                            "content_block_delta") for piece in _chunks(block["text"])]
+        else:
+            events.append(_sse({"type": "content_block_start", "index": index, "content_block": {**block, "input": {}}},
+                               "content_block_start"))
+            events.append(_sse({"type": "content_block_delta", "index": index,
+                                "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])}},
+                               "content_block_delta"))
+        events.append(_sse({"type": "content_block_stop", "index": index}, "content_block_stop"))
+    events.append(_sse({"type": "message_delta", "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+                        "usage": {"output_tokens": reply["usage"]["output_tokens"]}}, "message_delta"))
+    events.append(_sse({"type": "message_stop"}, "message_stop"))
+    return events
+
+
+class ProviderStandIn:
+    """
+    Local HTTP stand-in for the DeepSeek, OpenAI and Anthropic chat APIs
+
+    Replays fixtures (or synthesises a reply) after the injected latency;
+    in record mode it forwards to the real provider and stores the reply.
+    """
+
+    def __init__(self, store: FixtureStore, latency: LatencyProfile, record: bool = False):
+        self.store = store
+        self.latency = latency
+        self.record = record
+        self.requests = 0
+        self.port: Optional[int] = None
+        self._server: Optional[uvicorn.Server] = None
+        self.app = Starlette(routes=[
+            Route("/{provider}/chat/completions", self.chat_completions, methods=["POST"]),
+            Route("/{provider}/v1/chat/completions", self.chat_completions, methods=["POST"]),
+            Route("/anthropic/v1/messages", self.messages, methods=["POST"]),
+        ])
+
+    def url(self, provider: str) -> str:
+        return f"http://127.0.0.1:{self.port}/{provider}"
+
+    async def _reply(self, provider: str, request: Request) -> Tuple[dict, dict]:
+        self.requests += 1
+        body = await request.json()
+        model = body.get("model", "")
+        if self.record:
+            return body, await self._forward(provider, model, body, request)
+        fixture = self.store.lookup_model(provider, model, body)
+        if fixture is not None:
+            await asyncio.sleep(self.latency.seconds(provider, fixture.get("latency_ms")))
+            return body, fixture["reply"]
+        system, turns, tools = normalize_request(provider, body)
+        reply = synthesize(system, turns, tools)
+        prompt = system + "".join(text for _, text in turns) + json.dumps(body.get("tools") or [])
+        reply["usage"] = {"input_tokens": count_tokens(prompt),
+                          "output_tokens": count_tokens((reply["content"] or "") + json.dumps(reply["tool_calls"]))}
+        await asyncio.sleep(self.latency.seconds(provider))
+        return body, reply
+
+    async def _forward(self, provider: str, model: str, body: dict, request: Request) -> dict:
+        headers = {key: value for key, value in request.headers.items()
+                   if key.lower() in ("authorization", "x-api-key", "anthropic-version", "anthropic-beta", "content-type")}
+        start = time.perf_counter()
+        async with httpx.AsyncClient(timeout=600) as client:
+            response = await client.post(UPSTREAMS[provider], json={**body, "stream": False}, headers=headers)
+        response.raise_for_status()
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        reply = _parse_upstream(provider, response.json())
+        key, turn_key = FixtureStore.model_keys(provider, model, body)
+        self.store.record({"kind": "model", "provider": provider, "model": model, "key": key, "turn_key": turn_key,
+                           "latency_ms": latency_ms, "reply": reply})
+        return reply
+
+    async def _stream(self, events: List[str]):
+        for i, event in enumerate(events):
+            if i:
+                await asyncio.sleep(STREAM_CHUNK_MS / 1000)
+            yield event
+
+    async def chat_completions(self, request: Request):
+        provider = request.path_params["provider"]
+        body, reply = await self._reply(provider, request)
+        if body.get("stream"):
+            return StreamingResponse(self._stream(stream_openai(reply, body.get("model", ""))), media_type="text/event-stream")
+        return JSONResponse(render_openai(reply, body.get("model", "")))
+
+    async def messages(self, request: Request):
+        body, reply = await self._reply("anthropic", request)
+        if body.get("stream"):
+            return StreamingResponse(self._stream(stream_anthropic(reply, body.get("model", ""))), media_type="text/event-stream")
+        return JSONResponse(render_anthropic(reply, body.get("model", "")))
+
+    def start(self) -> "ProviderStandIn":
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        self.port = sock.getsockname()[1]
+        self._server = uvicorn.Server(uvicorn.Config(self.app, log_level="warning", lifespan="off"))
+        threading.Thread(target=self._server.run, kwargs={"sockets": [sock]}, name="provider-stand-in", daemon=True).start()
+        while not self._server.started:
+            time.sleep(0.01)
+        log_debug(f"Provider stand-in listening on {self.port}")
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+
+
+def _replayed_tool(name: str, provider: str, entrypoint, store: FixtureStore, latency: LatencyProfile, record: bool):
+    @functools.wraps(entrypoint)
+    def wrapper(*args, **kwargs):
+        if record:
+            start = time.perf_counter()
+            result = entrypoint(*args, **kwargs)
+            store.record({"kind": "tool", "tool": name, "key": _hash([name, kwargs]),
+                          "latency_ms": round((time.perf_counter() - start) * 1000, 1), "result": result})
+            return result
+        fixture = store.lookup_tool(name, kwargs)
+        # Blocking on purpose: the real toolkits block the caller the same way
+        time.sleep(latency.seconds(provider, fixture.get("latency_ms") if fixture else None))
+        if fixture is not None:
+            return fixture["result"]
+        query = kwargs.get("query", "")
+        return json.dumps([{"title": f"Stand-in result {i + 1} for {query[:60]}", "url": f"https://example.com/{i + 1}",
+                            "content": f"Recorded search results are not available for '{query[:60]}'."} for i in range(3)])
+    wrapper._replayed = True
+    wrapper._traced = False
+    return wrapper
+
+
+def _point_at_stand_in(agent, model, stand_in: ProviderStandIn) -> None:
+    """Send one provider model's requests to the stand-in"""
+    if isinstance(model, Claude):
+        model.client_params = {**(model.client_params or {}), "base_url": stand_in.url("anthropic")}
+        model.client = model.async_client = None
+        if not stand_in.record:
+            model.api_key = "replay"
+    elif isinstance(model, OpenAIChat):
+        provider = "deepseek" if isinstance(model, DeepSeek) else "openai"
+        model.base_url = stand_in.url(provider)
+        if not stand_in.record:
+            model.api_key = "replay"
+    elif model is not None:
+        logger.warning(f"No stand-in for {type(model).__name__}, {agent.name} will call the real provider")
+
+
+def install_replay(agents, stand_in: ProviderStandIn) -> None:
+    """Point every agent's model at the stand-in and swap external toolkits for replayed ones"""
+    for agent in agents:
+        models = agent.model.candidates if isinstance(agent.model, RoutedModel) else [agent.model]
+        for model in models:
+            _point_at_stand_in(agent, model, stand_in)
+
+        for tool in agent.tools or []:
+            provider = REPLAYED_TOOLKITS.get(getattr(tool, "name", ""))
+            if provider is None:
+                continue
+            for name, function in tool.functions.items():
+                entrypoint = function.entrypoint
+                if entrypoint is None or getattr(entrypoint, "_replayed", False):
+                    continue
+                # Replay beneath the tracing and search cache wrappers, so tool spans include the
+                # injected latency and the stand-in is the search backend the cache calls out to
+                while getattr(entrypoint, "_traced", False) or getattr(entrypoint, "_search_cached", False):
+                    entrypoint = entrypoint.__wrapped__
+                function.entrypoint = _replayed_tool(name, provider, entrypoint, stand_in.store,
+                                                     stand_in.latency, stand_in.record)
+        instrument_agents([agent])
@@ -0,0 +1,357 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+import numpy as np
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import Request
+from starlette.responses import StreamingResponse
+from agno.agent import Agent, RunResponse
+from agno.memory.agent import AgentMemory, AgentRun
+from agno.models.message import Message
+from agno.storage.session.agent import AgentSession
+from agno.utils.log import log_debug, logger
+from cache_store import TTLCache
+from company_resolver import get_resolver, normalize_name
+from dataset import DatasetDiff, current_version, on_publish
+from tracing import span
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 6 * 3600))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 5000))
+# Cosine similarity needed for a near-duplicate prompt to reuse a cached answer
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", 0.9))
+EMBEDDING_DIMENSIONS = 512
+
+_RUN_PATH = re.compile(r"/playground/agents/(?P<agent_id>[^/]+)/runs$")
+_WORD = re.compile(r"[a-z0-9&]+")
+# Words that change the phrasing of a request but not what is being asked
+_FILLER = {
+    "a", "an", "the", "of", "for", "me", "please", "can", "you", "could", "give", "show",
+    "stock", "stocks", "share", "shares", "company", "financials", "financial", "details",
+    "ltd", "limited",
+}
+_SPELLING = {"analyse": "analyze", "analysis": "analyze", "analyze": "analyze", "analysing": "analyze", "analyzing": "analyze"}
+# Words a near-duplicate prompt may add, drop or swap; any other difference changes the question
+_PHRASING = {
+    "what", "whats", "is", "are", "do", "does", "your", "my", "i", "to", "on", "about", "in", "and", "with",
+    "tell", "think", "view", "views", "opinion", "take", "thoughts", "how", "look", "looks", "looking",
+    "analyze", "review", "evaluate", "assess", "overview", "summary", "summarize", "report", "quick", "brief",
+    "detailed", "full", "complete", "know", "want", "would", "like", "some", "info", "information", "data",
+    "current", "latest", "now", "right", "today", "hi", "hello", "thanks", "thank", "kindly",
+    "should", "whether", "if", "it", "this", "be", "any",
+}
+_NUMBER = re.compile(r"^\d+(\.\d+)?$")
+# Longest company name (in words) looked for in a prompt
+_MAX_NAME_WORDS = 6
+
+
+def normalize_prompt(prompt: str) -> str:
+    words = [_SPELLING.get(word, word) for word in _WORD.findall(prompt.lower())]
+    return " ".join(word for word in words if word not in _FILLER)
+
+
+def prompt_anchors(normalized: str) -> frozenset:
+    """
+    What a near-duplicate must agree on exactly: resolved companies, numbers
+    and every word that is not phrasing (buy/sell, metrics, periods, ...)
+
+    Hashed embeddings score "TCS" vs "ITC" or "buy" vs "sell" prompts above
+    any useful threshold, so similarity alone never decides a hit.
+    """
+    resolver = get_resolver()
+    words = normalized.split()
+    anchors = set()
+    i = 0
+    while i < len(words):
+        # Longest run of words that is exactly a stored name or an exchange code
+        for end in range(min(len(words), i + _MAX_NAME_WORDS), i, -1):
+            text = " ".join(words[i:end])
+            row_id = resolver.by_name.get(normalize_name(text))
+            if row_id is None and end == i + 1:
+                row_id = resolver.by_nse.get(text.upper(), resolver.by_bse.get(text))
+            if row_id is not None:
+                anchors.add(f"company:{resolver.rows[row_id]['nse_code'] or resolver.rows[row_id]['bse_code']}")
+                i = end
+                break
+        else:
+            word = words[i]
+            if _NUMBER.match(word):
+                anchors.add(f"number:{float(word)}")
+            elif word not in _PHRASING:
+                anchors.add(word)
+            i += 1
+    return frozenset(anchors)
+
+
+def local_embedding(text: str) -> np.ndarray:
+    """Hashed word + character-trigram vector; cheap enough to run on every request"""
+    vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    padded = f" {text} "
+    features = text.split() + [padded[i:i + 3] for i in range(len(padded) - 2)]
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode(), digest_size=4).digest()
+        vector[int.from_bytes(digest, "little") % EMBEDDING_DIMENSIONS] += 1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class ResponseCache:
+    """
+    Agent responses keyed on agent id, user id, normalized prompt and data version
+
+    Exact matches are looked up directly; otherwise the closest cached
+    prompt for the same agent and data version is used if it is similar
+    enough and has the same prompt_anchors(). A new CSV gives a new data
+    version; carry_over() moves entries about companies it left untouched.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        similarity: float = RESPONSE_CACHE_SIMILARITY,
+        embed: Callable[[str], np.ndarray] = local_embedding,
+    ):
+        self.store = TTLCache("agent_responses", ttl=ttl, max_entries=max_entries)
+        self.similarity = similarity
+        self.embed = embed
+        self.similar_hits = 0
+        self._lock = threading.Lock()
+        # Store key -> (normalized prompt, anchors, embedding). Other workers write to the same
+        # store, so the keys are re-read on every lookup and only new ones are embedded.
+        self._entries: Dict[str, Tuple[str, frozenset, np.ndarray]] = {}
+
+    @staticmethod
+    def scope(agent_id: str, user_id: Optional[str]) -> str:
+        # Answers can draw on the user's memories, so users never share entries
+        user = hashlib.blake2b((user_id or "").encode(), digest_size=8).hexdigest()
+        return f"{agent_id}:{user}"
+
+    @staticmethod
+    def key(scope: str, version: str, normalized: str) -> str:
+        return f"{scope}|{version}|{normalized}"
+
+    def _entry(self, normalized: str) -> Tuple[str, frozenset, np.ndarray]:
+        return normalized, prompt_anchors(normalized), self.embed(normalized)
+
+    def _index(self, scope: str, version: str) -> List[Tuple[str, frozenset, np.ndarray]]:
+        """Entries of every worker for this scope and data version, as the shared store has them now"""
+        prefix = self.key(scope, version, "")
+        keys = self.store.keys(prefix)
+        with self._lock:
+            for key in keys:
+                if key not in self._entries:
+                    self._entries[key] = self._entry(key[len(prefix):])
+            # Expired or evicted entries of this scope leave the index too
+            current = set(keys)
+            for key in [key for key in self._entries if key.startswith(prefix) and key not in current]:
+                del self._entries[key]
+            return [self._entries[key] for key in keys]
+
+    def lookup(self, agent_id: str, prompt: str, user_id: Optional[str] = None) -> Optional[dict]:
+        value = self._lookup(agent_id, prompt, user_id)
+        # One lookup is one hit or miss, however many reads it took
+        self.store.record(value is not None)
+        return value
+
+    def _lookup(self, agent_id: str, prompt: str, user_id: Optional[str]) -> Optional[dict]:
+        scope = self.scope(agent_id, user_id)
+        version = current_version().version
+        normalized = normalize_prompt(prompt)
+        value = self.store.get(self.key(scope, version, normalized), count=False)
+        if value is not None:
+            return value
+
+        anchors = prompt_anchors(normalized)
+        # Only prompts about the same companies, numbers and ask can stand in for this one
+        candidates = [entry for entry in self._index(scope, version) if entry[1] == anchors]
+        if not candidates:
+            return None
+        query = self.embed(normalized)
+        scores = np.stack([vector for _, _, vector in candidates]) @ query
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        value = self.store.get(self.key(scope, version, candidates[best][0]), count=False)
+        if value is not None:
+            self.similar_hits += 1
+            log_debug(f"Response cache similarity hit ({scores[best]:.3f}): {prompt!r} ~ {candidates[best][0]!r}")
+        return value
+
+    def save(self, agent_id: str, prompt: str, value: dict, user_id: Optional[str] = None) -> None:
+        scope = self.scope(agent_id, user_id)
+        version = current_version().version
+        normalized = normalize_prompt(prompt)
+        self.store.set(self.key(scope, version, normalized), value)
+
+    def carry_over(self, diff: DatasetDiff) -> int:
+        """
+        Copy entries of the previous version that only name companies the diff left alone
+
+        Entries naming no company (screens, industry questions) read the whole
+        table, so they are left behind with the old version.
+        """
+        if diff.previous is None:
+            return 0
+        touched = diff.tickers(diff.removed + list(diff.changed))
+        copied = 0
+        for key in self.store.keys():
+            scope, version, normalized = key.split("|", 2)
+            if version != diff.previous:
+                continue
+            companies = {anchor.split(":", 1)[1].upper() for anchor in prompt_anchors(normalized)
+                         if anchor.startswith("company:")}
+            if companies and not companies & touched:
+                self.store.copy(key, self.key(scope, diff.version, normalized))
+                copied += 1
+        log_debug(f"Response cache carried {copied} entries over to dataset {diff.version}")
+        return copied
+
+    def stats(self) -> dict:
+        return {"hits": self.store.hits, "misses": self.store.misses, "similar_hits": self.similar_hits, "entries": len(self.store)}
+
+
+def _is_error(chunk: str) -> bool:
+    try:
+        return json.loads(chunk).get("event") == "RunError"
+    except (ValueError, AttributeError):
+        return False
+
+
+def _with_session(chunk: str, session_id: str, run_id: str) -> str:
+    try:
+        data = json.loads(chunk)
+    except ValueError:
+        return chunk
+    if isinstance(data, dict):
+        data.update(session_id=session_id, run_id=run_id)
+        return json.dumps(data)
+    return chunk
+
+
+def _answer(cached: dict) -> str:
+    """Final answer text of a recorded run, from its streamed deltas or its single response"""
+    parts = []
+    for chunk in cached["chunks"]:
+        try:
+            data = json.loads(chunk)
+        except ValueError:
+            continue
+        if not isinstance(data, dict) or (cached["stream"] and data.get("event") != "RunResponse"):
+            continue
+        content = data.get("content")
+        if content is not None:
+            parts.append(content if isinstance(content, str) else json.dumps(content))
+    return "".join(parts)
+
+
+def persist_replay(agent: Agent, cached: dict, prompt: str, session_id: str, run_id: str,
+                   user_id: Optional[str]) -> None:
+    """Write a replayed answer to the agent's storage as the first run of a new session"""
+    user_message = Message(role="user", content=prompt)
+    assistant_message = Message(role=agent.model.assistant_message_role, content=_answer(cached))
+    response = RunResponse(content=assistant_message.content, messages=[user_message, assistant_message],
+                           run_id=run_id, agent_id=agent.agent_id, session_id=session_id)
+    run = AgentRun(message=user_message, response=response)
+    agent.storage.upsert(AgentSession(
+        session_id=session_id,
+        agent_id=agent.agent_id,
+        user_id=user_id,
+        # Same shape as a live run with AgentMemory writes
+        memory={**AgentMemory().to_dict(), "runs": [run.to_dict()],
+                "messages": [user_message.to_dict(), assistant_message.to_dict()]},
+        agent_data=agent.get_agent_data(),
+        session_data={},
+    ))
+
+
+class ResponseCacheMiddleware(BaseHTTPMiddleware):
+    """
+    Serves repeated playground agent runs from ResponseCache
+
+    Only first turns (no session_id) are cached, since follow-ups depend on
+    chat history. A hit is written to the agent's storage as the first run
+    of a new session, so a follow-up on that session has its history, and
+    then replays the recorded chunks, re-stamped with the new session id,
+    as a stream just like a live run. Agents not passed in `agents` are
+    never served from the cache.
+    """
+
+    def __init__(self, app, agents: Optional[List[Agent]] = None, cache: Optional["ResponseCache"] = None):
+        super().__init__(app)
+        self.agents: Dict[str, Agent] = {agent.agent_id: agent for agent in agents or [] if agent.agent_id}
+        self.cache = cache or get_response_cache()
+
+    async def dispatch(self, request: Request, call_next):
+        match = _RUN_PATH.search(request.url.path)
+        if request.method != "POST" or match is None:
+            return await call_next(request)
+
+        await request.body()
+        form = await request.form()
+        message = form.get("message")
+        if not isinstance(message, str) or form.get("session_id") or form.get("files"):
+            return await call_next(request)
+
+        agent_id = match.group("agent_id")
+        agent = self.agents.get(agent_id)
+        if agent is None:
+            return await call_next(request)
+        user_id = form.get("user_id") if isinstance(form.get("user_id"), str) else None
+        stream = str(form.get("stream", "true")).lower() == "true"
+        session_id, run_id = str(uuid4()), str(uuid4())
+        with span("response_cache.lookup", kind="cache", agent_id=agent_id) as s:
+            try:
+                cached = self.cache.lookup(agent_id, message, user_id)
+                if cached is not None and cached["stream"] == stream and agent.storage is not None:
+                    await asyncio.to_thread(persist_replay, agent, cached, message, session_id, run_id, user_id)
+            except Exception as e:
+                logger.warning(f"Response cache lookup failed: {e}")
+                cached = None
+            s.set(cache="hit" if cached is not None and cached["stream"] == stream else "miss")
+
+        if cached is not None and cached["stream"] == stream:
+            chunks = [_with_session(chunk, session_id, run_id) for chunk in cached["chunks"]]
+
+            async def replay():
+                for chunk in chunks:
+                    yield chunk
+
+            return StreamingResponse(replay(), media_type=cached["media_type"], headers={"X-Response-Cache": "hit"})
+
+        response = await call_next(request)
+        if response.status_code != 200:
+            return response
+
+        async def record():
+            chunks: List[str] = []
+            async for chunk in response.body_iterator:
+                text = chunk.decode() if isinstance(chunk, bytes) else chunk
+                chunks.append(text)
+                yield chunk
+            if chunks and not any(_is_error(chunk) for chunk in chunks):
+                value = {"stream": stream, "media_type": response.media_type or "application/json", "chunks": chunks}
+                self.cache.save(agent_id, message, value, user_id)
+
+        headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+        headers["X-Response-Cache"] = "miss"
+        return StreamingResponse(record(), status_code=response.status_code, headers=headers, media_type=response.media_type)
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+
+@on_publish
+def carry_over_responses(diff: DatasetDiff) -> None:
+    get_response_cache().carry_over(diff)
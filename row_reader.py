@@ -0,0 +1,63 @@
+import csv
+import io
+from hashlib import md5
+from pathlib import Path
+from typing import IO, Any, List, Union
+from agno.document import Document
+from agno.document.reader.csv_reader import CSVReader
+from agno.utils.log import logger
+from models import ALL_COLUMNS, short_header
+
+
+def row_key(row: dict) -> str:
+    """Stable id for a company row, so a changed row replaces its old vector"""
+    if row.get("nse_code"):
+        return f"nse:{row['nse_code']}"
+    if row.get("bse_code"):
+        return f"bse:{row['bse_code']}"
+    return f"name:{row['name']}"
+
+
+def content_hash(document: Document) -> str:
+    # Same hash PgVector stores in its content_hash column
+    return md5(document.content.replace("\x00", "\ufffd").encode()).hexdigest()
+
+
+def row_document(csv_name: str, headers: List[str], record: List[str]) -> Document:
+    fields = {ALL_COLUMNS.get(header, header): value.strip() for header, value in zip(headers, record)}
+    content = "; ".join(f"{header}: {value.strip()}" for header, value in zip(headers, record) if value.strip())
+    key = row_key(fields)
+    return Document(
+        name=csv_name,
+        id=key,
+        content=content,
+        meta_data={
+            "row_key": key,
+            "name": fields.get("name", ""),
+            "nse_code": fields.get("nse_code", ""),
+            "bse_code": fields.get("bse_code", ""),
+            "industry": fields.get("industry", ""),
+        },
+    )
+
+
+class RowCSVReader(CSVReader):
+    """Reads a CSV as one document per row instead of one large chunked blob"""
+
+    def read(self, file: Union[Path, IO[Any]], delimiter: str = ",", quotechar: str = '"') -> List[Document]:
+        try:
+            if isinstance(file, Path):
+                csv_name, f = file.stem, file.open(newline="", encoding="utf-8")
+            else:
+                file.seek(0)
+                csv_name, f = Path(file.name).stem, io.StringIO(file.read().decode("utf-8"))
+            with f:
+                reader = csv.reader(f, delimiter=delimiter, quotechar=quotechar)
+                headers = [short_header(h) for h in next(reader)]
+                return [row_document(csv_name, headers, record) for record in reader if any(record)]
+        except Exception as e:
+            logger.error(f"Error reading: {file}: {e}")
+            return []
+
+    async def async_read(self, file: Union[Path, IO[Any]], delimiter: str = ",", quotechar: str = '"', **kwargs) -> List[Document]:
+        return self.read(file, delimiter=delimiter, quotechar=quotechar)
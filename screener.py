@@ -0,0 +1,350 @@
+import ast
+import json
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from agno.tools import Toolkit
+from agno.utils.log import logger
+from columnar_store import ColumnarSnapshot
+from dataset import current_version, warm_on_swap
+from models import TEXT_FIELDS
+
+# Always included in screen results so rows can be identified
+IDENTITY_FIELDS = ["name", "nse_code", "bse_code", "industry"]
+
+SCREENER_INSTRUCTIONS = """\
+Use screen_stocks for cross-sectional questions instead of writing SQL.
+`where` is a Python-style expression over the short field names from list_screen_fields, e.g.
+  industry == "Banks" and peg_ratio < 1
+  pct(croic, industry) >= 0.9            (top decile CROIC within each industry)
+  market_capitalization > 10000 and debt_to_equity < 0.5 and not isnull(peg_ratio)
+Functions: pct(x[, group]) percentile rank 0-1, rank(x[, group]) 1 = lowest,
+zscore(x[, group]), abs(x), isnull(x), contains(text_field, "substring").
+Missing values never satisfy a comparison."""
+
+
+class ScreenerError(ValueError):
+    pass
+
+
+def _group_codes(groups: Optional[np.ndarray], size: int) -> np.ndarray:
+    if groups is None:
+        return np.zeros(size, dtype=np.int64)
+    return np.unique(groups, return_inverse=True)[1]
+
+
+def _ranks(values: np.ndarray, groups: Optional[np.ndarray]):
+    """0-based position of each value within its group, plus the group size; NaN excluded"""
+    codes = _group_codes(groups, len(values))
+    idx = np.flatnonzero(~np.isnan(values))
+    order = idx[np.lexsort((values[idx], codes[idx]))]
+    starts = np.r_[0, np.flatnonzero(np.diff(codes[order])) + 1] if len(order) else np.array([], dtype=np.int64)
+    counts = np.diff(np.r_[starts, len(order)])
+    positions = np.arange(len(order)) - np.repeat(starts, counts)
+    return order, positions, np.repeat(counts, counts)
+
+
+def percentile_rank(values: np.ndarray, groups: Optional[np.ndarray] = None) -> np.ndarray:
+    result = np.full(len(values), np.nan)
+    order, positions, sizes = _ranks(values, groups)
+    result[order] = np.where(sizes > 1, positions / np.maximum(sizes - 1, 1), 1.0)
+    return result
+
+
+def rank(values: np.ndarray, groups: Optional[np.ndarray] = None) -> np.ndarray:
+    result = np.full(len(values), np.nan)
+    order, positions, _ = _ranks(values, groups)
+    result[order] = positions + 1
+    return result
+
+
+def zscore(values: np.ndarray, groups: Optional[np.ndarray] = None) -> np.ndarray:
+    codes = _group_codes(groups, len(values))
+    valid = ~np.isnan(values)
+    clean = np.where(valid, values, 0.0)
+    counts = np.bincount(codes, weights=valid)
+    means = np.bincount(codes, weights=clean) / np.maximum(counts, 1)
+    variances = np.bincount(codes, weights=np.where(valid, (clean - means[codes]) ** 2, 0.0)) / np.maximum(counts, 1)
+    stds = np.sqrt(variances)[codes]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(valid & (stds > 0), (values - means[codes]) / stds, np.nan)
+
+
+class Screener:
+    """Vectorised filter/rank/percentile screens over every row of the snapshot"""
+
+    def __init__(self, snapshot: ColumnarSnapshot):
+        self.snapshot = snapshot
+        self.columns: Dict[str, np.ndarray] = {field: snapshot.column(field) for field in snapshot.fields}
+        self.size = len(snapshot)
+
+    def screen(
+        self,
+        where: str = "",
+        sort_by: Optional[str] = None,
+        ascending: bool = True,
+        limit: int = 20,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        return self.screen_with_total(where, sort_by, ascending, limit, fields)[0]
+
+    def screen_with_total(
+        self,
+        where: str = "",
+        sort_by: Optional[str] = None,
+        ascending: bool = True,
+        limit: int = 20,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """The first `limit` matching rows, plus how many rows matched in total"""
+        referenced: List[str] = []
+        mask = np.ones(self.size, dtype=bool)
+        if where.strip():
+            result = self._evaluate(where, referenced)
+            if not isinstance(result, np.ndarray) or result.ndim != 1 or result.dtype != bool:
+                raise ScreenerError("`where` must be a boolean expression")
+            mask = result
+
+        rows = np.flatnonzero(mask)
+        if sort_by:
+            key = self._evaluate(sort_by, referenced)
+            if not isinstance(key, np.ndarray) or key.ndim != 1:
+                raise ScreenerError("`sort_by` must reference at least one field")
+            key = key[rows]
+            if key.dtype.kind in "US":
+                # Text sorts lexically; codes keep the sort stable when descending, and blanks go last
+                key = np.where(key == "", np.nan, np.unique(key, return_inverse=True)[1])
+            elif key.dtype.kind not in "biuf":
+                raise ScreenerError("`sort_by` must be a number or a text field")
+            key = key.astype(np.float64)
+            # NaN sorts last in both directions
+            rows = rows[np.argsort(key if ascending else -key, kind="stable")]
+        total = len(rows)
+        rows = rows[: max(limit, 0)]
+
+        output_fields = list(dict.fromkeys(IDENTITY_FIELDS + referenced + list(fields or [])))
+        for field in output_fields:
+            if field not in self.columns:
+                raise ScreenerError(f"Unknown field: {field}")
+        return [self._row(row_id, output_fields) for row_id in rows], total
+
+    def _row(self, row_id: int, fields: List[str]) -> Dict[str, Any]:
+        row = {}
+        for field in fields:
+            value = self.columns[field][row_id].item()
+            row[field] = None if field not in TEXT_FIELDS and value != value else value
+        return row
+
+    def _evaluate(self, expression: str, referenced: List[str]):
+        try:
+            tree = ast.parse(expression, mode="eval")
+        except SyntaxError as e:
+            raise ScreenerError(f"Invalid expression {expression!r}: {e.msg}") from e
+        try:
+            with np.errstate(all="ignore"):
+                return self._node(tree.body, referenced)
+        except ScreenerError:
+            raise
+        except (TypeError, ValueError) as e:
+            raise ScreenerError(f"Cannot evaluate {expression!r}: {e}") from e
+
+    def _node(self, node: ast.AST, referenced: List[str]):
+        if isinstance(node, ast.Name):
+            if node.id not in self.columns:
+                raise ScreenerError(f"Unknown field: {node.id}")
+            referenced.append(node.id)
+            return self.columns[node.id]
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)):
+            return node.value
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return [self._node(item, referenced) for item in node.elts]
+        if isinstance(node, ast.BoolOp):
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            values = [self._node(value, referenced) for value in node.values]
+            result = values[0]
+            for value in values[1:]:
+                result = combine(result, value)
+            return result
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                negated = _negate(node.operand)
+                if negated is not None:
+                    return self._node(negated, referenced)
+                return np.logical_not(self._node(node.operand, referenced))
+            operand = self._node(node.operand, referenced)
+            if isinstance(node.op, ast.USub):
+                return -operand
+            if isinstance(node.op, ast.UAdd):
+                return operand
+        if isinstance(node, ast.BinOp) and type(node.op) in _BINARY_OPS:
+            return _BINARY_OPS[type(node.op)](self._node(node.left, referenced), self._node(node.right, referenced))
+        if isinstance(node, ast.Compare):
+            left = self._node(node.left, referenced)
+            result = None
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self._node(comparator, referenced)
+                if isinstance(op, (ast.In, ast.NotIn)):
+                    current = np.isin(left, right)
+                    if isinstance(op, ast.NotIn):
+                        current = ~current & _present(left)
+                elif type(op) in _COMPARE_OPS:
+                    current = _COMPARE_OPS[type(op)](left, right)
+                    if isinstance(op, ast.NotEq):
+                        # NaN != x is True, but missing values never satisfy a comparison
+                        current = current & _present(left) & _present(right)
+                else:
+                    break
+                result = current if result is None else result & current
+                left = right
+            else:
+                return result
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in _FUNCTIONS:
+            args = [self._node(arg, referenced) for arg in node.args]
+            try:
+                return _FUNCTIONS[node.func.id](*args)
+            except TypeError as e:
+                raise ScreenerError(f"Bad arguments to {node.func.id}(): {e}") from e
+        raise ScreenerError(f"Unsupported expression: {ast.unparse(node)}")
+
+
+def _negate(node: ast.AST) -> Optional[ast.AST]:
+    """
+    `not node` with the negation pushed down to the comparisons, so that
+    `not (x < 1)` becomes `x >= 1` and a missing x still matches neither.
+    None when node is not a comparison, `and`/`or` or `not`.
+    """
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return node.operand
+    if isinstance(node, ast.BoolOp):
+        op = ast.Or() if isinstance(node.op, ast.And) else ast.And()
+        return ast.BoolOp(op=op, values=[_negate(value) or ast.UnaryOp(op=ast.Not(), operand=value) for value in node.values])
+    if isinstance(node, ast.Compare) and all(type(op) in _INVERSE_OPS for op in node.ops):
+        # a < b < c is a < b and b < c
+        lefts = [node.left] + node.comparators[:-1]
+        inverted = [
+            ast.Compare(left=left, ops=[_INVERSE_OPS[type(op)]()], comparators=[right])
+            for left, op, right in zip(lefts, node.ops, node.comparators)
+        ]
+        return inverted[0] if len(inverted) == 1 else ast.BoolOp(op=ast.Or(), values=inverted)
+    return None
+
+
+def _present(values: Any) -> Any:
+    """False where a numeric operand is missing (NaN); text and constants are always present"""
+    if isinstance(values, np.ndarray) and values.dtype.kind == "f":
+        return ~np.isnan(values)
+    if isinstance(values, float):
+        return not np.isnan(values)
+    return True
+
+
+_BINARY_OPS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+}
+
+_COMPARE_OPS = {
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+}
+
+_INVERSE_OPS = {
+    ast.Eq: ast.NotEq,
+    ast.NotEq: ast.Eq,
+    ast.Lt: ast.GtE,
+    ast.LtE: ast.Gt,
+    ast.Gt: ast.LtE,
+    ast.GtE: ast.Lt,
+    ast.In: ast.NotIn,
+    ast.NotIn: ast.In,
+}
+
+_FUNCTIONS = {
+    "pct": percentile_rank,
+    "rank": rank,
+    "zscore": zscore,
+    "abs": np.abs,
+    "isnull": lambda values: np.isnan(values),
+    "contains": lambda values, text: np.char.find(np.char.lower(values), str(text).lower()) >= 0,
+}
+
+
+@warm_on_swap
+def get_screener() -> Screener:
+    return current_version().derived("screener", lambda version: Screener(version.snapshot))
+
+
+class ScreenerTools(Toolkit):
+    def __init__(self, **kwargs):
+        super().__init__(
+            name="screener_tools",
+            tools=[self.screen_stocks, self.list_screen_fields],
+            instructions=SCREENER_INSTRUCTIONS,
+            add_instructions=True,
+            **kwargs,
+        )
+
+    def list_screen_fields(self) -> str:
+        """Returns the field names that can be used in stock screens
+
+        Returns:
+            str: JSON list of field names
+        """
+        return json.dumps(get_screener().snapshot.fields)
+
+    def screen_stocks(self, where: str = "", sort_by: str = "", ascending: bool = True, limit: int = 20) -> str:
+        """Screens all listed companies in one pass and returns the matching rows
+
+        Args:
+            where (str): Boolean filter expression, e.g. 'industry == "Banks" and peg_ratio < 1'
+            sort_by (str): Field or expression to sort by, e.g. 'debt_to_equity'
+            ascending (bool): Sort direction, lowest first when True
+            limit (int): Maximum number of rows to return
+
+        Returns:
+            str: JSON list of matching rows
+        """
+        try:
+            return json.dumps(get_screener().screen(where, sort_by or None, ascending, limit))
+        except ScreenerError as e:
+            logger.error(f"Error running screen: {e}")
+            return f"Error running screen: {e}"
+
+
+class ScreenRequest(BaseModel):
+    where: str = Field("", description="Boolean filter expression over snapshot fields")
+    sort_by: Optional[str] = Field(None, description="Field or expression to sort by")
+    ascending: bool = Field(True, description="Sort lowest first")
+    limit: int = Field(20, ge=1, le=5000, description="Maximum number of rows")
+    fields: List[str] = Field(default_factory=list, description="Extra fields to include in each row")
+
+
+class ScreenResponse(BaseModel):
+    count: int = Field(..., description="Number of matching rows before the limit")
+    rows: List[Dict[str, Any]]
+
+
+screener_router = APIRouter(tags=["Screener"])
+
+
+@screener_router.get("/screener/fields")
+def list_fields() -> List[str]:
+    return get_screener().snapshot.fields
+
+
+@screener_router.post("/screener", response_model=ScreenResponse)
+def run_screen(request: ScreenRequest) -> ScreenResponse:
+    try:
+        rows, total = get_screener().screen_with_total(
+            request.where, request.sort_by, request.ascending, request.limit, request.fields
+        )
+    except ScreenerError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ScreenResponse(count=total, rows=rows)
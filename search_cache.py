@@ -0,0 +1,179 @@
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Optional
+from fastapi import APIRouter
+from agno.utils.log import log_debug, logger
+from cache_store import TTLCache
+from tracing import current_span, instrument_tools
+
+# Search functions of TavilyTools and DuckDuckGoTools, and the source whose TTL applies to them
+SEARCH_FUNCTIONS = {
+    "web_search_using_tavily": "tavily",
+    "duckduckgo_search": "duckduckgo",
+    "duckduckgo_news": "news",
+}
+# Company and industry research changes slowly; news does not
+SEARCH_CACHE_TTLS = {
+    "tavily": float(os.getenv("SEARCH_CACHE_TTL_TAVILY", 6 * 3600)),
+    "duckduckgo": float(os.getenv("SEARCH_CACHE_TTL_DUCKDUCKGO", 6 * 3600)),
+    "news": float(os.getenv("SEARCH_CACHE_TTL_NEWS", 1800)),
+}
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", 5000))
+# Results that say nothing was found are not worth keeping
+_EMPTY_RESULTS = {"", "[]", "{}", "No results found."}
+_SPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = "\"'`?!.,;: "
+
+
+def normalize_query(query: str) -> str:
+    """Case, Unicode form, whitespace and surrounding quotes/punctuation do not change a search"""
+    text = unicodedata.normalize("NFKC", query).lower()
+    return _SPACE.sub(" ", text).strip(_EDGE_PUNCTUATION)
+
+
+class SearchCache:
+    """
+    Search results shared by every agent, keyed by function, normalized query and options
+
+    Each source is its own TTLCache namespace with its own TTL, so entries are
+    shared across worker processes. Identical searches that are in flight at
+    the same time in this process wait for the first one instead of calling
+    out again.
+    """
+
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, max_entries: int = SEARCH_CACHE_MAX_ENTRIES):
+        self.ttls = {**SEARCH_CACHE_TTLS, **(ttls or {})}
+        self.stores = {source: TTLCache(f"search_{source}", ttl=ttl, max_entries=max_entries)
+                       for source, ttl in self.ttls.items()}
+        self.counts: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "coalesced": 0})
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(function: str, kwargs: Dict[str, Any]) -> str:
+        options = {k: v for k, v in kwargs.items() if k != "query"}
+        return f"{function}|{normalize_query(str(kwargs.get('query', '')))}|{json.dumps(options, sort_keys=True, default=str)}"
+
+    def fetch(self, source: str, function: str, kwargs: Dict[str, Any], call: Callable[[], Any]) -> Any:
+        key = self.key(function, kwargs)
+        counts = self.counts[source]
+        span = current_span()
+        cached = self.stores[source].get(key)
+        if cached is not None:
+            counts["hits"] += 1
+            if span is not None:
+                span.set(cache="hit")
+            return cached
+
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            counts["coalesced"] += 1
+            if span is not None:
+                span.set(cache="hit", coalesced=True)
+            log_debug(f"Search cache: waiting for in-flight {function} '{kwargs.get('query')}'")
+            return future.result()
+
+        counts["misses"] += 1
+        if span is not None:
+            span.set(cache="miss")
+        try:
+            result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        if isinstance(result, str) and result.strip() not in _EMPTY_RESULTS:
+            self.stores[source].set(key, result)
+        future.set_result(result)
+        return result
+
+    def stats(self) -> Dict[str, dict]:
+        result = {}
+        for source, store in self.stores.items():
+            counts = self.counts[source]
+            # A coalesced search is a saved outbound call, so it counts as a hit
+            served = counts["hits"] + counts["coalesced"]
+            total = served + counts["misses"]
+            result[source] = {
+                "entries": len(store),
+                "ttl_s": self.ttls[source],
+                **counts,
+                "hit_rate": round(served / total, 3) if total else None,
+            }
+        return result
+
+
+_cache: Optional[SearchCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    global _cache
+    # Tool calls run in worker threads, and two caches would not coalesce with each other
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchCache()
+        return _cache
+
+
+def _cached(source: str, name: str, fn):
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # Positional and default arguments are part of the key too
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        return get_search_cache().fetch(source, name, dict(bound.arguments), lambda: fn(*args, **kwargs))
+    return wrapper
+
+
+def cache_search_tools(agent) -> None:
+    """Route an agent's web search tools through the shared cache; call before instrument_tools()"""
+    for tool in agent.tools or []:
+        functions = getattr(tool, "functions", None)
+        if not functions:
+            continue
+        for name, function in functions.items():
+            source = SEARCH_FUNCTIONS.get(name)
+            entrypoint = function.entrypoint
+            if source is None or entrypoint is None or getattr(entrypoint, "_search_cached", False):
+                continue
+            if getattr(entrypoint, "_traced", False) or inspect.iscoroutinefunction(entrypoint):
+                logger.warning(f"Not caching {name} of {agent.name}: wrap search tools before tracing them")
+                continue
+            function.entrypoint = _cached(source, name, entrypoint)
+            function.entrypoint._search_cached = True
+            function.entrypoint._traced = False
+
+
+def instrument_agents(agents: Iterable) -> None:
+    """
+    Share web searches across agents through the search cache and make every
+    tool call a span, so slow tools show up on /v1/metrics
+    """
+    for agent in agents:
+        cache_search_tools(agent)
+        instrument_tools(agent)
+
+
+search_cache_router = APIRouter(tags=["Search Cache"])
+
+
+@search_cache_router.get("/search/cache")
+def get_search_cache_stats():
+    """Entries, hits, coalesced in-flight searches and hit rate per search source in this process"""
+    return get_search_cache().stats()
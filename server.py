@@ -0,0 +1,202 @@
+import asyncio
+import math
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Optional
+import anyio.to_thread
+from fastapi import APIRouter, FastAPI
+from starlette.responses import JSONResponse
+from startup import serve
+
+# Worker processes; they share the memory-mapped snapshot pages and whatever was warmed before forking
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 2))
+# Threads per worker for sync endpoints, streamed sync generators and sync tool calls
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", 32))
+# Agent and workflow runs in progress per worker; more wait in the queue, beyond that 429
+SERVER_MAX_RUNS = int(os.getenv("SERVER_MAX_RUNS", 32))
+SERVER_MAX_QUEUE = int(os.getenv("SERVER_MAX_QUEUE", 64))
+SERVER_QUEUE_TIMEOUT_S = float(os.getenv("SERVER_QUEUE_TIMEOUT_S", 30))
+SERVER_PREFORK_WARMUP = os.getenv("SERVER_PREFORK_WARMUP", "true").lower() == "true"
+
+# Requests that start an agent, team or workflow run; everything else is cheap and never queued
+_RUN_PATH = re.compile(r"(/(agents|teams|workflows)/[^/]+/runs|/workflow/stream)$")
+
+
+class AdmissionControl:
+    """Caps concurrent runs per worker with a bounded FIFO wait queue in front"""
+
+    def __init__(self, max_runs: int = SERVER_MAX_RUNS, max_queue: int = SERVER_MAX_QUEUE,
+                 queue_timeout: float = SERVER_QUEUE_TIMEOUT_S):
+        self.max_runs = max_runs
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.counts = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0}
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        # Recent run durations, for Retry-After
+        self.avg_run_s = 10.0
+        # A finishing run hands its slot straight to the oldest waiter
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        if self.running < self.max_runs and not self._waiters:
+            self.running += 1
+            self.counts["admitted"] += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.counts["rejected"] += 1
+            return False
+
+        self.counts["queued"] += 1
+        start = time.perf_counter()
+        slot = asyncio.get_running_loop().create_future()
+        self._waiters.append(slot)
+        try:
+            await asyncio.wait_for(slot, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.counts["timed_out"] += 1
+            return False
+        except BaseException:
+            # Client went away after being handed a slot
+            if slot.done() and not slot.cancelled():
+                self.release(0.0)
+            raise
+        finally:
+            if slot in self._waiters:
+                self._waiters.remove(slot)
+        waited = time.perf_counter() - start
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.counts["admitted"] += 1
+        return True
+
+    def release(self, seconds: float) -> None:
+        if seconds:
+            self.avg_run_s = 0.9 * self.avg_run_s + 0.1 * seconds
+        while self._waiters:
+            slot = self._waiters.popleft()
+            if not slot.done():
+                slot.set_result(None)
+                return
+        self.running -= 1
+
+    def retry_after(self) -> int:
+        # Time for the queue ahead to drain at the current run rate
+        return max(1, min(60, math.ceil(self.avg_run_s * (self.waiting + 1) / self.max_runs)))
+
+    def stats(self) -> dict:
+        admitted = self.counts["admitted"]
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_runs": self.max_runs,
+            "max_queue": self.max_queue,
+            **self.counts,
+            "avg_wait_ms": round(1000 * self.total_wait / admitted, 3) if admitted else 0.0,
+            "max_wait_ms": round(1000 * self.max_wait, 3),
+            "avg_run_s": round(self.avg_run_s, 3),
+        }
+
+
+_admission: Optional[AdmissionControl] = None
+
+
+def get_admission_control() -> AdmissionControl:
+    global _admission
+    if _admission is None:
+        _admission = AdmissionControl()
+    return _admission
+
+
+class AdmissionMiddleware:
+    """Queues run requests behind AdmissionControl and answers 429 with Retry-After when the queue is full"""
+
+    def __init__(self, app, control: Optional[AdmissionControl] = None):
+        self.app = app
+        self.control = control or get_admission_control()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not _RUN_PATH.search(scope["path"]):
+            return await self.app(scope, receive, send)
+        if not await self.control.acquire():
+            response = JSONResponse({"detail": "Server busy, retry later", **self.control.stats()}, status_code=429,
+                                    headers={"Retry-After": str(self.control.retry_after())})
+            return await response(scope, receive, send)
+        start = time.perf_counter()
+        try:
+            # Returns once the whole (possibly streamed) response has been sent
+            await self.app(scope, receive, send)
+        finally:
+            self.control.release(time.perf_counter() - start)
+
+
+async def size_thread_pool() -> None:
+    """Startup handler: one sized pool for asyncio.to_thread (agno's sync tool calls) and Starlette's sync work"""
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(SERVER_THREADS, thread_name_prefix="run"))
+    anyio.to_thread.current_default_thread_limiter().total_tokens = SERVER_THREADS
+
+
+server_router = APIRouter(tags=["Server"])
+
+
+@server_router.get("/server/stats")
+def get_server_stats():
+    """Admission queue and thread pool of the worker that answers"""
+    return {"pid": os.getpid(), "threads": SERVER_THREADS, "admission": get_admission_control().stats()}
+
+
+def create_app() -> FastAPI:
+    """
+    Both playgrounds in one app: the multi-model agents under /agents and the
+    stock analysis workflow under /workflow (point the playground UI at either)
+    """
+    from agent import app as agents_app
+    from workflow import app as workflow_app
+
+    mounted = [agents_app, workflow_app]
+    app = FastAPI(title="Financial Analysis Server")
+
+    # Mounted apps do not get lifespan events, so run their startup/shutdown handlers here
+    async def startup() -> None:
+        await size_thread_pool()
+        for sub_app in mounted:
+            await sub_app.router.startup()
+
+    async def shutdown() -> None:
+        for sub_app in mounted:
+            await sub_app.router.shutdown()
+
+    app.add_event_handler("startup", startup)
+    app.add_event_handler("shutdown", shutdown)
+    app.include_router(server_router, prefix="/v1")
+    app.mount("/agents", agents_app)
+    app.mount("/workflow", workflow_app)
+    app.add_middleware(AdmissionMiddleware)
+    return app
+
+
+def __getattr__(name: str):
+    # Built on first access, so `python server.py` binds the port before importing the agents
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == "__main__":
+    serve(
+        target="server:app",
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 7777)),
+        workers=SERVER_WORKERS,
+        prefork_warmup=SERVER_PREFORK_WARMUP,
+    )
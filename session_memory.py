@@ -0,0 +1,335 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import APIRouter
+from agno.memory.agent import AgentMemory
+from agno.memory.classifier import MemoryClassifier
+from agno.memory.manager import MemoryManager
+from agno.memory.summarizer import MemorySummarizer
+from agno.memory.summary import SessionSummary
+from agno.models.message import Message
+from agno.utils.log import log_debug, logger
+from prompt_builder import count_tokens
+
+# History messages sent with each run; older turns reach the model through the rolling summary
+MEMORY_HISTORY_TOKENS = int(os.getenv("MEMORY_HISTORY_TOKENS", 3000))
+# Agent sessions kept hot per process
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 256))
+# Check a cached session's updated_at before using it; only safe to turn off with a single worker
+SESSION_CACHE_VALIDATE = os.getenv("SESSION_CACHE_VALIDATE", "true").lower() == "true"
+# User memories change slowly and only through the updater below, so other workers may lag by this much
+USER_MEMORY_TTL = float(os.getenv("USER_MEMORY_TTL", 300))
+# Updates wait this long for others to batch with, and a batch holds at most this many
+MEMORY_FLUSH_S = float(os.getenv("MEMORY_FLUSH_S", 2.0))
+MEMORY_BATCH_SIZE = int(os.getenv("MEMORY_BATCH_SIZE", 32))
+
+SessionKey = Tuple[str, str]
+
+# Storage table and session id of the current agent run, set when the run reads its session
+_current_session: ContextVar[Optional[Tuple[Any, str]]] = ContextVar("current_session", default=None)
+
+
+def set_current_session(storage, session_id: str) -> None:
+    _current_session.set((storage, session_id))
+
+
+def session_key(storage, session_id: str) -> SessionKey:
+    return storage.table_name, session_id
+
+
+class SessionCache:
+    """LRU of recently used agent sessions, the newest rolling summary of each and user memories"""
+
+    def __init__(self, size: int = SESSION_CACHE_SIZE):
+        self.size = size
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[SessionKey, Any]" = OrderedDict()
+        # Summaries written by the updater win over whatever an in-flight run loaded
+        self._summaries: "OrderedDict[SessionKey, dict]" = OrderedDict()
+        self._user_memories: Dict[tuple, Tuple[float, list]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def get(self, key: SessionKey):
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+            return session
+
+    def put(self, key: SessionKey, session) -> None:
+        with self._lock:
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.size:
+                self._sessions.popitem(last=False)
+
+    def discard(self, key: SessionKey) -> None:
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def summary(self, key: SessionKey) -> Optional[dict]:
+        with self._lock:
+            return self._summaries.get(key)
+
+    def set_summary(self, key: SessionKey, summary: dict) -> None:
+        with self._lock:
+            self._summaries[key] = summary
+            self._summaries.move_to_end(key)
+            while len(self._summaries) > self.size:
+                self._summaries.popitem(last=False)
+            session = self._sessions.get(key)
+            if session is not None and session.memory is not None:
+                session.memory["summary"] = summary
+
+    def user_memories(self, key: tuple) -> Optional[list]:
+        with self._lock:
+            entry = self._user_memories.get(key)
+        if entry is None or time.monotonic() - entry[0] > USER_MEMORY_TTL:
+            return None
+        return entry[1]
+
+    def set_user_memories(self, key: tuple, memories: list) -> None:
+        with self._lock:
+            self._user_memories[key] = (time.monotonic(), memories)
+
+    def invalidate_user(self, table_name: str, user_id: Optional[str]) -> None:
+        with self._lock:
+            for key in [key for key in self._user_memories if key[:2] == (table_name, user_id)]:
+                del self._user_memories[key]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "sessions": len(self._sessions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+_cache: Optional[SessionCache] = None
+
+
+def get_session_cache() -> SessionCache:
+    global _cache
+    if _cache is None:
+        _cache = SessionCache()
+    return _cache
+
+
+class MemoryUpdater:
+    """
+    Background thread that runs session summaries and user memory updates after the response
+
+    Updates queued within MEMORY_FLUSH_S of each other are batched: all new turns of
+    a session go into one summary call, and all inputs of a user into one
+    classifier and one memory manager call.
+    """
+
+    def __init__(self, flush_s: float = MEMORY_FLUSH_S, batch_size: int = MEMORY_BATCH_SIZE):
+        self.flush_s = flush_s
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._guard = threading.Lock()
+        self.counts = {"queued": 0, "batches": 0, "summaries": 0, "memory_updates": 0, "failed": 0}
+
+    def submit(self, job: dict) -> None:
+        with self._guard:
+            if self._thread is None:
+                # Started on first use, so forked workers each get their own thread
+                self._thread = threading.Thread(target=self._run, name="memory-updater", daemon=True)
+                self._thread.start()
+        self.counts["queued"] += 1
+        self._queue.put(job)
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            batch = [job]
+            deadline = time.monotonic() + self.flush_s
+            while len(batch) < self.batch_size:
+                try:
+                    job = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if job is None:
+                    self._process(batch)
+                    return
+                batch.append(job)
+            self._process(batch)
+
+    def _process(self, batch: List[dict]) -> None:
+        self.counts["batches"] += 1
+        groups: "OrderedDict[tuple, List[dict]]" = OrderedDict()
+        for job in batch:
+            groups.setdefault(job["group"], []).append(job)
+        for jobs in groups.values():
+            try:
+                if jobs[0]["kind"] == "summary":
+                    self._summarize(jobs)
+                else:
+                    self._update_memories(jobs)
+            except Exception as e:
+                self.counts["failed"] += 1
+                logger.warning(f"Background memory update failed: {e}")
+
+    def _summarize(self, jobs: List[dict]) -> None:
+        key = jobs[0]["key"]
+        cache = get_session_cache()
+        previous = cache.summary(key) or jobs[0]["previous"]
+        pairs = [pair for job in jobs for pair in job["pairs"]]
+        if previous:
+            # Rolling summary: the model only sees the summary so far plus the new turns
+            topics = ", ".join(previous.get("topics") or [])
+            earlier = previous["summary"] + (f"\nTopics: {topics}" if topics else "")
+            pairs.insert(0, (Message(role="user", content="Summarize our conversation so far."),
+                             Message(role="assistant", content=earlier)))
+        summarizer = jobs[-1]["summarizer"] or MemorySummarizer()
+        summary = summarizer.run(pairs)
+        if summary is None:
+            return
+        summary_dict = summary.model_dump()
+        cache.set_summary(key, summary_dict)
+        jobs[-1]["storage"].update_summary(key[1], summary_dict)
+        self.counts["summaries"] += 1
+        log_debug(f"Rolled summary for session {key[1]} over {len(jobs)} new runs")
+
+    def _update_memories(self, jobs: List[dict]) -> None:
+        db, user_id = jobs[0]["db"], jobs[0]["user_id"]
+        text = "\n".join(job["input"] for job in jobs)
+        if not any(job["force"] for job in jobs):
+            classifier = MemoryClassifier(model=jobs[-1]["classifier_model"])
+            classifier.existing_memories = jobs[-1]["memories"]
+            if classifier.run(text) != "yes":
+                return
+        MemoryManager(model=jobs[-1]["manager_model"], user_id=user_id, db=db).run(text)
+        get_session_cache().invalidate_user(db.table_name, user_id)
+        self.counts["memory_updates"] += 1
+
+    def stop(self, timeout: float = 30) -> None:
+        """Finish queued updates, e.g. at interpreter exit"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+
+
+_updater: Optional[MemoryUpdater] = None
+
+
+def get_memory_updater() -> MemoryUpdater:
+    global _updater
+    if _updater is None:
+        _updater = MemoryUpdater()
+        atexit.register(_updater.stop)
+    return _updater
+
+
+class BoundedAgentMemory(AgentMemory):
+    """
+    AgentMemory with history capped at a token budget, cached user memories
+    and summary/user memory updates queued for the background updater
+    """
+
+    history_tokens: int = MEMORY_HISTORY_TOKENS
+
+    def get_messages_from_last_n_runs(self, last_n: Optional[int] = None, skip_role: Optional[str] = None) -> List[Message]:
+        runs = self.runs if last_n is None else self.runs[-last_n:]
+        kept: List[List[Message]] = []
+        used = 0
+        # Whole runs, newest first, so tool calls never lose their results
+        for run in reversed(runs):
+            if not (run.response and run.response.messages):
+                continue
+            messages = [message for message in run.response.messages
+                        if not (skip_role and message.role == skip_role) and not message.from_history]
+            tokens = sum(count_tokens(message.get_content_string()) for message in messages)
+            if used + tokens > self.history_tokens:
+                break
+            kept.insert(0, messages)
+            used += tokens
+        log_debug(f"History: {len(kept)} of {len(runs)} runs, {used} tokens")
+        return [message for messages in kept for message in messages]
+
+    def load_user_memories(self) -> None:
+        if self.db is None:
+            return
+        key = (getattr(self.db, "table_name", str(id(self.db))), self.user_id, self.retrieval, self.num_memories)
+        cached = get_session_cache().user_memories(key)
+        if cached is not None:
+            self.memories = list(cached)
+            return
+        super().load_user_memories()
+        get_session_cache().set_user_memories(key, list(self.memories or []))
+
+    def _queue_memory_update(self, input: str, force: bool) -> str:
+        get_memory_updater().submit({
+            "kind": "memories",
+            "group": ("memories", id(self.db), self.user_id),
+            "db": self.db,
+            "user_id": self.user_id,
+            "input": input,
+            "force": force,
+            "memories": list(self.memories or []),
+            "classifier_model": self.classifier.model if self.classifier else None,
+            "manager_model": self.manager.model if self.manager else None,
+        })
+        return "Memory update scheduled"
+
+    def update_memory(self, input: str, force: bool = False) -> Optional[str]:
+        if self.db is None or not isinstance(input, str):
+            return super().update_memory(input, force)
+        return self._queue_memory_update(input, force)
+
+    async def aupdate_memory(self, input: str, force: bool = False) -> Optional[str]:
+        if self.db is None or not isinstance(input, str):
+            return await super().aupdate_memory(input, force)
+        return self._queue_memory_update(input, force)
+
+    def _queue_summary(self) -> Optional[SessionSummary]:
+        current = _current_session.get()
+        # The run that just finished; earlier ones are already in the summary
+        pairs = self.get_message_pairs()[-1:]
+        if current is None or not pairs:
+            return None
+        storage, session_id = current
+        key = session_key(storage, session_id)
+        get_memory_updater().submit({
+            "kind": "summary",
+            "group": ("summary", key),
+            "key": key,
+            "storage": storage,
+            "pairs": pairs,
+            "previous": self.summary.model_dump() if self.summary else None,
+            "summarizer": self.summarizer,
+        })
+        return self.summary
+
+    def update_summary(self) -> Optional[SessionSummary]:
+        if _current_session.get() is None:
+            return super().update_summary()
+        return self._queue_summary()
+
+    async def aupdate_summary(self) -> Optional[SessionSummary]:
+        if _current_session.get() is None:
+            return await super().aupdate_summary()
+        return self._queue_summary()
+
+
+memory_router = APIRouter(tags=["Memory"])
+
+
+@memory_router.get("/memory/stats")
+def get_memory_stats():
+    """Hot session cache hit rate and background summary/memory update counts"""
+    return {"sessions": get_session_cache().stats(), "updates": get_memory_updater().counts}
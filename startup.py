@@ -0,0 +1,267 @@
+import asyncio
+import importlib
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from typing import Callable, List, Optional
+import uvicorn
+from starlette.responses import JSONResponse
+
+# "module:attribute" of the ASGI app to serve once it has been imported
+STARTUP_TARGET = os.getenv("STARTUP_TARGET", "server:app")
+STARTUP_WORKERS = int(os.getenv("STARTUP_WORKERS", 1))
+# Load shared read-only state in the parent so forked workers start warm
+PREFORK_WARMUP = os.getenv("PREFORK_WARMUP", "false").lower() == "true"
+# Retryable warm-up steps (network checks) get this many attempts before the worker gives up
+WARMUP_ATTEMPTS = int(os.getenv("WARMUP_ATTEMPTS", 5))
+WARMUP_RETRY_S = float(os.getenv("WARMUP_RETRY_S", 2))
+# A worker that dies sooner than this after starting is restarted after a pause, not straight away
+WORKER_MIN_UPTIME_S = float(os.getenv("WORKER_MIN_UPTIME_S", 5))
+
+
+class WarmUpStep:
+    def __init__(self, name: str, fn: Callable[[], None], shared: bool, retryable: bool = False):
+        self.name = name
+        self.fn = fn
+        # Shared steps only build read-only state and are safe to run before forking
+        self.shared = shared
+        # Failures that may go away on their own (e.g. the database not up yet)
+        self.retryable = retryable
+        self.status = "pending"
+        self.seconds: Optional[float] = None
+
+
+class WarmUp:
+    """Ordered warm-up steps whose progress is reported by the readiness probe"""
+
+    def __init__(self, steps: List[WarmUpStep]):
+        self.steps = steps
+        self.error: Optional[str] = None
+        self.started = time.time()
+
+    @property
+    def ready(self) -> bool:
+        return all(step.status == "done" for step in self.steps)
+
+    @property
+    def failed(self) -> bool:
+        """Warm-up has stopped for good; this worker will never become ready"""
+        return any(step.status == "failed" for step in self.steps)
+
+    def run(self, shared_only: bool = False) -> None:
+        for step in self.steps:
+            if step.status == "done" or (shared_only and not step.shared):
+                continue
+            if self.error is not None:
+                return
+            step.status = "running"
+            start = time.perf_counter()
+            attempts = WARMUP_ATTEMPTS if step.retryable else 1
+            for attempt in range(1, attempts + 1):
+                try:
+                    step.fn()
+                    break
+                except Exception as e:
+                    if attempt < attempts:
+                        print(f"⚠️ Warm-up {step.name} failed (attempt {attempt}/{attempts}), retrying: {e}")
+                        time.sleep(WARMUP_RETRY_S * attempt)
+                        continue
+                    step.status = "failed"
+                    self.error = f"{step.name}: {e}"
+                    print(f"❌ Warm-up failed at {step.name}: {e}")
+                    return
+            step.seconds = round(time.perf_counter() - start, 3)
+            step.status = "done"
+            print(f"✅ Warm-up: {step.name} ({step.seconds}s)")
+
+    def report(self) -> dict:
+        done = sum(step.status == "done" for step in self.steps)
+        return {
+            "ready": self.ready,
+            "progress": round(done / len(self.steps), 2),
+            "uptime_s": round(time.time() - self.started, 3),
+            "error": self.error,
+            "failed": self.failed,
+            "steps": [{"name": step.name, "status": step.status, "seconds": step.seconds} for step in self.steps],
+        }
+
+
+def _load_snapshot() -> None:
+    from columnar_store import get_snapshot
+
+    snapshot = get_snapshot()
+    for field in snapshot.fields:
+        snapshot.column(field)
+
+
+def _load_resolver() -> None:
+    from company_resolver import get_resolver
+
+    get_resolver()
+
+
+def _load_screener() -> None:
+    from screener import get_screener
+
+    get_screener()
+
+
+def _load_industry_stats() -> None:
+    from industry_stats import get_industry_stats
+
+    get_industry_stats()
+
+
+def _load_lexical_index() -> None:
+    # Only apps that serve the knowledge base pay for it
+    if "knowledge_base" in sys.modules:
+        sys.modules["knowledge_base"].knowledge_base.index
+
+
+def _check_database() -> None:
+    if "knowledge_base" in sys.modules:
+        sys.modules["knowledge_base"].check_database()
+
+
+class LazyApp:
+    """
+    ASGI app that answers health probes immediately and forwards everything
+    else to the real app once its imports and warm-up have finished
+    """
+
+    def __init__(self, target: str = STARTUP_TARGET):
+        self.target = target
+        self.app = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self.warm_up = WarmUp([
+            WarmUpStep("snapshot", _load_snapshot, shared=True),
+            WarmUpStep("resolver", _load_resolver, shared=True),
+            WarmUpStep("screener", _load_screener, shared=True),
+            WarmUpStep("industry stats", _load_industry_stats, shared=True),
+            WarmUpStep(f"import {target}", self._import_app, shared=True),
+            WarmUpStep("lexical index", _load_lexical_index, shared=True),
+            WarmUpStep("database", _check_database, shared=False, retryable=True),
+        ])
+
+    def _import_app(self) -> None:
+        module, _, attribute = self.target.partition(":")
+        app = getattr(importlib.import_module(module), attribute or "app")
+        if self._loop is not None:
+            # Run the app's own startup handlers on the serving loop
+            asyncio.run_coroutine_threadsafe(app.router.startup(), self._loop).result()
+        self.app = app
+
+    def start(self) -> None:
+        if self._thread is None and not self.warm_up.ready:
+            self._thread = threading.Thread(target=self.warm_up.run, name="warm-up", daemon=True)
+            self._thread.start()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    self._loop = asyncio.get_running_loop()
+                    if self.app is not None:
+                        # Imported before the fork, so its startup handlers have not run here yet
+                        await self.app.router.startup()
+                    self.start()
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    if self.app is not None:
+                        await self.app.router.shutdown()
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+
+        path = scope.get("path", "")
+        if path == "/health/live":
+            # A worker whose warm-up failed for good would answer 503 forever; let the orchestrator restart it
+            if self.warm_up.failed:
+                response = JSONResponse({"status": "failed", "pid": os.getpid(), "error": self.warm_up.error},
+                                        status_code=503)
+            else:
+                response = JSONResponse({"status": "alive", "pid": os.getpid()})
+        elif path == "/health/ready":
+            report = self.warm_up.report()
+            response = JSONResponse(report, status_code=200 if report["ready"] else 503)
+        elif self.app is None or not self.warm_up.ready:
+            if scope["type"] != "http":
+                return
+            response = JSONResponse({"detail": "Warming up", **self.warm_up.report()}, status_code=503,
+                                    headers={"Retry-After": "1"})
+        else:
+            await self.app(scope, receive, send)
+            return
+        await response(scope, receive, send)
+
+
+def serve(target: str = STARTUP_TARGET, host: str = "0.0.0.0", port: int = 8000,
+          workers: int = STARTUP_WORKERS, prefork_warmup: bool = PREFORK_WARMUP) -> None:
+    """Bind first, then warm up; with several workers they share the listening socket"""
+    app = LazyApp(target)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    if prefork_warmup:
+        print("🔄 Pre-fork warm-up...")
+        app.warm_up.run(shared_only=True)
+
+    config = uvicorn.Config(app, lifespan="on", log_level=os.getenv("LOG_LEVEL", "info"))
+    if workers <= 1:
+        uvicorn.Server(config).run(sockets=[sock])
+        return
+
+    def spawn() -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            uvicorn.Server(config).run(sockets=[sock])
+            os._exit(0)
+        return pid
+
+    # pid -> start time
+    children = {spawn(): time.monotonic() for _ in range(workers)}
+    print(f"🚀 Started {workers} workers on {host}:{port}: {list(children)}")
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for child in list(children):
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    # Replace workers that exit unexpectedly, so a crash does not silently cut capacity
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"⚠️ Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        if time.monotonic() - started < WORKER_MIN_UPTIME_S:
+            time.sleep(WORKER_MIN_UPTIME_S)
+        if not stopping:
+            children[spawn()] = time.monotonic()
+
+
+if __name__ == "__main__":
+    serve(
+        target=sys.argv[1] if len(sys.argv) > 1 else STARTUP_TARGET,
+        host=os.getenv("HOST", "0.0.0.0"),
+        port=int(os.getenv("PORT", 8000)),
+    )
@@ -0,0 +1,334 @@
+import json
+import os
+import re
+import threading
+import types
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple, Type, Union, get_args, get_origin
+from fastapi import APIRouter
+from pydantic import BaseModel, ValidationError
+from agno.agent import Agent
+from agno.models.message import Message
+from agno.models.openai import OpenAIChat
+from agno.utils.log import log_debug, logger
+from model_router import RoutedModel
+from partial_json import PartialObjectParser
+from tracing import current_span
+
+# Follow-up requests for just the invalid fields before falling back to a full re-run
+STRUCTURED_MAX_REASKS = int(os.getenv("STRUCTURED_MAX_REASKS", 1))
+# Previous answer quoted back in a re-ask, enough for the model to keep its other fields consistent
+STRUCTURED_REASK_CONTEXT_CHARS = int(os.getenv("STRUCTURED_REASK_CONTEXT_CHARS", 4000))
+
+# What models write instead of null in numeric fields
+_NULLS = {"", "n/a", "na", "nil", "none", "null", "nan", "-", "--", "—", "not available", "unknown"}
+_NUMBER = re.compile(r"^[+-]?(\d+(\.\d*)?|\.\d+)(e[+-]?\d+)?$", re.I)
+_CURRENCY = re.compile(r"^(₹|rs\.?|inr)\s*|\s*(₹|rs\.?|inr)$", re.I)
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def _to_number(value: Any) -> Optional[float]:
+    """'12.5%', '₹1,234', '3.2x' and 'N/A' as a number or None; ValueError if it is not one"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if not isinstance(value, str):
+        raise ValueError(f"not a number: {value!r}")
+    text = value.strip().lower()
+    if text in _NULLS:
+        return None
+    text = _CURRENCY.sub("", text.replace(",", "")).strip()
+    if text[-1:] in ("%", "x"):
+        text = text[:-1].strip()
+    if not _NUMBER.match(text):
+        raise ValueError(f"not a number: {value!r}")
+    return float(text)
+
+
+def _to_list(value: str) -> list:
+    text = _TRAILING_COMMA.sub(r"\1", value.strip())
+    if text.startswith("["):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+    items = [_LIST_ITEM.sub("", line).strip() for line in re.split(r"[\n;]", text)]
+    return [item for item in items if item]
+
+
+def _annotation(annotation: Any) -> Tuple[Any, bool]:
+    """Field type with Optional[...] unwrapped, and whether None is allowed"""
+    if get_origin(annotation) in (Union, types.UnionType):
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        return (args[0] if len(args) == 1 else annotation), len(args) < len(get_args(annotation))
+    return annotation, False
+
+
+def coerce_fields(response_model: Type[BaseModel], data: dict) -> Tuple[dict, List[str]]:
+    """
+    Fix the defects models commonly produce, field by field, against the model's annotations
+
+    Returns the repaired fields and what was changed. Values that cannot be
+    repaired are left as they are for validation to report.
+    """
+    data = dict(data)
+    repairs: List[str] = []
+    by_lower = {key.lower(): key for key in data}
+    for name, field in response_model.model_fields.items():
+        if name not in data and name.lower() in by_lower:
+            data[name] = data.pop(by_lower[name.lower()])
+            repairs.append(f"{name}:key")
+        if name not in data:
+            continue
+        value = data[name]
+        base, optional = _annotation(field.annotation)
+        try:
+            if base in (float, int) and not (isinstance(value, (int, float)) and not isinstance(value, bool)):
+                number = _to_number(value)
+                if number is None and not optional:
+                    continue
+                data[name] = number if number is None or base is float else int(number)
+                repairs.append(f"{name}:{'null' if number is None else 'number'}")
+            elif base is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+                data[name] = str(value)
+                repairs.append(f"{name}:string")
+            elif get_origin(base) is list and isinstance(value, str):
+                data[name] = _to_list(value)
+                repairs.append(f"{name}:list")
+            elif optional and isinstance(value, str) and value.strip().lower() in _NULLS and base is not str:
+                data[name] = None
+                repairs.append(f"{name}:null")
+        except ValueError:
+            continue
+    return data, repairs
+
+
+def extract_fields(text: str, parser: Optional[PartialObjectParser] = None) -> Optional[dict]:
+    """Top-level fields of the first JSON object in text, ignoring prose or a fence around it"""
+    if parser is None:
+        parser = PartialObjectParser()
+        parser.feed(text)
+    if not parser.started:
+        return None
+    return dict(parser.fields)
+
+
+def invalid_fields(response_model: Type[BaseModel], data: dict) -> Tuple[Optional[BaseModel], Dict[str, str]]:
+    """The validated model, or the top-level fields that are missing or invalid and why"""
+    try:
+        return response_model.model_validate(data), {}
+    except ValidationError as e:
+        errors: Dict[str, str] = {}
+        for error in e.errors():
+            field = str(error["loc"][0]) if error["loc"] else "__root__"
+            errors.setdefault(field, error["msg"])
+        return None, errors
+
+
+class StructuredResult:
+    """Outcome of parsing one response: the model if valid, else the fields to ask for again"""
+
+    def __init__(self, value: Optional[BaseModel], data: Optional[dict], errors: Dict[str, str], repairs: List[str],
+                 asked: Optional[List[str]] = None):
+        self.value = value
+        self.data = data
+        self.errors = errors
+        self.repairs = repairs
+        # Fields the model has been asked for again
+        self.asked = asked or []
+
+
+def parse_structured(text: str, response_model: Type[BaseModel],
+                     parser: Optional[PartialObjectParser] = None) -> StructuredResult:
+    """Validate text as response_model, repairing it locally when plain validation fails"""
+    try:
+        return StructuredResult(response_model.model_validate_json(text.strip()), None, {}, [])
+    except ValidationError:
+        pass
+    data = extract_fields(text, parser)
+    if not data:
+        return StructuredResult(None, None, {}, [])
+    data, repairs = coerce_fields(response_model, data)
+    value, errors = invalid_fields(response_model, data)
+    # Getting here at all means prose, a fence or trailing text had to be cut away
+    return StructuredResult(value, data, errors, ["json:extract"] + repairs)
+
+
+class ModelOutputStats:
+    outcomes = ("valid", "repaired", "reasked", "reask_failed", "invalid", "unparsed", "full_retries")
+
+    def __init__(self):
+        self.counts = Counter({outcome: 0 for outcome in self.outcomes})
+        self.repairs: Counter = Counter()
+
+
+class StructuredStats:
+    """How often each model's structured output needed a local repair, a field re-ask or a full re-run"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.models: Dict[str, ModelOutputStats] = defaultdict(ModelOutputStats)
+
+    def record(self, model: str, outcome: str, repairs: Optional[List[str]] = None) -> None:
+        with self._lock:
+            stats = self.models[model]
+            stats.counts[outcome] += 1
+            # Count the kind of repair, not the field ("number", "null", "list", ...)
+            stats.repairs.update(repair.rsplit(":", 1)[-1] for repair in repairs or [])
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            result = {}
+            for model, stats in self.models.items():
+                counts = stats.counts
+                # A full re-run is a second output of the same request, so it is not counted as one
+                outputs = sum(counts[outcome] for outcome in ModelOutputStats.outcomes if outcome != "full_retries")
+                reasks = counts["reasked"] + counts["reask_failed"]
+                result[model] = {
+                    "outputs": outputs,
+                    **counts,
+                    "repair_rate": round(counts["repaired"] / outputs, 3) if outputs else None,
+                    "reask_rate": round(reasks / outputs, 3) if outputs else None,
+                    "retry_rate": round(counts["full_retries"] / outputs, 3) if outputs else None,
+                    "repairs": dict(stats.repairs),
+                }
+            return result
+
+
+_stats = StructuredStats()
+
+
+def get_structured_stats() -> StructuredStats:
+    return _stats
+
+
+def answering_model(agent: Agent, response: Any = None) -> str:
+    """Model that produced the output: the routed candidate if the router picked one"""
+    span = current_span()
+    routed = span.attributes.get("routed_model") if span is not None else None
+    return routed or getattr(response, "model", None) or agent.model.id
+
+
+def _count_retry() -> None:
+    span = current_span()
+    if span is not None:
+        span.add("retries")
+
+
+def _reask_messages(agent: Agent, prompt: str, text: str, result: StructuredResult) -> List[Message]:
+    schema = agent.response_model.model_json_schema()
+    properties = {name: schema["properties"][name] for name in result.errors if name in schema.get("properties", {})}
+    problems = "\n".join(
+        f"- {name}: {error}" + (f" (you gave {json.dumps(result.data[name], default=str)})" if name in result.data else "")
+        for name, error in result.errors.items()
+    )
+    system = "\n".join(part for part in (agent.description, agent.role) if part) or "You produce structured JSON output."
+    return [
+        Message(role="system", content=system),
+        Message(role="user", content=prompt),
+        Message(role="assistant", content=text[-STRUCTURED_REASK_CONTEXT_CHARS:]),
+        Message(role="user", content=(
+            "Some fields of your JSON answer are missing or invalid:\n"
+            f"{problems}\n\n"
+            "Reply with only a JSON object containing exactly these fields, with valid values, "
+            f"following this schema:\n{json.dumps(properties)}"
+        )),
+    ]
+
+
+def _reask_format(agent: Agent) -> Optional[dict]:
+    # Only OpenAI chat models are known to accept JSON mode
+    models = agent.model.candidates if isinstance(agent.model, RoutedModel) else [agent.model]
+    return {"type": "json_object"} if all(isinstance(model, OpenAIChat) for model in models) else None
+
+
+def _merge(agent: Agent, result: StructuredResult, answer: Optional[str]) -> StructuredResult:
+    fields, repairs = coerce_fields(agent.response_model, extract_fields(answer or "") or {})
+    # Only the fields asked for; the rest of the first answer stands
+    data = {**result.data, **{k: v for k, v in fields.items() if k in result.errors}}
+    value, errors = invalid_fields(agent.response_model, data)
+    return StructuredResult(value, data, errors, result.repairs + repairs, result.asked + list(result.errors))
+
+
+def _resolve(agent: Agent, prompt: str, response: Any, text: Optional[str],
+             parser: Optional[PartialObjectParser]) -> Tuple[Optional[BaseModel], Optional[StructuredResult], str, str]:
+    content = response.content if response is not None else None
+    model = answering_model(agent, response)
+    if isinstance(content, agent.response_model):
+        _stats.record(model, "valid")
+        return content, None, model, ""
+    if text is None:
+        text = content if isinstance(content, str) else ""
+    result = parse_structured(text, agent.response_model, parser)
+    if result.value is not None:
+        _stats.record(model, "repaired" if result.repairs else "valid", result.repairs)
+        if result.repairs:
+            log_debug(f"Repaired {agent.name} output locally: {', '.join(result.repairs)}")
+        return result.value, None, model, text
+    if result.data is None:
+        # No JSON object at all (e.g. a deliberate null), nothing to ask about
+        _stats.record(model, "unparsed")
+        return None, None, model, text
+    return None, result, model, text
+
+
+def _finish(agent: Agent, model: str, result: StructuredResult) -> Optional[BaseModel]:
+    if result.value is not None:
+        _stats.record(model, "reasked", result.repairs)
+        span = current_span()
+        if span is not None:
+            span.set(structured_reask=",".join(result.asked))
+        return result.value
+    _stats.record(model, "reask_failed" if result.asked else "invalid", result.repairs)
+    logger.warning(f"{agent.name} output still invalid: {result.errors}")
+    return None
+
+
+def ensure_structured(agent: Agent, prompt: str, response: Any, text: Optional[str] = None,
+                      parser: Optional[PartialObjectParser] = None) -> Optional[BaseModel]:
+    """
+    response.content as the agent's response_model: repaired locally if possible,
+    otherwise by asking the model again for just the invalid fields. None means
+    the caller should re-run the agent.
+    """
+    value, result, model, text = _resolve(agent, prompt, response, text, parser)
+    if result is None:
+        return value
+    for _ in range(STRUCTURED_MAX_REASKS):
+        log_debug(f"Re-asking {agent.name} for {list(result.errors)}")
+        _count_retry()
+        answer = agent.model.response(_reask_messages(agent, prompt, text, result), response_format=_reask_format(agent))
+        result = _merge(agent, result, answer.content)
+        if result.value is not None:
+            break
+    return _finish(agent, model, result)
+
+
+async def aensure_structured(agent: Agent, prompt: str, response: Any, text: Optional[str] = None,
+                             parser: Optional[PartialObjectParser] = None) -> Optional[BaseModel]:
+    """Async ensure_structured()"""
+    value, result, model, text = _resolve(agent, prompt, response, text, parser)
+    if result is None:
+        return value
+    for _ in range(STRUCTURED_MAX_REASKS):
+        log_debug(f"Re-asking {agent.name} for {list(result.errors)}")
+        _count_retry()
+        answer = await agent.model.aresponse(_reask_messages(agent, prompt, text, result), response_format=_reask_format(agent))
+        result = _merge(agent, result, answer.content)
+        if result.value is not None:
+            break
+    return _finish(agent, model, result)
+
+
+def record_full_retry(agent: Agent, response: Any = None) -> None:
+    _stats.record(answering_model(agent, response), "full_retries")
+    _count_retry()
+
+
+structured_router = APIRouter(tags=["Structured Output"])
+
+
+@structured_router.get("/structured/stats")
+def get_structured_output_stats():
+    """Local repair, field re-ask and full re-run rates of structured output, per model"""
+    return get_structured_stats().summary()
@@ -1,20 +1,22 @@
 # Add this test before running the agent
-import pandas as pd
+import numpy as np
+from columnar_store import get_snapshot
 
-# Load and inspect your CSV
-df = pd.read_csv("query_results.csv")
-print("CSV Shape:", df.shape)
-print("Columns:", list(df.columns))
-print("\nFirst few rows of Name column:")
-print(df.iloc[:, 0].head())  # First column (Name)
+# Load and inspect the memory-mapped snapshot of the CSV
+snapshot = get_snapshot()
+print("Snapshot version:", snapshot.version)
+print("Rows:", len(snapshot), "Columns:", len(snapshot.fields))
+print("Columns:", snapshot.fields)
+print("\nFirst few rows of name column:")
+print(snapshot.column("name")[:5])
 
 # Test the exact search
-name_col = "Name (Company Name as registered on stock exchanges)"
-exact_match = df[df[name_col] == 'Reliance Industries']
+names = snapshot.column("name")
+exact_match = np.flatnonzero(names == 'Reliance Industries')
 print(f"\nExact match results: {len(exact_match)} rows")
 
-partial_match = df[df[name_col].str.contains('Reliance', na=False)]
+partial_match = np.flatnonzero(np.char.find(names, 'Reliance') >= 0)
 print(f"Partial match results: {len(partial_match)} rows")
 if len(partial_match) > 0:
     print("Partial match data:")
-    print(partial_match[name_col].values)
\ No newline at end of file
+    print(names[partial_match])
@@ -0,0 +1,30 @@
+import pytest
+from company_resolver import get_resolver
+
+
+@pytest.fixture(scope="module")
+def resolver():
+    return get_resolver()
+
+
+@pytest.mark.parametrize("query, nse_code", [
+    ("TCS", "TCS"),
+    ("Bank of India", "BANKINDIA"),
+    ("Reliance Industries", "RELIANCE"),
+    ("Asian Paints Limited", "ASIANPAINT"),
+    ("Larsen and Toubro", "LT"),
+])
+def test_resolves_known_companies(resolver, query, nse_code):
+    assert resolver.resolve(query).nse_code == nse_code
+
+
+def test_state_bank_is_not_bank_of_india(resolver):
+    # A trigram match that leaves "state" unexplained is only a hint
+    result = resolver.resolve("State Bank of India")
+    assert result is None or result.nse_code == "SBIN"
+    match = resolver.match("State Bank of India")
+    assert match.stock_data.nse_code == "SBIN" or match.score < resolver.min_confidence
+
+
+def test_ambiguous_prefix_is_a_hint(resolver):
+    assert resolver.resolve("hdfc") is None
@@ -0,0 +1,91 @@
+import hashlib
+from dataclasses import dataclass
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from agno.document import Document
+from agno.embedder.base import Embedder
+from kb_ingest import ingest
+from local_vectordb import LocalVectorDb
+
+
+@dataclass
+class FakeEmbedder(Embedder):
+    dimensions: int = 8
+    calls: int = 0
+
+    def get_embedding(self, text):
+        self.calls += 1
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+        return np.random.default_rng(seed).normal(size=self.dimensions).tolist()
+
+    def get_embedding_and_usage(self, text):
+        return self.get_embedding(text), None
+
+
+def doc(doc_id: str, content: str) -> Document:
+    return Document(id=doc_id, name="rows", content=content, meta_data={"row_key": doc_id})
+
+
+@pytest.fixture
+def db(tmp_path):
+    return LocalVectorDb("rows", path=tmp_path, embedder=FakeEmbedder())
+
+
+def builds(db):
+    return [path for path in db.path.parent.glob("rows.*") if path.is_dir() and not path.is_symlink()]
+
+
+def test_batch_saves_once(db):
+    db.create()
+    with db.batch():
+        for i in range(5):
+            db.upsert([doc(f"id{i}", f"company {i}")])
+        # Nothing is visible until the batch ends
+        assert db.documents == []
+    assert [d["id"] for d in db.documents] == [f"id{i}" for i in range(5)]
+    assert len(db.embeddings) == 5
+    assert db.path.is_symlink()
+    assert len(builds(db)) <= 2
+
+
+def test_upsert_replaces_by_id_and_delete_is_deferred(db):
+    db.upsert([doc("a", "alpha"), doc("b", "beta")])
+    with db.batch():
+        db.upsert([doc("a", "alpha v2")])
+        db.delete_ids(["b"])
+        assert db.id_exists("b")
+    assert [(d["id"], d["content"]) for d in db.documents] == [("a", "alpha v2")]
+    assert db.search("alpha v2", limit=1)[0].id == "a"
+
+
+def test_reader_keeps_one_consistent_state_across_a_save(db):
+    db.upsert([doc("a", "alpha"), doc("b", "beta")])
+    before = db.state
+    db.upsert([doc("c", "gamma")])
+    # The old state still pairs its own rows with its own vectors
+    assert len(before.documents) == len(before.embeddings) == 2
+    assert before.row_by_id == {"a": 0, "b": 1}
+    assert len(db.state.documents) == len(db.state.embeddings) == 3
+    assert db.search("gamma", limit=1)[0].id == "c"
+
+
+def test_reingest_skips_unchanged_rows(tmp_path, db):
+    source = open("query_results.csv", encoding="utf-8").read().splitlines()
+    csv_path = tmp_path / "rows.csv"
+    csv_path.write_text("\n".join(source[:21]) + "\n", encoding="utf-8")
+    knowledge_base = SimpleNamespace(vector_db=db, path=str(csv_path))
+
+    first = ingest(knowledge_base)
+    assert (first.added, first.unchanged) == (20, 0)
+    calls = db.embedder.calls
+
+    second = ingest(knowledge_base)
+    assert (second.added, second.changed, second.removed, second.unchanged) == (0, 0, 0, 20)
+    assert db.embedder.calls == calls
+
+    edited = source[:20] + [source[20].replace(",", ",9", 1)]
+    csv_path.write_text("\n".join(edited[:-2] + edited[-1:]) + "\n", encoding="utf-8")
+    third = ingest(knowledge_base)
+    assert (third.changed, third.removed, third.unchanged) == (1, 1, 18)
+    assert len(db.documents) == 19
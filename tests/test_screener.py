@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from screener import Screener, ScreenerError
+
+
+class FakeSnapshot:
+    def __init__(self, columns):
+        self.columns = columns
+
+    @property
+    def fields(self):
+        return list(self.columns)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    def column(self, field):
+        return self.columns[field]
+
+
+@pytest.fixture
+def screener():
+    return Screener(FakeSnapshot({
+        "name": np.array(["Alpha", "Beta", "Gamma", "Delta", "Epsilon"]),
+        "nse_code": np.array(["ALPHA", "BETA", "GAMMA", "DELTA", "EPSILON"]),
+        "bse_code": np.array(["1", "2", "3", "4", "5"]),
+        "industry": np.array(["Banks", "Capital Markets", "Banks", "Software", ""]),
+        "market_capitalization": np.array([5000.0, 1500.0, 800.0, np.nan, 12000.0]),
+        "peg_ratio": np.array([0.5, np.nan, 1.5, 1.0, 2.0]),
+    }))
+
+
+def codes(rows):
+    return [row["nse_code"] for row in rows]
+
+
+def test_filter_and_sort(screener):
+    rows = screener.screen("market_capitalization > 1000", sort_by="peg_ratio")
+    assert codes(rows) == ["ALPHA", "EPSILON", "BETA"]
+
+
+def test_sort_by_text_field(screener):
+    rows = screener.screen("market_capitalization > 1000", sort_by="industry")
+    assert codes(rows) == ["ALPHA", "BETA", "EPSILON"]
+    rows = screener.screen("market_capitalization > 0", sort_by="industry", ascending=False)
+    # Blank text sorts last in both directions
+    assert codes(rows) == ["BETA", "ALPHA", "GAMMA", "EPSILON"]
+
+
+@pytest.mark.parametrize("where", ["[1, 2]", "peg_ratio", "industry", "1 < 2", "peg_ratio > [1, 2]"])
+def test_non_boolean_where_is_rejected(screener, where):
+    with pytest.raises(ScreenerError):
+        screener.screen(where)
+
+
+def test_constant_sort_key_is_rejected(screener):
+    with pytest.raises(ScreenerError):
+        screener.screen(sort_by="[1, 2]")
+
+
+@pytest.mark.parametrize("where, expected", [
+    ("peg_ratio != 1", ["ALPHA", "GAMMA", "EPSILON"]),
+    ("nse_code not in ['ALPHA']", ["BETA", "GAMMA", "DELTA", "EPSILON"]),
+    ("not (peg_ratio < 1)", ["GAMMA", "DELTA", "EPSILON"]),
+    ("not (peg_ratio < 1 or market_capitalization > 10000)", ["GAMMA"]),
+    ("not not (peg_ratio < 1)", ["ALPHA"]),
+    ("not isnull(peg_ratio) and not (market_capitalization >= 1000)", ["GAMMA"]),
+])
+def test_missing_values_never_match(screener, where, expected):
+    assert codes(screener.screen(where)) == expected
+
+
+def test_total_counts_matches_before_limit(screener):
+    rows, total = screener.screen_with_total("peg_ratio > 0", limit=2)
+    assert len(rows) == 2
+    assert total == 4
@@ -0,0 +1,102 @@
+import json
+from types import SimpleNamespace
+import pytest
+from models import StockRecommendation
+from partial_json import PartialObjectParser
+from structured_output import ensure_structured, extract_fields, parse_structured
+
+RECOMMENDATION = {
+    "recommendation": "BUY",
+    "confidence_score": 80,
+    "target_price": 2500,
+    "time_horizon": "12 months",
+    "key_strengths": ["Low debt"],
+    "key_risks": ["Valuation"],
+    "rationale": "Growing earnings",
+    "alternative_scenarios": "A slowdown would hurt margins",
+}
+
+
+def answer(**fields) -> str:
+    """The recommendation as JSON, with the given fields written as raw JSON text"""
+    parts = [f"{json.dumps(key)}: {fields.pop(key) if key in fields else json.dumps(value)}"
+             for key, value in RECOMMENDATION.items()]
+    parts += [f"{json.dumps(key)}: {value}" for key, value in fields.items()]
+    return "{" + ", ".join(parts) + "}"
+
+
+def test_valid_json_needs_no_repair():
+    result = parse_structured(answer(), StockRecommendation)
+    assert result.value == StockRecommendation(**RECOMMENDATION)
+    assert result.repairs == []
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("2,500", 2500.0),
+    ("1,23,456", 123456.0),
+    ("2,500.75", 2500.75),
+    ('"₹2,500"', 2500.0),
+    ('"Rs. 2500"', 2500.0),
+    ('"12.5%"', 12.5),
+    ('"N/A"', None),
+])
+def test_numbers_are_repaired(raw, expected):
+    result = parse_structured(answer(target_price=raw), StockRecommendation)
+    assert result.value is not None
+    assert result.value.target_price == expected
+
+
+def test_thousands_separator_keeps_following_fields():
+    fields = extract_fields('{"current_price": 1,23,456, "industry": "Banks"}')
+    assert fields == {"current_price": "1,23,456", "industry": "Banks"}
+
+
+def test_thousands_separator_streamed_in_chunks():
+    parser = PartialObjectParser()
+    text = answer(target_price="2,500")
+    for i in range(0, len(text), 3):
+        parser.feed(text[i:i + 3])
+    result = parse_structured(text, StockRecommendation, parser)
+    assert result.value.target_price == 2500.0
+
+
+def test_unparseable_bare_value_is_invalid():
+    result = parse_structured(answer(target_price="2, 500 or so"), StockRecommendation)
+    assert result.value is None
+    assert list(result.errors) == ["target_price"]
+
+
+def test_missing_required_number_is_invalid():
+    result = parse_structured(answer(confidence_score='"N/A"'), StockRecommendation)
+    assert result.value is None
+    assert list(result.errors) == ["confidence_score"]
+
+
+def test_prose_fence_and_trailing_text_are_cut():
+    text = f"Here is the analysis:\n```json\n{answer()}\n```\nLet me know if you need more."
+    result = parse_structured(text, StockRecommendation)
+    assert result.value == StockRecommendation(**RECOMMENDATION)
+    assert result.repairs == ["json:extract"]
+
+
+def test_list_written_as_bullets():
+    result = parse_structured(answer(key_risks=json.dumps("- Valuation\n- Competition")), StockRecommendation)
+    assert result.value.key_risks == ["Valuation", "Competition"]
+    assert "key_risks:list" in result.repairs
+
+
+def test_key_case_is_fixed():
+    text = answer().replace('"rationale"', '"Rationale"')
+    result = parse_structured(text, StockRecommendation)
+    assert result.value.rationale == RECOMMENDATION["rationale"]
+    assert "rationale:key" in result.repairs
+
+
+def test_invalid_field_is_reasked():
+    replies = [json.dumps({"target_price": 2500})]
+    model = SimpleNamespace(id="fake", response=lambda messages, response_format=None: SimpleNamespace(content=replies.pop()))
+    agent = SimpleNamespace(name="Analyst", description=None, role=None, model=model, response_model=StockRecommendation)
+    text = answer(target_price='"somewhere around the high"')
+    value = ensure_structured(agent, "Analyse TCS", SimpleNamespace(content=text, model="fake"), text)
+    assert value == StockRecommendation(**RECOMMENDATION)
+    assert replies == []
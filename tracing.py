@@ -0,0 +1,292 @@
+import functools
+import inspect
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional
+from uuid import uuid4
+import numpy as np
+from fastapi import APIRouter
+from agno.utils.log import log_debug, logger
+from cache_store import CACHE_DIR
+
+# "jsonl" (default), "otel" to hand spans to an installed OpenTelemetry SDK, or "none"
+TRACE_SINK = os.getenv("TRACE_SINK", "jsonl").lower()
+# Each process writes its own file next to this path, e.g. traces.1234.jsonl
+TRACE_FILE = Path(os.getenv("TRACE_FILE", CACHE_DIR / "traces.jsonl"))
+# Each file is rotated at this size, keeping TRACE_BACKUPS old files
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", 50 * 1024 * 1024))
+TRACE_BACKUPS = int(os.getenv("TRACE_BACKUPS", 3))
+# Recent durations kept per span name for the percentiles on /metrics
+TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", 1000))
+
+
+class Span:
+    def __init__(self, name: str, kind: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent is not None else uuid4().hex
+        self.span_id = uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.status = "ok"
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def add(self, attribute: str, amount: int = 1) -> None:
+        """Increase a counter attribute, e.g. retries"""
+        self.attributes[attribute] = self.attributes.get(attribute, 0) + amount
+
+    def record_response(self, response) -> None:
+        """Model id, token usage and model call count from an agno RunResponse"""
+        if response is None:
+            return
+        metrics = getattr(response, "metrics", None) or {}
+        self.set(
+            model=getattr(response, "model", None),
+            model_provider=getattr(response, "model_provider", None),
+            input_tokens=int(sum(metrics.get("input_tokens") or [])),
+            output_tokens=int(sum(metrics.get("output_tokens") or [])),
+            cached_tokens=int(sum(metrics.get("cached_tokens") or [])),
+            model_calls=len(metrics.get("input_tokens") or []),
+        )
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> dict:
+        # Field names follow the OTLP JSON span encoding
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class SpanStats:
+    """Rolling per-name aggregates served on /metrics"""
+
+    def __init__(self, window: int = TRACE_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self.durations: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self.counts: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.durations[span.name].append(span.duration_ms)
+            counts = self.counts[span.name]
+            counts["count"] += 1
+            counts["errors"] += span.status != "ok"
+            for key in ("input_tokens", "output_tokens", "cached_tokens", "model_calls", "retries"):
+                counts[key] += span.attributes.get(key, 0) or 0
+            if "cache" in span.attributes:
+                counts[f"cache_{span.attributes['cache']}"] += 1
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            result = {}
+            for name, durations in self.durations.items():
+                values = np.fromiter(durations, dtype=np.float64)
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                counts = self.counts[name]
+                hits, misses = counts.get("cache_hit", 0), counts.get("cache_miss", 0)
+                result[name] = {
+                    "count": int(counts["count"]),
+                    "errors": int(counts["errors"]),
+                    "p50_ms": round(float(p50), 2),
+                    "p95_ms": round(float(p95), 2),
+                    "p99_ms": round(float(p99), 2),
+                    "max_ms": round(float(values.max()), 2),
+                    "input_tokens": int(counts["input_tokens"]),
+                    "output_tokens": int(counts["output_tokens"]),
+                    "cached_tokens": int(counts["cached_tokens"]),
+                    "model_calls": int(counts["model_calls"]),
+                    "retries": int(counts["retries"]),
+                    "cache_hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+                }
+            return result
+
+
+class Tracer:
+    def __init__(self, sink: str = TRACE_SINK, path: Path = TRACE_FILE):
+        self.sink = sink
+        self.path = path
+        self.stats = SpanStats()
+        self._lock = threading.Lock()
+        self._writer: Optional[logging.Logger] = None
+        self._otel = None
+        if sink == "otel":
+            try:
+                from opentelemetry import trace
+
+                self._otel = trace.get_tracer("basic-chat")
+            except ImportError:
+                logger.warning("TRACE_SINK=otel but opentelemetry is not installed, writing JSONL instead")
+                self.sink = "jsonl"
+
+    def export(self, span: Span) -> None:
+        self.stats.add(span)
+        if self.sink == "jsonl":
+            self._jsonl().info(json.dumps(span.to_dict(), default=str))
+        elif self._otel is not None:
+            otel_span = self._otel.start_span(span.name, start_time=span.start_ns,
+                                              attributes={k: v for k, v in span.attributes.items()
+                                                          if isinstance(v, (str, bool, int, float))})
+            otel_span.end(end_time=span.end_ns)
+
+    def _jsonl(self) -> logging.Logger:
+        """
+        Logger whose records are written by a background thread to a rotating file,
+        so exporting a span on the event loop is a queue put rather than file I/O
+
+        Rollover renames the file, which other processes appending to the same
+        path would not notice, so every process writes its own.
+        """
+        with self._lock:
+            if self._writer is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                path = self.path.with_name(f"{self.path.stem}.{os.getpid()}{self.path.suffix}")
+                handler = RotatingFileHandler(path, maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUPS,
+                                              encoding="utf-8", delay=True)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                spans: queue.SimpleQueue = queue.SimpleQueue()
+                listener = QueueListener(spans, handler)
+                listener.start()
+                # Spans still queued at exit are written before the process ends
+                atexit.register(listener.stop)
+                writer = logging.getLogger(f"tracing.jsonl.{os.getpid()}.{id(self)}")
+                writer.propagate = False
+                writer.setLevel(logging.INFO)
+                writer.addHandler(QueueHandler(spans))
+                self._writer = writer
+            return self._writer
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_tracer: Optional[Tracer] = None
+
+
+def _reopen_after_fork() -> None:
+    # The writer thread does not survive fork(), and the child needs its own file
+    if _tracer is not None:
+        _tracer._lock = threading.Lock()
+        _tracer._writer = None
+
+
+os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+def get_tracer() -> Tracer:
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def start_span(name: str, kind: str = "internal", parent: Optional[Span] = None, **attributes: Any) -> Span:
+    """Span that is not made current; for runs that span generator yields, closed with end_span()"""
+    return Span(name, kind, parent or _current.get(), {k: v for k, v in attributes.items() if v is not None})
+
+
+def end_span(current: Span, error: Optional[BaseException] = None) -> None:
+    if error is not None:
+        current.status = "error"
+        current.set(error=f"{type(error).__name__}: {error}")
+    current.end_ns = time.time_ns()
+    log_debug(f"Span {current.name}: {current.duration_ms:.1f} ms")
+    get_tracer().export(current)
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", parent: Optional[Span] = None, **attributes: Any) -> Iterator[Span]:
+    """Time a block as a child of `parent` or the current span; works across await and to_thread"""
+    current = start_span(name, kind, parent, **attributes)
+    token = _current.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Finished in a different context (e.g. a generator resumed elsewhere)
+            pass
+        end_span(current, error)
+
+
+def _traced(name: str, fn):
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with span(name, kind="tool"):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with span(name, kind="tool"):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def instrument_tools(agent) -> None:
+    """Wrap every toolkit function of an agent so each tool call becomes a span"""
+    for tool in agent.tools or []:
+        functions = getattr(tool, "functions", None)
+        if not functions:
+            continue
+        for name, function in functions.items():
+            if function.entrypoint is not None and not getattr(function.entrypoint, "_traced", False):
+                function.entrypoint = _traced(f"tool.{tool.name}.{name}", function.entrypoint)
+                function.entrypoint._traced = True
+
+
+def read_spans(limit: int = 100, path: Path = TRACE_FILE) -> List[dict]:
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        lines = deque(f, maxlen=limit)
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+metrics_router = APIRouter(tags=["Metrics"])
+
+
+@metrics_router.get("/metrics")
+def get_metrics():
+    """Latency percentiles, token totals and cache hit rates per span name in this process"""
+    return get_tracer().stats.summary()
+
+
+@metrics_router.get("/metrics/spans")
+def get_recent_spans(limit: int = 100):
+    """Most recent spans from the JSONL sink"""
+    return read_spans(limit)
@@ -1,51 +1,48 @@
 from agno.workflow import Workflow, RunResponse, RunEvent
-from typing import Iterator, Optional
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
+import asyncio
+from contextlib import nullcontext
 import json
-from pathlib import Path
-from pydantic import BaseModel, Field
 from agno.agent import Agent
 from agno.models.openai import OpenAIChat
-from agno.models.deepseek import DeepSeek
-from agno.tools.csv_toolkit import CsvTools
 from agno.tools.duckduckgo import DuckDuckGoTools
 from agno.tools.reasoning import ReasoningTools
 from dotenv import load_dotenv
 from agno.tools.tavily import TavilyTools
 from agno.playground import Playground
+from agno.utils.log import logger
+from agno.utils.prompts import get_json_output_prompt
+from fastapi import APIRouter, Form
+from fastapi.responses import StreamingResponse
+from models import StockData, MetaPrompt, StockRecommendation
+from company_resolver import get_resolver
+from dataset import DatasetCsvTools, DatasetVersionMiddleware, dataset_router, start_dataset_watcher
+from meta_prompt_cache import get_meta_prompt_cache, industry_key
+from screener import ScreenerTools
+from provider_limits import ProviderLimits
+from industry_stats import PeerComparison, get_industry_stats
+from prompt_builder import ANALYSIS_INPUT_LEGEND, TokenReport, build_analysis_prompt
+from response_cache import ResponseCacheMiddleware
+from partial_json import PartialObjectParser
+from precompute import RecommendationTools, get_recommendation_store, precompute_router, start_background_precompute
+from model_router import RoutedModel, models_router, routed_model
+from search_cache import instrument_agents, search_cache_router
+from structured_output import aensure_structured, ensure_structured, record_full_retry, structured_router
+from tracing import current_span, end_span, metrics_router, span, start_span
 import os
 
 load_dotenv()
 
-# Agent 1: Stock Data Model and Agent
-class StockData(BaseModel):
-    name: str = Field(..., description="Company Name as registered on stock exchanges")
-    bse_code: str = Field(..., description="Ticker symbol on Bombay Stock Exchange")
-    nse_code: str = Field(..., description="Ticker symbol on National Stock Exchange of India")
-    industry: str = Field(..., description="Sector or industry classification of the company")
-    current_price: Optional[float] = Field(..., description="Latest market price per share in INR")
-    price_to_earning: Optional[float] = Field(..., description="Price-to-Earnings ratio")
-    market_capitalization: Optional[float] = Field(..., description="Total market value of outstanding shares in INR")
-    earnings_yield: Optional[float] = Field(..., description="Annual earnings per share divided by current share price")
-    div_plus_earning_yield: Optional[float] = Field(..., description="Sum of dividend yield and earnings yield")
-    croic: Optional[float] = Field(..., description="Cash Return on Invested Capital")
-    return_on_assets: Optional[float] = Field(..., description="Net income divided by average total assets")
-    peg_ratio: Optional[float] = Field(..., description="Price/Earnings to Growth ratio")
-    npm_last_year: Optional[float] = Field(..., description="Net Profit Margin for the most recent fiscal year")
-    change_in_promoter_holding_3years: Optional[float] = Field(..., description="Three-year change in percentage points of promoter shareholding")
-    sales_growth_3years: Optional[float] = Field(..., description="Three-year compound annual growth rate of sales revenue")
-    eps_growth_3years: Optional[float] = Field(..., description="Three-year compound annual growth rate of earnings per share")
-    debt_to_equity: Optional[float] = Field(..., description="Total debt divided by shareholders equity")
-    dividend_yield: Optional[float] = Field(..., description="Annual dividend per share divided by current price")
-    dividend_payout_ratio: Optional[float] = Field(..., description="Percentage of net income distributed as dividends")
-    price_to_book_value: Optional[float] = Field(..., description="Market price divided by book value per share")
-    pledged_percentage: Optional[float] = Field(..., description="Percentage of promoter shares pledged as loan collateral")
-    eps_growth_10years: Optional[float] = Field(..., description="Ten-year compound annual growth rate of earnings per share")
-    return_over_1year: Optional[float] = Field(..., description="Total shareholder return including dividends over past 1 year")
-    return_over_10years: Optional[float] = Field(..., description="Total shareholder return including dividends over past 10 years")
+# Receives workflow events (dicts with an "event" key) as they happen
+Emit = Callable[[dict], None]
 
+# Resolver matches this confident are used to start industry research before extraction finishes
+INDUSTRY_HINT_CONFIDENCE = 0.5
+
+# Agent 1: Stock Data Agent
 csv_data_agent = Agent(
-    model=DeepSeek(id="deepseek-chat"),
-    tools=[CsvTools(csvs=[Path("query_results.csv")])],
+    model=routed_model("fast"),
+    tools=[DatasetCsvTools()],
     response_model=StockData,
     description="You are a financial data extraction specialist.",
     instructions=[
@@ -65,17 +62,9 @@ csv_data_agent = Agent(
     show_tool_calls=True
 )
 
-# Agent 2: Meta Prompt Model and Agent
-class MetaPrompt(BaseModel):
-    industry_context: str = Field(..., description="Industry-specific context and trends")
-    company_context: str = Field(..., description="Company-specific context and background")
-    analysis_framework: str = Field(..., description="Tailored analysis framework for this industry/company")
-    key_metrics_focus: str = Field(..., description="Most important metrics to focus on for this industry")
-    risk_factors: str = Field(..., description="Industry and company-specific risk factors to consider")
-    meta_prompt: str = Field(..., description="Complete meta prompt for stock analysis")
-
+# Agent 2: Meta Prompt Agent
 meta_prompt_agent = Agent(
-    model=DeepSeek(id="deepseek-reasoner"),
+    model=routed_model("reasoning"),
     tools=[TavilyTools()],
     response_model=MetaPrompt,
     description="You are an expert financial analyst and prompt engineer who creates specialized analysis frameworks.",
@@ -88,49 +77,260 @@ meta_prompt_agent = Agent(
         "- Company's position within the industry",
         "- Regulatory environment and market conditions",
         "- Seasonal factors and business cycles",
-        "Generate a detailed meta prompt for stock analysis tailored to this specific company and industry"
+        "Generate a detailed meta prompt for stock analysis tailored to this specific industry, company figures are added separately"
     ],
     show_tool_calls=True
 )
 
-# Agent 3: Stock Recommendation Model and Agent
-class StockRecommendation(BaseModel):
-    recommendation: str = Field(..., description="BUY, HOLD, or SELL recommendation")
-    confidence_score: float = Field(..., description="Confidence score from 0-100")
-    target_price: Optional[float] = Field(..., description="Target price if applicable")
-    time_horizon: str = Field(..., description="Recommended investment time horizon")
-    key_strengths: list[str] = Field(..., description="Key strengths supporting the recommendation")
-    key_risks: list[str] = Field(..., description="Key risks and concerns")
-    rationale: str = Field(..., description="Detailed rationale for the recommendation")
-    alternative_scenarios: str = Field(..., description="Alternative scenarios and their implications")
-
+# Agent 3: Stock Recommendation Agent
 analysis_agent = Agent(
-    model=DeepSeek(id="deepseek-reasoner"),
+    model=routed_model("reasoning"),
     tools=[TavilyTools()],
     response_model=StockRecommendation,
     description="You are a senior equity research analyst with 15+ years of experience in Indian stock markets.",
     instructions=[
         "Use the provided meta prompt as your analysis framework",
         "Analyze the structured financial data comprehensively",
+        "Use the Peers section (industry median, quartiles, percentile and z-score per metric) for relative valuation instead of searching for industry averages",
         "Search for recent news and developments about the company",
         "Use reasoning tools to work through your analysis step by step",
         "Consider multiple valuation approaches",
         "Evaluate both quantitative metrics and qualitative factors",
         "Provide a clear BUY/HOLD/SELL recommendation with detailed rationale",
-        "Include confidence score and risk assessment"
+        "Include confidence score and risk assessment",
+        ANALYSIS_INPUT_LEGEND,
     ],
     show_tool_calls=True,
     markdown=True
 )
 
+# Report sections in order, with the StockRecommendation fields each one needs
+REPORT_SECTIONS = {
+    "recommendation": ("recommendation", "confidence_score", "target_price", "time_horizon"),
+    "strengths": ("key_strengths",),
+    "risks": ("key_risks",),
+    "rationale": ("rationale",),
+    "scenarios": ("alternative_scenarios",),
+}
+
+
+def render_section(section: str, fields: dict) -> str:
+    """Markdown for one report section from (possibly not yet validated) recommendation fields"""
+    if section == "recommendation":
+        return f"""## 🎯 Recommendation: {fields['recommendation']}
+**Confidence Score:** {fields['confidence_score']}/100
+**Target Price:** ₹{fields['target_price'] if fields['target_price'] else 'N/A'}
+**Time Horizon:** {fields['time_horizon']}"""
+    if section == "strengths":
+        return "## 📈 Key Strengths\n" + chr(10).join([f"• {strength}" for strength in fields["key_strengths"] or []])
+    if section == "risks":
+        return "## ⚠️ Key Risks\n" + chr(10).join([f"• {risk}" for risk in fields["key_risks"] or []])
+    if section == "rationale":
+        return f"## 🔍 Analysis Rationale\n{fields['rationale']}"
+    return f"## 🎲 Alternative Scenarios\n{fields['alternative_scenarios']}"
+
+
+def format_report(stock_data: StockData, recommendation: StockRecommendation) -> str:
+    fields = recommendation.model_dump()
+    sections = "\n\n".join(render_section(section, fields) for section in REPORT_SECTIONS)
+    return f"""
+# Stock Analysis Report: {stock_data.name}
+
+{sections}
+
+---
+*Analysis completed using industry-specific framework for {stock_data.industry} sector*
+"""
+
+
+class ReportStream:
+    """
+    Emits each report section as soon as the recommendation fields it needs have been parsed
+
+    A section already sent from a streamed attempt that was then repaired,
+    re-asked or re-run is sent again with replace: true once its markdown
+    differs, so clients end up with the same sections as the final report.
+    """
+    
+    def __init__(self, stock_data: StockData, emit: Emit):
+        self.emit = emit
+        # section -> markdown last sent
+        self.sent: Dict[str, str] = {}
+        emit({"event": "section", "section": "title", "markdown": f"# Stock Analysis Report: {stock_data.name}"})
+    
+    def update(self, fields: dict) -> None:
+        for section, needed in REPORT_SECTIONS.items():
+            if not all(field in fields for field in needed):
+                continue
+            markdown = render_section(section, fields)
+            previous = self.sent.get(section)
+            if markdown == previous:
+                continue
+            self.sent[section] = markdown
+            event = {"event": "section", "section": section, "markdown": markdown}
+            if previous is not None:
+                event["replace"] = True
+            self.emit(event)
+
+
+def build_analysis_input(stock_data: StockData, meta_prompt: Optional[MetaPrompt], peers: Optional[PeerComparison] = None) -> str:
+    # Compact, token-budgeted encoding; the industry framework leads so it stays a cacheable prefix
+    return build_analysis_prompt(stock_data, meta_prompt, peers).text
+
+
 class StockAnalysisWorkflow(Workflow):
     description: str = "Complete stock analysis workflow with three specialized agents"
     
-    def __init__(self):
+    def __init__(
+        self,
+        csv_agent: Agent = csv_data_agent,
+        meta_prompt_agent: Agent = meta_prompt_agent,
+        analysis_agent: Agent = analysis_agent,
+        provider_limits: Optional[ProviderLimits] = None,
+        count_request: bool = True,
+    ):
         super().__init__()
-        self.csv_agent = csv_data_agent
-        self.meta_prompt_agent = meta_prompt_agent  
+        self.csv_agent = csv_agent
+        self.meta_prompt_agent = meta_prompt_agent
         self.analysis_agent = analysis_agent
+        # Optional per-provider semaphores, set when many workflows run concurrently
+        self.provider_limits = provider_limits
+        # Industry research is shared across companies and runs
+        self.meta_prompt_cache = get_meta_prompt_cache()
+        # Token usage per stage of the current run
+        self.token_report = TokenReport()
+        # Root span of the current run, parent of every stage span
+        self.run_span = None
+        # Recommendations stored by earlier runs and the background precompute job
+        self.recommendations = get_recommendation_store()
+        # Background runs should not make a company look popular
+        self.count_request = count_request
+
+    @property
+    def resolver(self):
+        # Local index lookup for step 1 instead of an LLM round trip, for the run's dataset version
+        return get_resolver()
+    
+    def _industry_meta_prompt(self, industry: str) -> Optional[MetaPrompt]:
+        prompt = f"Industry: {industry}"
+        # Only called on a cache miss
+        current_span().set(cache="miss")
+        response, meta = self._structured(self.meta_prompt_agent, prompt)
+        current_span().record_response(response)
+        self.token_report.record("meta_prompt", prompt, response)
+        return meta
+    
+    def _stored(self, stock_data: StockData) -> Optional[dict]:
+        """Stored recommendation for this exact row and industry context, kept in session_state on a hit"""
+        if self.count_request:
+            self.recommendations.record_request(stock_data)
+        with span("stage.precomputed", kind="stage", parent=self.run_span) as stage:
+            entry = self.recommendations.get(stock_data)
+            stage.set(cache="hit" if entry is not None else "miss", version=entry and entry["version"])
+        if entry is not None:
+            self.session_state["stock_data"] = stock_data.model_dump()
+            self.session_state["recommendation"] = entry["recommendation"]
+            self.session_state["token_report"] = self.token_report.to_dict()
+            self.session_state["precomputed"] = {k: entry[k] for k in ("version", "created")}
+        else:
+            self.session_state.pop("precomputed", None)
+        return entry
+    
+    def _store(self, stock_data: StockData, meta_prompt: Optional[MetaPrompt], recommendation: StockRecommendation) -> None:
+        if meta_prompt is None:
+            return
+        tokens = sum(stage["input_tokens"] + stage["output_tokens"] for stage in self.token_report.to_dict())
+        self.recommendations.put(stock_data, meta_prompt, recommendation, tokens)
+    
+    def _stage(self, stage: str):
+        if self.provider_limits is None:
+            return nullcontext()
+        return self.provider_limits.stage(stage)
+    
+    def _structured(self, agent: Agent, prompt: str):
+        """Run a response_model agent, repairing or re-asking for invalid fields before re-running it"""
+        response = agent.run(prompt)
+        content = ensure_structured(agent, prompt, response)
+        if content is None:
+            record_full_retry(agent, response)
+            response = agent.run(prompt)
+            content = ensure_structured(agent, prompt, response)
+        return response, content
+    
+    async def _astructured(self, agent: Agent, prompt: str, stage: str, emit: Emit,
+                           stream_tokens: bool, on_fields: Optional[Callable[[dict], None]] = None):
+        """Run a response_model agent; when streaming, pass its tokens and parsed fields to emit()"""
+        if not stream_tokens:
+            response = await agent.arun(prompt)
+            content = await aensure_structured(agent, prompt, response)
+            if content is None:
+                record_full_retry(agent, response)
+                response = await agent.arun(prompt)
+                content = await aensure_structured(agent, prompt, response)
+            return response, content
+        
+        # agno does not stream response_model agents, so ask for the same JSON in the prompt and parse it here
+        streaming_agent = agent.deep_copy()
+        streaming_agent.response_model = None
+        streaming_agent.additional_context = "\n".join(
+            part for part in (agent.additional_context, get_json_output_prompt(agent.response_model)) if part
+        )
+        models = streaming_agent.model.candidates if isinstance(streaming_agent.model, RoutedModel) else [streaming_agent.model]
+        for model in models:
+            if isinstance(model, OpenAIChat):
+                model.request_params = {**(model.request_params or {}), "response_format": {"type": "json_object"}}
+        parser = PartialObjectParser()
+        partial: Dict[str, str] = {}
+        text = ""
+        async for chunk in await streaming_agent.arun(prompt, stream=True, stream_intermediate_steps=True):
+            if chunk.event == RunEvent.tool_call_started.value and chunk.tools:
+                emit({"event": "tool", "stage": stage, "tool": chunk.tools[-1].tool_name})
+            elif chunk.event != RunEvent.run_response.value:
+                continue
+            if chunk.thinking:
+                emit({"event": "thinking", "stage": stage, "delta": chunk.thinking})
+            if not isinstance(chunk.content, str) or not chunk.content:
+                continue
+            text += chunk.content
+            emit({"event": "token", "stage": stage, "delta": chunk.content})
+            for field, value, complete in parser.feed(chunk.content):
+                if complete:
+                    partial.pop(field, None)
+                    emit({"event": "field", "stage": stage, "field": field, "value": value, "complete": True})
+                    if on_fields is not None:
+                        on_fields(parser.fields)
+                else:
+                    # Partial strings only grow, so send what is new
+                    emit({"event": "field", "stage": stage, "field": field,
+                          "delta": value[len(partial.get(field, "")):], "complete": False})
+                    partial[field] = value
+        
+        response = streaming_agent.run_response
+        # Reuses what the parser already took apart; bad values are repaired or re-asked for field by field
+        content = await aensure_structured(agent, prompt, response, text=text, parser=parser)
+        if content is None:
+            emit({"event": "status", "stage": stage, "message": f"⚠️ Could not parse streamed {stage} output, retrying"})
+            record_full_retry(agent, response)
+            response = await agent.arun(prompt)
+            content = await aensure_structured(agent, prompt, response)
+        return response, content
+    
+    async def _aindustry_meta_prompt(self, industry: str, emit: Emit, stream_tokens: bool) -> Optional[MetaPrompt]:
+        prompt = f"Industry: {industry}"
+        current_span().set(cache="miss")
+        async with self._stage("meta_prompt"):
+            response, meta = await self._astructured(self.meta_prompt_agent, prompt, "meta_prompt", emit, stream_tokens)
+        current_span().record_response(response)
+        self.token_report.record("meta_prompt", prompt, response)
+        return meta
+    
+    async def _ameta_prompt(self, industry: str, emit: Emit, stream_tokens: bool) -> Optional[MetaPrompt]:
+        async def create(industry: str) -> Optional[MetaPrompt]:
+            return await self._aindustry_meta_prompt(industry, emit, stream_tokens)
+        
+        # Runs as its own task, so the stage span is opened here rather than around the await
+        with span("stage.meta_prompt", kind="stage", parent=self.run_span, industry=industry, cache="hit"):
+            return await self.meta_prompt_cache.aget_or_create(industry, create)
     
     def run_workflow(self, message: str) -> Iterator[RunResponse]:
         """
@@ -139,84 +339,286 @@ class StockAnalysisWorkflow(Workflow):
         Args:
             message: Company query (e.g., "RELIANCE" or "Reliance Industries")
         """
-        company_query = message
-        
+        self.token_report = TokenReport()
+        # Spans are never held open across a yield, the consumer may resume us in another context
+        self.run_span = start_span("workflow.run", kind="workflow", query=message)
+        error = None
+        try:
+            yield from self._run_steps(message)
+        except GeneratorExit:
+            # The consumer stopped reading, not a failure
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            end_span(self.run_span, error)
+    
+    def _run_steps(self, company_query: str) -> Iterator[RunResponse]:
         # Step 1: Extract structured data from CSV
         yield RunResponse(content="🔍 Extracting company data from CSV...")
         
-        csv_response = self.csv_agent.run(f"Find and extract all data for company: {company_query}")
-        if not csv_response.content:
-            yield RunResponse(content="❌ Company not found in CSV data")
-            return
+        with span("stage.resolve", kind="stage", parent=self.run_span) as stage:
+            stock_data = self.resolver.resolve(company_query)
+            stage.set(cache="hit" if stock_data is not None else "miss")
+        if stock_data is None:
+            # No confident local match, let the agent search the CSV
+            extract_prompt = f"Find and extract all data for company: {company_query}"
+            with span("stage.extract", kind="stage", parent=self.run_span) as stage:
+                csv_response = self.csv_agent.run(extract_prompt)
+                stock_data = ensure_structured(self.csv_agent, extract_prompt, csv_response)
+                stage.record_response(csv_response)
+            self.token_report.record("extract", extract_prompt, csv_response)
+            if stock_data is None:
+                yield RunResponse(content="❌ Company not found in CSV data")
+                return
             
-        stock_data = csv_response.content
         yield RunResponse(content=f"✅ Extracted data for {stock_data.name}")
         
+        stored = self._stored(stock_data)
+        if stored is not None:
+            yield RunResponse(content=f"⚡ Using precomputed recommendation (version {stored['version']})")
+            yield RunResponse(content=format_report(stock_data, StockRecommendation(**stored["recommendation"])))
+            return
+        
         # Step 2: Generate meta prompt based on industry and company
         yield RunResponse(content="🧠 Generating specialized analysis framework...")
         
-        meta_prompt_input = f"Industry: {stock_data.industry}, Company: {stock_data.name}"
-        meta_response = self.meta_prompt_agent.run(meta_prompt_input)
-        meta_prompt = meta_response.content
+        with span("stage.meta_prompt", kind="stage", parent=self.run_span, industry=stock_data.industry, cache="hit"):
+            meta_prompt = self.meta_prompt_cache.get_or_create(stock_data.industry, self._industry_meta_prompt)
         
-        yield RunResponse(content="✅ Generated industry-specific analysis framework")
+        if meta_prompt is None:
+            yield RunResponse(content="⚠️ Could not generate an industry framework, analysing without one")
+        else:
+            yield RunResponse(content="✅ Generated industry-specific analysis framework")
         
         # Step 3: Perform comprehensive stock analysis
         yield RunResponse(content="📊 Performing comprehensive stock analysis...")
         
-        analysis_input = {
-            "meta_prompt": meta_prompt.meta_prompt,
-            "stock_data": stock_data.model_dump(),
-            "company_name": stock_data.name,
-            "industry": stock_data.industry
-        }
+        with span("stage.analysis", kind="stage", parent=self.run_span) as stage:
+            # Peer percentiles come from the precomputed industry table, no model or network call
+            peers = get_industry_stats().compare(stock_data)
+            analysis_input = build_analysis_input(stock_data, meta_prompt, peers)
+            analysis_response, recommendation = self._structured(self.analysis_agent, analysis_input)
+            stage.record_response(analysis_response)
+        self.token_report.record("analysis", analysis_input, analysis_response)
+        if recommendation is None:
+            yield RunResponse(content="❌ Analysis failed: no valid recommendation after retrying")
+            return
+        self.session_state["stock_data"] = stock_data.model_dump()
+        self.session_state["recommendation"] = recommendation.model_dump()
+        self.session_state["token_report"] = self.token_report.to_dict()
+        self._store(stock_data, meta_prompt, recommendation)
         
-        analysis_response = self.analysis_agent.run(json.dumps(analysis_input, indent=2))
-        recommendation = analysis_response.content
+        # Final output
+        yield RunResponse(content=format_report(stock_data, recommendation))
+    
+    async def arun_workflow(self, message: str) -> AsyncIterator[RunResponse]:
+        """
+        Async variant that overlaps meta prompt generation with data extraction
+        
+        Args:
+            message: Company query (e.g., "RELIANCE" or "Reliance Industries")
+        """
+        async for event in self.astream_events(message, stream_tokens=False):
+            if event["event"] == "status":
+                yield RunResponse(content=event["message"])
+            elif event["event"] == "report":
+                yield RunResponse(content=event["markdown"])
+    
+    async def astream_events(self, message: str, stream_tokens: bool = True) -> AsyncIterator[dict]:
+        """
+        Workflow progress as events: status, token, thinking, tool, field, section, report, done
+        
+        A section event with replace: true supersedes the section of the same name
+        sent earlier; the final report event always matches the recommendation.
+        
+        With stream_tokens the meta prompt and analysis agents stream their output,
+        so the first bytes arrive after the model's first token rather than after
+        the whole analysis.
+        
+        Args:
+            message: Company query (e.g., "RELIANCE" or "Reliance Industries")
+            stream_tokens: Pass through token-level output and partial fields
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        run = asyncio.create_task(self._arun_events(message, events.put_nowait, stream_tokens))
+        try:
+            while True:
+                next_event = asyncio.ensure_future(events.get())
+                await asyncio.wait({next_event, run}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event.done():
+                    yield next_event.result()
+                    continue
+                next_event.cancel()
+                while not events.empty():
+                    yield events.get_nowait()
+                # Re-raise anything the run failed with
+                await run
+                return
+        finally:
+            run.cancel()
+    
+    async def _arun_events(self, message: str, emit: Emit, stream_tokens: bool) -> None:
+        self.token_report = TokenReport()
+        self.run_span = start_span("workflow.run", kind="workflow", query=message, stream=stream_tokens)
+        error = None
+        try:
+            await self._arun_steps(message, emit, stream_tokens)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            end_span(self.run_span, error)
+    
+    async def _arun_steps(self, company_query: str, emit: Emit, stream_tokens: bool) -> None:
+        def status(stage: str, text: str) -> None:
+            emit({"event": "status", "stage": stage, "message": text})
+        
+        # Step 1 + 2: Extract structured data and start the industry framework as soon as the industry is known
+        status("extract", "🔍 Extracting company data from CSV...")
+        
+        meta_task = None
+        # The local resolver stands in for the extraction agent, so its hit rate is the extract cache rate
+        with span("stage.resolve", kind="stage", parent=self.run_span) as stage:
+            stock_data = self.resolver.resolve(company_query)
+            stage.set(cache="hit" if stock_data is not None else "miss")
+        if stock_data is not None:
+            meta_task = asyncio.create_task(self._ameta_prompt(stock_data.industry, emit, stream_tokens))
+        else:
+            # A weaker local match still tells us the likely industry
+            hint = self.resolver.match(company_query)
+            if hint is not None and hint.score >= INDUSTRY_HINT_CONFIDENCE:
+                meta_task = asyncio.create_task(self._ameta_prompt(hint.stock_data.industry, emit, stream_tokens))
+            
+            extract_prompt = f"Find and extract all data for company: {company_query}"
+            try:
+                with span("stage.extract", kind="stage", parent=self.run_span) as stage:
+                    async with self._stage("extract"):
+                        csv_response = await self.csv_agent.arun(extract_prompt)
+                        stock_data = await aensure_structured(self.csv_agent, extract_prompt, csv_response)
+                    stage.record_response(csv_response)
+            except BaseException:
+                # Do not leave the industry research running for a run that has failed
+                _discard(meta_task)
+                raise
+            self.token_report.record("extract", extract_prompt, csv_response)
+            if stock_data is None:
+                _discard(meta_task)
+                status("extract", "❌ Company not found in CSV data")
+                return
+            
+            if meta_task is not None and industry_key(hint.stock_data.industry) != industry_key(stock_data.industry):
+                _discard(meta_task)
+                meta_task = None
+        
+        status("extract", f"✅ Extracted data for {stock_data.name}")
+        
+        stored = self._stored(stock_data)
+        if stored is not None:
+            # A fresh entry means the industry framework is cached, so the meta prompt task had nothing to do
+            _discard(meta_task)
+            recommendation = StockRecommendation(**stored["recommendation"])
+            status("analysis", f"⚡ Using precomputed recommendation (version {stored['version']})")
+            if stream_tokens:
+                ReportStream(stock_data, emit).update(stored["recommendation"])
+            emit({"event": "report", "stage": "analysis", "markdown": format_report(stock_data, recommendation)})
+            emit({"event": "done", "stock_data": self.session_state["stock_data"],
+                  "recommendation": self.session_state["recommendation"],
+                  "token_report": self.session_state["token_report"],
+                  "precomputed": self.session_state["precomputed"]})
+            return
+        
+        status("meta_prompt", "🧠 Generating specialized analysis framework...")
+        
+        if meta_task is None:
+            meta_task = asyncio.create_task(self._ameta_prompt(stock_data.industry, emit, stream_tokens))
+        meta_prompt = await meta_task
+        
+        if meta_prompt is None:
+            status("meta_prompt", "⚠️ Could not generate an industry framework, analysing without one")
+        else:
+            status("meta_prompt", "✅ Generated industry-specific analysis framework")
+        
+        # Step 3: Perform comprehensive stock analysis
+        status("analysis", "📊 Performing comprehensive stock analysis...")
+        
+        report = ReportStream(stock_data, emit)
+        with span("stage.analysis", kind="stage", parent=self.run_span) as stage:
+            peers = get_industry_stats().compare(stock_data)
+            analysis_input = build_analysis_input(stock_data, meta_prompt, peers)
+            async with self._stage("analysis"):
+                analysis_response, recommendation = await self._astructured(
+                    self.analysis_agent, analysis_input, "analysis", emit, stream_tokens,
+                    on_fields=report.update if stream_tokens else None,
+                )
+            stage.record_response(analysis_response)
+        self.token_report.record("analysis", analysis_input, analysis_response)
+        if recommendation is None:
+            status("analysis", "❌ Analysis failed: no valid recommendation after retrying")
+            return
+        self.session_state["stock_data"] = stock_data.model_dump()
+        self.session_state["recommendation"] = recommendation.model_dump()
+        self.session_state["token_report"] = self.token_report.to_dict()
+        self._store(stock_data, meta_prompt, recommendation)
         
         # Final output
-        yield RunResponse(
-            content=f"""
-# Stock Analysis Report: {stock_data.name}
+        if stream_tokens:
+            report.update(recommendation.model_dump())
+        emit({"event": "report", "stage": "analysis", "markdown": format_report(stock_data, recommendation)})
+        emit({"event": "done", "stock_data": self.session_state["stock_data"],
+              "recommendation": self.session_state["recommendation"],
+              "token_report": self.session_state["token_report"]})
 
-## 🎯 Recommendation: {recommendation.recommendation}
-**Confidence Score:** {recommendation.confidence_score}/100
-**Target Price:** ₹{recommendation.target_price if recommendation.target_price else 'N/A'}
-**Time Horizon:** {recommendation.time_horizon}
+def _discard(task: Optional[asyncio.Task]) -> None:
+    """Cancel a task whose result is no longer wanted, retrieving any error it already ended with"""
+    if task is not None:
+        task.cancel()
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
 
-## 📈 Key Strengths
-{chr(10).join([f"• {strength}" for strength in recommendation.key_strengths])}
 
-## ⚠️ Key Risks  
-{chr(10).join([f"• {risk}" for risk in recommendation.key_risks])}
+workflow_router = APIRouter(tags=["Workflow"])
 
-## 🔍 Analysis Rationale
-{recommendation.rationale}
 
-## 🎲 Alternative Scenarios
-{recommendation.alternative_scenarios}
+def _sse(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
 
----
-*Analysis completed using industry-specific framework for {stock_data.industry} sector*
-            """
-        )
+
+@workflow_router.post("/workflow/stream")
+async def stream_workflow(message: str = Form(...)):
+    """Server-sent events for one stock analysis: status, tokens, parsed fields and report sections"""
+    workflow = StockAnalysisWorkflow()
+    
+    async def events():
+        try:
+            async for event in workflow.astream_events(message):
+                yield _sse(event)
+        except Exception as e:
+            logger.error(f"Streaming workflow failed for {message}: {e}")
+            yield _sse({"event": "error", "message": str(e)})
+    
+    # Proxies must not buffer, or the first token waits for the whole report
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # Create workflow agent
 workflow_agent = Agent(
     name="Stock Analysis Expert",
     agent_id="stock-analysis-expert",
-    model=DeepSeek(id="deepseek-reasoner"),
+    model=routed_model("reasoning"),
     role="Expert stock analyst with comprehensive analysis capabilities",
     instructions=[
         "Analyze stocks using financial data, industry context, and market trends",
         "Provide detailed recommendations with clear rationale",
         "Consider both quantitative metrics and qualitative factors"
     ],
-    tools=[CsvTools(csvs=[Path("query_results.csv")]), TavilyTools()],
+    tools=[RecommendationTools(), DatasetCsvTools(), ScreenerTools(), TavilyTools()],
     show_tool_calls=True,
     markdown=True
 )
 
+instrument_agents([csv_data_agent, meta_prompt_agent, analysis_agent, workflow_agent])
+
 # Create playground
 playground = Playground(
     agents=[workflow_agent],
@@ -228,6 +630,28 @@ playground = Playground(
 # Get the app with proper configuration
 app = playground.get_app(use_async=True, prefix="/v1")
 
+# Repeated first-turn questions are replayed from the response cache
+app.add_middleware(ResponseCacheMiddleware, agents=playground.agents)
+# Each request runs against the dataset version current when it arrived, even across a swap
+app.add_middleware(DatasetVersionMiddleware)
+
+# Per-stage and per-tool latency, tokens and cache hit rates
+app.include_router(metrics_router, prefix="/v1")
+app.include_router(models_router, prefix="/v1")
+app.include_router(search_cache_router, prefix="/v1")
+app.include_router(structured_router, prefix="/v1")
+
+# Token-level SSE stream of the three-agent workflow
+app.include_router(workflow_router, prefix="/v1")
+
+# Stored recommendations, kept fresh by an optional background precompute job
+app.include_router(precompute_router, prefix="/v1")
+app.add_event_handler("startup", start_background_precompute)
+
+# New query_results snapshots are published and swapped in without a restart
+app.include_router(dataset_router, prefix="/v1")
+app.add_event_handler("startup", start_dataset_watcher)
+
 # For production deployment
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))